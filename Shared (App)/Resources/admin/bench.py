@@ -0,0 +1,584 @@
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import threading
+import argparse
+import statistics
+import tracemalloc
+import multiprocessing
+
+# 基准测试：在临时数据库上运行，不会改动 quchong_admin.db
+# 用法：python bench.py <场景> [参数]，场景见文件末尾的 SCENARIOS
+
+def load_server(tmpdir, name='bench'):
+    os.environ['QUCHONG_DB'] = os.path.join(tmpdir, name + '.db')
+    os.environ.setdefault('DUP_ARCHIVE_DIR', os.path.join(tmpdir, 'archive'))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import server
+    server.migrate()
+    return server
+
+def rand_phones(n, seed=1):
+    rnd = random.Random(seed)
+    return ['13' + ''.join(rnd.choice('0123456789') for _ in range(9)) for _ in range(n)]
+
+def seed(server, customers):
+    c = server.app.test_client()
+    admin = c.post('/api/admins', json={'username': 'bench_admin', 'display_name': 'bench', 'password': 'x'}).get_json()
+    op = c.post('/api/operators', json={'username': 'bench_op', 'display_name': 'bench', 'password': 'x', 'owner_admin_id': admin['id']}).get_json()
+    ch = c.post('/api/channels', json={'name': 'bench', 'creator_id': admin['id'], 'owner_admin_id': admin['id']}).get_json()
+    cn = server.conn()
+    rows = []
+    for p in rand_phones(customers, seed=7):
+        rows.append((server.rid(), p, p, server.sha256_hex(p), server.national_hash(p), p.encode().hex(), server.sig6(p), ch['id'], op['id'], admin['id']))
+    cn.executemany("INSERT OR IGNORE INTO customers (id,phone_raw,phone_normalized,phone_hash,national_hash,phone_encrypted,sig6,channel_id,owner_operator_id,owner_admin_id,created_at) VALUES (?,?,?,?,?,?,?,?,?,?,CURRENT_TIMESTAMP)", rows)
+    cn.commit(); cn.close()
+    return admin, op, ch
+
+def pct(xs, p):
+    if not xs:
+        return 0.0
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * p))]
+
+def summary(label, xs):
+    if not xs:
+        print(f'{label}: no samples')
+        return
+    print(f'{label}: n={len(xs)} p50={statistics.median(xs)*1000:.1f}ms p95={pct(xs, 0.95)*1000:.1f}ms max={max(xs)*1000:.1f}ms')
+
+def bench_replica(args):
+    # listings during imports: a rollback journal makes readers wait for the
+    # import's commit, WAL (the wal_mode migration) lets them read their own snapshot
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ('delete', 'wal'):
+            server = load_server(tmp, 'journal_' + mode)
+            cn = server.conn()
+            cn.execute(f"PRAGMA journal_mode={mode.upper()}")
+            cn.close()
+            admin, op, ch = seed(server, args.customers)
+            server.admission.configure({'operator_rate': 1e9, 'operator_burst': 1e9, 'admin_rate': 1e9, 'admin_burst': 1e9})
+            stop = threading.Event()
+            reads, writes = [], []
+            batch_no = [0]
+
+            def writer():
+                c = server.app.test_client()
+                while not stop.is_set():
+                    batch_no[0] += 1
+                    phones = rand_phones(args.batch, seed=1000 + batch_no[0])
+                    t0 = time.time()
+                    c.post('/api/customers/batch', json={'phones': phones, 'channel_id': ch['id'], 'operator_id': op['id']})
+                    writes.append(time.time() - t0)
+
+            def reader():
+                c = server.app.test_client()
+                while not stop.is_set():
+                    t0 = time.time()
+                    r = c.get('/api/customers')
+                    reads.append(time.time() - t0)
+                    r.close()
+
+            threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(args.readers)]
+            for t in threads:
+                t.start()
+            time.sleep(args.seconds)
+            stop.set()
+            for t in threads:
+                t.join()
+            print(f'--- journal_mode={mode} ---')
+            summary('listing GET /api/customers', reads)
+            summary(f'batch import ({args.batch} phones)', writes)
+
+def measure(fn):
+    t0 = time.perf_counter()
+    size = fn()
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, size
+
+def bench_json(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        server = load_server(tmp)
+        seed(server, args.customers)
+
+        def old_way():
+            # 改造前的实现：Row 列表 -> dict 列表 -> jsonify 整体字符串
+            with server.app.test_request_context('/api/customers'):
+                cn = server.conn(); cur = cn.cursor()
+                cur.execute('SELECT * FROM customers')
+                rows = [dict(r) for r in cur.fetchall()]
+                cur.close(); cn.close()
+                return len(server.jsonify(rows).get_data())
+
+        def streamed(shape=''):
+            def run():
+                with server.app.test_request_context('/api/customers' + shape):
+                    resp = server.get_customers()
+                    return sum(len(chunk) for chunk in resp.response)
+            return run
+
+        print(f'customers={args.customers} encoder={"orjson" if server.orjson else "json"}')
+        for label, fn in (('fetchall + dict + jsonify', old_way), ('streamed objects', streamed()), ('streamed ?shape=tuples', streamed('?shape=tuples'))):
+            elapsed, peak, size = measure(fn)
+            print(f'{label:28s} time={elapsed*1000:8.1f}ms peak={peak/1048576:7.1f}MB body={size/1048576:6.1f}MB')
+
+def bench_match(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            server = load_server(tmp, f'match_{size}')
+            admin, op, ch = seed(server, size)
+            policy = server.match_policy(args.policy)
+            existing = rand_phones(size, seed=7)[:args.lookups]
+            probes = ['86' + p for p in existing] + rand_phones(args.lookups, seed=99)
+            cn = server.conn(); cur = cn.cursor()
+            lat = []
+            for p in probes:
+                t0 = time.perf_counter()
+                server.match_phone(cur, server.normalize_phone(p), policy, args.limit)
+                lat.append(time.perf_counter() - t0)
+            print(f'--- {size} customers, policy={",".join(policy)} ---')
+            summary('match_phone', lat)
+            if args.legacy:
+                # 改造前的兜底查询：逐行 REPLACE 后比较，无法使用索引
+                lat = []
+                for p in probes[:args.legacy]:
+                    t0 = time.perf_counter()
+                    cur.execute("SELECT * FROM customers WHERE owner_admin_id=? AND REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(phone_normalized,' ',''),'+',''),'(',''),')',''),'-',''),'－',''),'—','')=? ORDER BY created_at ASC LIMIT 1", (admin['id'], server.normalize_phone(p)))
+                    cur.fetchall()
+                    lat.append(time.perf_counter() - t0)
+                summary('legacy REPLACE scan', lat)
+            cur.close(); cn.close()
+
+def bench_users(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        server = load_server(tmp)
+        admin, op, ch = seed(server, args.customers)
+        c = server.app.test_client()
+        t0 = time.perf_counter()
+        for i in range(args.users):
+            # 改造前的界面流程：逐个创建，每次创建后重新拉取全部用户
+            c.post('/api/operators', json={'username': f'one{i}', 'display_name': f'one{i}', 'password': 'x', 'owner_admin_id': admin['id']})
+            c.get('/api/users').get_data()
+        single = time.perf_counter() - t0
+        text = '\n'.join(f'bulk{i},bulk{i},x' for i in range(args.users))
+        t0 = time.perf_counter()
+        res = c.post('/api/users/bulk', json={'csv': text, 'owner_admin_id': admin['id']}).get_json()
+        c.get('/api/users').get_data()
+        bulk = time.perf_counter() - t0
+        print(f'{args.users} operators: one by one {single*1000:.0f}ms, bulk {bulk*1000:.0f}ms (created={res["created"]} failed={res["failed"]})')
+
+def bench_check(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        server = load_server(tmp)
+        admin, op, ch = seed(server, args.customers)
+        c = server.app.test_client()
+        owned = rand_phones(args.customers, seed=7)
+        phones = owned[:args.phones // 2] + rand_phones(args.phones - args.phones // 2, seed=123)
+        lat = []
+        for _ in range(args.runs):
+            t0 = time.perf_counter()
+            r = c.post('/api/customers/check?shape=tuples', json={'phones': phones, 'user_id': op['id'], 'policy': args.policy})
+            body = r.get_json()
+            lat.append(time.perf_counter() - t0)
+        print(f'{args.phones} phones against {args.customers} customers, policy={args.policy}: {body["summary"]}')
+        summary('POST /api/customers/check', lat)
+        p50 = statistics.median(lat)
+        print(f'target {args.target:.1f}s: {"ok" if p50 <= args.target else "MISSED"}')
+
+def seed_history(server, customers, days):
+    # pre-migration shape: text created_at only, created_ts left NULL for the backfill
+    c = server.app.test_client()
+    owners = []
+    for a in range(4):
+        admin = c.post('/api/admins', json={'username': f'range_admin{a}', 'display_name': 'range', 'password': 'x'}).get_json()
+        for o in range(2):
+            op = c.post('/api/operators', json={'username': f'range_op{a}_{o}', 'display_name': 'range', 'password': 'x', 'owner_admin_id': admin['id']}).get_json()
+            ch = c.post('/api/channels', json={'name': f'range{a}_{o}', 'creator_id': admin['id'], 'owner_admin_id': admin['id']}).get_json()
+            owners.append((admin['id'], op['id'], ch['id']))
+    rnd = random.Random(5)
+    start = time.time() - days * 86400
+    cn = server.conn()
+    for lo in range(0, customers, 100000):
+        rows = []
+        for i in range(lo, min(customers, lo + 100000)):
+            admin_id, op_id, ch_id = owners[rnd.randrange(len(owners))]
+            at = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(start + rnd.random() * days * 86400))
+            rows.append((server.rid(), f'h{i}', ch_id, op_id, admin_id, at))
+        cn.executemany("INSERT INTO customers (id,phone_hash,channel_id,owner_operator_id,owner_admin_id,created_at) VALUES (?,?,?,?,?,?)", rows)
+        cn.commit()
+    cn.close()
+    return owners
+
+def bench_range(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        server = load_server(tmp)
+        server.backfill.enabled = False
+        t0 = time.perf_counter()
+        owners = seed_history(server, args.customers, args.days)
+        print(f'seeded {args.customers} customers over {args.days} days in {time.perf_counter() - t0:.1f}s')
+        t0 = time.perf_counter()
+        server.backfill.run(pause=0)
+        print(f'backfill: {time.perf_counter() - t0:.1f}s, {server.backfill.status()}')
+        c = server.app.test_client()
+        cn = server.conn(); cur = cn.cursor()
+        day = time.strftime('%Y-%m-%d', time.gmtime(time.time() - args.days * 43200))
+        nxt = time.strftime('%Y-%m-%d', time.gmtime(time.time() - args.days * 43200 + 86400))
+        legacy = {
+            # 改造前只能对文本列做 date() 分组，按管理员过滤也无可用索引
+            'day buckets': ("SELECT date(created_at) AS d, COUNT(*) FROM customers WHERE owner_admin_id=? GROUP BY d", lambda a, ch: (a,)),
+            'day buckets, one channel': ("SELECT date(created_at) AS d, COUNT(*) FROM customers WHERE owner_admin_id=? AND channel_id=? GROUP BY d", lambda a, ch: (a, ch)),
+            'one-day range': ("SELECT * FROM customers WHERE owner_admin_id=? AND created_at>=? AND created_at<? ORDER BY created_at", lambda a, ch: (a, day, nxt)),
+        }
+        current = {
+            'day buckets': lambda a, ch: f'/api/customers/buckets?user_id={a}&bucket=day',
+            'day buckets, one channel': lambda a, ch: f'/api/customers/buckets?user_id={a}&bucket=day&channel_id={ch}',
+            'one-day range': lambda a, ch: f'/api/customers/range?user_id={a}&from={day}&to={nxt}',
+        }
+        for label in legacy:
+            sql, params = legacy[label]
+            old, new = [], []
+            for admin_id, op_id, ch_id in owners[:args.runs]:
+                t0 = time.perf_counter()
+                cur.execute(sql, params(admin_id, ch_id)); cur.fetchall()
+                old.append(time.perf_counter() - t0)
+                t0 = time.perf_counter()
+                c.get(current[label](admin_id, ch_id)).get_data()
+                new.append(time.perf_counter() - t0)
+            summary(f'{label:26s} text scan', old)
+            summary(f'{label:26s} epoch index', new)
+        lat = []
+        for admin_id, op_id, ch_id in owners[:args.runs]:
+            t0 = time.perf_counter()
+            c.get(f'/api/customers/buckets?user_id={admin_id}&bucket=hour&tz=480').get_data()
+            lat.append(time.perf_counter() - t0)
+        summary(f'{"hour buckets, tz=+08:00":26s} epoch index', lat)
+        cur.close(); cn.close()
+
+def bench_slowlog(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        server = load_server(tmp)
+        admin, op, ch = seed(server, args.customers)
+        c = server.app.test_client()
+        server.admission.configure({'operator_rate': 1e9, 'operator_burst': 1e9, 'admin_rate': 1e9, 'admin_burst': 1e9})
+        for label, threshold in (('off', 0), (f'on, {args.threshold}ms threshold', args.threshold)):
+            server.slow_log.threshold_ms = threshold
+            lat = []
+            for i in range(args.runs):
+                phones = rand_phones(args.batch, seed=500 + i + (args.runs if threshold else 0))
+                t0 = time.perf_counter()
+                assert c.post('/api/customers/batch', json={'phones': phones, 'channel_id': ch['id'], 'operator_id': op['id']}).status_code == 200
+                lat.append(time.perf_counter() - t0)
+            summary(f'batch import ({args.batch} phones), slow-query log {label}', lat)
+        print('recorded', server.slow_log.recorded)
+
+def bench_maintenance(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ('maintenance', 'VACUUM'):
+            server = load_server(tmp, f'maint_{mode}')
+            server.backfill.enabled = False
+            owners = seed_history(server, args.customers, 30)
+            c = server.app.test_client()
+            server.admission.configure({'operator_rate': 1e9, 'operator_burst': 1e9, 'admin_rate': 1e9, 'admin_burst': 1e9})
+            admin_id, op_id, ch_id = owners[-1]
+            stop = threading.Event()
+            writes = []
+
+            def writer():
+                wc = server.app.test_client()
+                n = 0
+                while not stop.is_set():
+                    n += 1
+                    t0 = time.perf_counter()
+                    wc.post('/api/customers/batch', json={'phones': rand_phones(args.batch, seed=2000 + n), 'channel_id': ch_id, 'operator_id': op_id})
+                    writes.append(time.perf_counter() - t0)
+                    time.sleep(0.05)
+
+            t = threading.Thread(target=writer)
+            t.start()
+            time.sleep(args.idle)
+            idle = writes[:]
+            del writes[:]
+            # a cascade delete of one admin's data, then maintenance right away as the mutation trigger would
+            c.delete(f'/api/admins/{owners[0][0]}')
+            t0 = time.perf_counter()
+            if mode == 'maintenance':
+                report = server.maintenance.run()
+                freed = report['vacuum']['reclaimed_bytes']
+            else:
+                path = server.db_params()['path']
+                cn = server.sqlite3.connect(path, timeout=600, isolation_level=None)
+                size = os.path.getsize(path)
+                cn.execute('VACUUM'); cn.close()
+                freed = size - os.path.getsize(path)
+            elapsed = time.perf_counter() - t0
+            stop.set(); t.join()
+            print(f'--- {mode}: {elapsed:.1f}s, returned {freed / 1048576:.1f}MB to the filesystem ---')
+            summary(f'batch import ({args.batch} phones) idle', idle)
+            summary(f'batch import ({args.batch} phones) during {mode}', writes)
+
+def bench_bootstrap(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        server = load_server(tmp)
+        server.backfill.enabled = False
+        owners = seed_history(server, args.customers, args.days)
+        rnd = random.Random(9)
+        cn = server.conn()
+        rows = []
+        for customer_id, owner_id in cn.execute("SELECT id, owner_operator_id FROM customers ORDER BY random() LIMIT ?", (args.duplicates,)).fetchall():
+            admin_id, op_id, ch_id = owners[rnd.randrange(len(owners))]
+            rows.append((server.rid(), customer_id, owner_id, op_id, ch_id))
+        cn.executemany("INSERT INTO duplicates (id,customer_id,first_owner_id,duplicate_operator_id,duplicate_channel_id) VALUES (?,?,?,?,?)", rows)
+        cn.commit(); cn.close()
+        server.backfill.run(pause=0)
+        c = server.app.test_client()
+        supers = [u for u in c.get('/api/users').get_json() if u['role'] == 'super_admin']
+        roles = [('super', supers[0]['id'])] if supers else []
+        roles += [('admin', owners[0][0]), ('operator', owners[0][1])]
+        print(f'customers={args.customers} duplicates={args.duplicates}')
+        for role, user_id in roles:
+            old, new, full = [], [], []
+            for _ in range(args.runs):
+                # 改造前登录后的四次全量拉取
+                t0 = time.perf_counter()
+                size = sum(len(c.get(path).get_data()) for path in ('/api/users', '/api/channels', '/api/customers', '/api/duplicates'))
+                old.append(time.perf_counter() - t0)
+                t0 = time.perf_counter()
+                first = len(c.get(f'/api/bootstrap?user_id={user_id}').get_data())
+                new.append(time.perf_counter() - t0)
+                t0 = time.perf_counter()
+                scoped = len(c.get(f'/api/bootstrap?user_id={user_id}&limit=0').get_data())
+                full.append(time.perf_counter() - t0)
+            print(f'--- {role}: four fetches {size/1048576:.2f}MB, bootstrap {first/1024:.1f}KB, bootstrap limit=0 {scoped/1048576:.2f}MB ---')
+            summary(f'{role:8s} users+channels+customers+duplicates', old)
+            summary(f'{role:8s} bootstrap (limit {server.BOOTSTRAP_LIMIT})', new)
+            summary(f'{role:8s} bootstrap limit=0', full)
+
+def import_worker(db, index, batches, channel_id, operator_id, union, start, done, out):
+    # one pre-fork style worker: its own interpreter and server module, the
+    # same database and phone index files as its siblings
+    os.environ['PHONE_INDEX'] = '1' if index else '0'
+    server = load_server(os.path.dirname(db), os.path.splitext(os.path.basename(db))[0])
+    server.admission.configure({'operator_rate': 1e9, 'operator_burst': 1e9, 'admin_rate': 1e9, 'admin_burst': 1e9, 'batch_concurrency': 64})
+    c = server.app.test_client()
+    stats = {'success': 0, 'duplicate': 0, 'failed': 0}
+    lat = []
+    start.wait()
+    try:
+        for phones in batches:
+            t0 = time.perf_counter()
+            r = c.post('/api/customers/batch', json={'phones': phones, 'channel_id': channel_id, 'operator_id': operator_id})
+            lat.append(time.perf_counter() - t0)
+            if r.status_code != 200:
+                raise RuntimeError(f'batch import: {r.status_code} {r.get_data(as_text=True)[:200]}')
+            for k in stats:
+                stats[k] += r.get_json()['stats'][k]
+    except Exception as e:
+        # release the siblings waiting on the barrier and report instead of hanging
+        done.abort()
+        out.put({'pid': os.getpid(), 'error': str(e)})
+        return
+    try:
+        done.wait()
+    except threading.BrokenBarrierError:
+        out.put({'pid': os.getpid(), 'error': 'a sibling worker failed'})
+        return
+    # after every sibling has committed, no worker may call any of their numbers new
+    t0 = time.perf_counter()
+    summary_ = c.post('/api/customers/check', json={'phones': union, 'user_id': operator_id}).get_json()['summary']
+    check = time.perf_counter() - t0
+    out.put({'pid': os.getpid(), 'stats': stats, 'lat': lat, 'check': check, 'check_summary': summary_, 'index': server.phone_index.status()})
+
+def bench_workers(args):
+    ctx = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp:
+        for index in (False, True):
+            name = 'workers_index' if index else 'workers_sql'
+            server = load_server(tmp, name)
+            admin, op, ch = seed(server, args.customers)
+            if index:
+                server.phone_index.rebuild()
+            cn = server.conn()
+            before = cn.execute("SELECT COUNT(*) FROM customers").fetchone()[0]
+            cn.close()
+            # overlapping samples: most numbers are sent by several workers, a
+            # few are already customers
+            seeded = rand_phones(args.customers, seed=7)
+            pool = rand_phones(args.phones, seed=11) + seeded[:args.phones // 20]
+            rnd = random.Random(3)
+            plans = []
+            for w in range(args.workers):
+                mine = rnd.sample(pool, args.per_worker)
+                plans.append([mine[i:i + args.batch] for i in range(0, len(mine), args.batch)])
+            union = sorted({p for plan in plans for b in plan for p in b})
+            start, done, out = ctx.Barrier(args.workers + 1), ctx.Barrier(args.workers), ctx.Queue()
+            procs = [ctx.Process(target=import_worker, args=(os.path.join(tmp, name + '.db'), index, plan, ch['id'], op['id'], union, start, done, out))
+                     for plan in plans]
+            for p in procs:
+                p.start()
+            start.wait()
+            t0 = time.perf_counter()
+            results = [out.get() for _ in procs]
+            for p in procs:
+                p.join()
+            elapsed = time.perf_counter() - t0
+            errors = [r for r in results if 'error' in r]
+            if errors:
+                raise SystemExit(f'workers failed: {errors}')
+            cn = server.conn()
+            stored = cn.execute("SELECT COUNT(*) FROM customers").fetchone()[0] - before
+            cn.close()
+            sent = sum(len(b) for plan in plans for b in plan)
+            success = sum(r['stats']['success'] for r in results)
+            duplicate = sum(r['stats']['duplicate'] for r in results)
+            expected = len(set(union) - set(seeded))
+            print(f'--- {args.workers} workers, phone index {"on" if index else "off"}: {sent} numbers ({len(union)} distinct) in {elapsed:.1f}s, {sent / elapsed:.0f} numbers/s ---')
+            print(f'new customers: {success} reported, {stored} stored, {expected} expected; duplicates {duplicate}; failed {sum(r["stats"]["failed"] for r in results)}')
+            summary('batch import', [x for r in results for x in r['lat']])
+            summary(f'check of all {len(union)} numbers, per worker', [r['check'] for r in results])
+            for r in results:
+                print(f'  pid {r["pid"]}: {r["stats"]} check={r["check_summary"]} index skipped={r["index"]["skipped"]} pending={r["index"]["pending"]}')
+            assert success == stored == expected, 'every distinct new number must be stored exactly once'
+            assert success + duplicate == sent
+            assert all(r['check_summary']['new'] == 0 for r in results), 'a worker reported a committed number as new'
+            sys.modules.pop('server')
+
+def bench_upload(args):
+    # a flaky link: a response is lost with probability --drop per 64KB of
+    # request body, after the server has committed, so the client can only retry
+    with tempfile.TemporaryDirectory() as tmp:
+        for chunked in (False, True):
+            server = load_server(tmp, 'upload_chunks' if chunked else 'upload_batch')
+            admin, op, ch = seed(server, args.customers)
+            server.admission.configure({'operator_rate': 1e9, 'operator_burst': 1e9, 'admin_rate': 1e9, 'admin_burst': 1e9, 'batch_concurrency': 64})
+            seeded = rand_phones(args.customers, seed=7)
+            phones = rand_phones(args.phones, seed=11) + seeded[:args.phones // 10]
+            expected = len(phones) - len(set(phones) - set(seeded))
+            rnd = random.Random(5)
+            lock = threading.Lock()
+            sent = {'bytes': 0, 'requests': 0, 'lost': 0}
+
+            def call(c, method, path, body):
+                while True:
+                    data = json.dumps(body).encode()
+                    r = c.open(path, method=method, data=data, content_type='application/json')
+                    with lock:
+                        sent['requests'] += 1
+                        sent['bytes'] += len(data)
+                        lost = rnd.random() < 1 - (1 - args.drop) ** (len(data) / 65536)
+                        sent['lost'] += lost
+                    if r.status_code != 200:
+                        raise RuntimeError(f'{method} {path}: {r.status_code} {r.get_data(as_text=True)[:200]}')
+                    if not lost:
+                        return r.get_json()
+
+            t0 = time.perf_counter()
+            if chunked:
+                c = server.app.test_client()
+                chunks = [phones[i:i + args.chunk] for i in range(0, len(phones), args.chunk)]
+                sid = call(c, 'POST', '/api/imports', {'channel_id': ch['id'], 'operator_id': op['id'], 'total_chunks': len(chunks)})['id']
+                todo = list(range(len(chunks)))
+
+                def sender():
+                    tc = server.app.test_client()
+                    while True:
+                        with lock:
+                            if not todo:
+                                return
+                            seq = todo.pop(0)
+                        call(tc, 'PUT', f'/api/imports/{sid}/chunks/{seq}', {'operator_id': op['id'], 'phones': chunks[seq], 'checksum': server.chunk_checksum(chunks[seq])})
+
+                threads = [threading.Thread(target=sender) for _ in range(args.parallel)]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+                stats = call(c, 'POST', f'/api/imports/{sid}/finalize', {'operator_id': op['id']})['stats']
+            else:
+                c = server.app.test_client()
+                stats = call(c, 'POST', '/api/customers/batch', {'phones': phones, 'channel_id': ch['id'], 'operator_id': op['id']})['stats']
+            elapsed = time.perf_counter() - t0
+            cn = server.conn()
+            dups = cn.execute("SELECT COUNT(*) FROM duplicates").fetchone()[0]
+            cn.close()
+            print(f'--- {"chunked session" if chunked else "single batch POST"} ({len(phones)} numbers, drop {args.drop:.0%} per 64KB) ---')
+            print(f'{elapsed:.2f}s, {sent["requests"]} requests ({sent["lost"]} responses lost), {sent["bytes"]/1048576:.2f}MB sent')
+            print(f'reported success={stats["success"]} duplicate={stats["duplicate"]}, duplicate rows stored={dups} (expected {expected})')
+
+SCENARIOS = {
+    'replica': bench_replica,
+    'json': bench_json,
+    'match': bench_match,
+    'users': bench_users,
+    'check': bench_check,
+    'range': bench_range,
+    'slowlog': bench_slowlog,
+    'maintenance': bench_maintenance,
+    'bootstrap': bench_bootstrap,
+    'workers': bench_workers,
+    'upload': bench_upload,
+}
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest='scenario', required=True)
+    p = sub.add_parser('replica', help='并发批量导入 + 列表查询，对比回滚日志与 WAL 模式')
+    p.add_argument('--customers', type=int, default=20000)
+    p.add_argument('--batch', type=int, default=2000)
+    p.add_argument('--readers', type=int, default=2)
+    p.add_argument('--seconds', type=float, default=10)
+    p = sub.add_parser('json', help='大列表响应：整体序列化 vs 游标流式序列化的耗时与峰值内存')
+    p.add_argument('--customers', type=int, default=100000)
+    p = sub.add_parser('match', help='号码匹配引擎：不同客户规模下的单次查询耗时（应基本持平）')
+    p.add_argument('--sizes', type=lambda v: [int(x) for x in v.split(',')], default=[10000, 100000, 1000000])
+    p.add_argument('--lookups', type=int, default=2000)
+    p.add_argument('--policy', default='exact,national,suffix')
+    p.add_argument('--limit', type=int, default=20)
+    p.add_argument('--legacy', type=int, default=50, help='同时测量旧 REPLACE 全表扫描的次数，0 为跳过')
+    p = sub.add_parser('users', help='批量创建运营：逐个创建并刷新用户列表 vs 一次批量创建')
+    p.add_argument('--users', type=int, default=300)
+    p.add_argument('--customers', type=int, default=0)
+    p = sub.add_parser('check', help='只读批量查重：10 万号码的端到端耗时与目标')
+    p.add_argument('--customers', type=int, default=1000000)
+    p.add_argument('--phones', type=int, default=100000)
+    p.add_argument('--runs', type=int, default=5)
+    p.add_argument('--policy', default='exact,national')
+    p.add_argument('--target', type=float, default=2.0, help='10 万号码 p50 目标（秒）')
+    p = sub.add_parser('range', help='时间范围查询：文本时间列扫描 vs 整数毫秒列索引，以及在线回填耗时')
+    p.add_argument('--customers', type=int, default=2000000)
+    p.add_argument('--days', type=int, default=180)
+    p.add_argument('--runs', type=int, default=8)
+    p = sub.add_parser('slowlog', help='慢查询日志开启后（未命中阈值）对批量导入的额外开销')
+    p.add_argument('--customers', type=int, default=100000)
+    p.add_argument('--batch', type=int, default=2000)
+    p.add_argument('--runs', type=int, default=10)
+    p.add_argument('--threshold', type=float, default=50)
+    p = sub.add_parser('maintenance', help='级联删除后：分片维护 vs 整库 VACUUM 的回收量与期间写入延迟')
+    p.add_argument('--customers', type=int, default=120000)
+    p.add_argument('--batch', type=int, default=500)
+    p.add_argument('--idle', type=float, default=2)
+    p = sub.add_parser('bootstrap', help='登录后首屏：四次全量列表拉取 vs 一次按角色裁剪的 /api/bootstrap')
+    p.add_argument('--customers', type=int, default=200000)
+    p.add_argument('--duplicates', type=int, default=20000)
+    p.add_argument('--days', type=int, default=90)
+    p.add_argument('--runs', type=int, default=5)
+    p = sub.add_parser('workers', help='多个独立进程同时批量导入重叠号码：校验跨进程去重一致，对比共享号码索引开/关')
+    p.add_argument('--workers', type=int, default=4)
+    p.add_argument('--customers', type=int, default=200000)
+    p.add_argument('--phones', type=int, default=20000)
+    p.add_argument('--per-worker', type=int, default=10000)
+    p.add_argument('--batch', type=int, default=500)
+    p = sub.add_parser('upload', help='丢响应的网络下导入：整批重发 vs 分片会话续传（重放分片不产生额外重复记录）')
+    p.add_argument('--customers', type=int, default=50000)
+    p.add_argument('--phones', type=int, default=20000)
+    p.add_argument('--chunk', type=int, default=500)
+    p.add_argument('--parallel', type=int, default=3)
+    p.add_argument('--drop', type=float, default=0.2)
+    args = ap.parse_args()
+    SCENARIOS[args.scenario](args)
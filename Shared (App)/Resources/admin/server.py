@@ -1,21 +1,222 @@
 import os
+import sys
 import json
 import uuid
 import hashlib
-from datetime import datetime
-from flask import Flask, request, jsonify, send_from_directory, send_file, abort, Response
+import math
+import functools
+import cProfile
+import hmac
+from datetime import datetime, timedelta, timezone
+from flask import Flask, request, jsonify, send_from_directory, send_file, abort, Response, g, has_request_context
 import traceback
 import sqlite3
 import time
+import threading
+from collections import deque
+try:
+    import orjson
+except ImportError:
+    orjson = None
+import gzip
+import re
+import csv
+import io
+import zlib
+import mmap
+import struct
+import bisect
+from array import array
 USE_SQLITE = True
+DUP_RETENTION_DAYS = int(os.getenv('DUP_RETENTION_DAYS', '90'))
+DUP_COMPACT = os.getenv('DUP_COMPACT', '1') in ('1', 'true')
+DUP_ARCHIVE_DIR = os.getenv('DUP_ARCHIVE_DIR') or os.path.join(os.path.dirname(__file__), 'archive')
+COMPACT_BATCH = 5000
+EXPORT_BATCH = 2000
+JSON_BATCH = 1000
+BULK_USERS_MAX = 5000
+CHECK_MAX = 500000
+BOOTSTRAP_LIMIT = 50
+EVENT_BACKLOG = int(os.getenv('EVENT_BACKLOG', '10000'))
+EVENT_HEARTBEAT = float(os.getenv('EVENT_HEARTBEAT', '15'))
+EVENT_POLL = float(os.getenv('EVENT_POLL', '0.5'))
+DIRECTORY_TTL = float(os.getenv('DIRECTORY_TTL', '30'))
+MATCH_POLICY = os.getenv('MATCH_POLICY', 'exact,national')
+MATCH_LIMIT = 100
+COUNTRY_CODES = [c for c in os.getenv('COUNTRY_CODES', '86').split(',') if c]
+NATIONAL_MAX_DIGITS = 11
+TS_BACKFILL = os.getenv('TS_BACKFILL', '1') in ('1', 'true')
+BACKFILL_BATCH = int(os.getenv('BACKFILL_BATCH', '2000'))
+REPORT_TZ_OFFSET = int(os.getenv('REPORT_TZ_OFFSET', '0'))
+RANGE_LIMIT = 100000
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '0'))
+SLOW_QUERY_LOG = int(os.getenv('SLOW_QUERY_LOG', '200'))
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN')
+PROFILE_DIR = os.getenv('PROFILE_DIR') or os.path.join(os.path.dirname(__file__), 'profiles')
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.005'))
+MAINT_INTERVAL = float(os.getenv('MAINT_INTERVAL', '21600'))
+MAINT_MUTATIONS = int(os.getenv('MAINT_MUTATIONS', '100000'))
+MAINT_VACUUM_PAGES = int(os.getenv('MAINT_VACUUM_PAGES', '512'))
+MAINT_PAUSE = float(os.getenv('MAINT_PAUSE', '0.05'))
+MAINT_INTEGRITY = os.getenv('MAINT_INTEGRITY', 'quick')
+MAINT_ANALYSIS_LIMIT = int(os.getenv('MAINT_ANALYSIS_LIMIT', '1000'))
+PHONE_INDEX = os.getenv('PHONE_INDEX', '1') in ('1', 'true')
+PHONE_INDEX_REBUILD = int(os.getenv('PHONE_INDEX_REBUILD', '50000'))
+PHONE_INDEX_INTERVAL = float(os.getenv('PHONE_INDEX_INTERVAL', '5'))
+IMPORT_CHUNK_MAX = int(os.getenv('IMPORT_CHUNK_MAX', '5000'))
+IMPORT_SESSION_TTL = int(os.getenv('IMPORT_SESSION_TTL', '604800'))
+BUCKETS = {'hour': 3600000, 'day': 86400000}
+ADMISSION_LIMITS = {
+    'operator_rate': float(os.getenv('ADMISSION_OPERATOR_RATE', '200')),
+    'operator_burst': float(os.getenv('ADMISSION_OPERATOR_BURST', '5000')),
+    'admin_rate': float(os.getenv('ADMISSION_ADMIN_RATE', '1000')),
+    'admin_burst': float(os.getenv('ADMISSION_ADMIN_BURST', '20000')),
+    'batch_concurrency': int(os.getenv('ADMISSION_BATCH_CONCURRENCY', '2')),
+    'batch_queue': int(os.getenv('ADMISSION_BATCH_QUEUE', '16')),
+    'queue_timeout': float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '10')),
+}
 
 def db_params():
     return {
-        'path': os.path.join(os.path.dirname(__file__), 'quchong_admin.db')
+        'path': os.getenv('QUCHONG_DB') or os.path.join(os.path.dirname(__file__), 'quchong_admin.db')
     }
 
+def params_shape(params, many=False):
+    # types only: the log must not keep phone numbers or password hashes
+    if many:
+        rows = params if isinstance(params, (list, tuple)) else None
+        return {'rows': len(rows) if rows is not None else None, 'each': params_shape(rows[0]) if rows else None}
+    if isinstance(params, dict):
+        return {k: type(v).__name__ for k, v in params.items()}
+    shape = [type(v).__name__ for v in params[:20]]
+    if len(params) > 20:
+        shape.append(f'+{len(params) - 20}')
+    return shape
+
+class SlowQueryLog:
+    # a statement's time is its execute plus the fetches that drain it;
+    # anything at or above threshold_ms is kept, newest last, with its plan
+    def __init__(self, threshold_ms=SLOW_QUERY_MS, size=SLOW_QUERY_LOG):
+        self.threshold_ms = threshold_ms
+        self.entries = deque(maxlen=size)
+        self.recorded = 0
+
+    @property
+    def enabled(self):
+        return self.threshold_ms > 0
+
+    def record(self, cn, sql, params, many, elapsed, rows, path):
+        entry = {'at': time.time(), 'ms': round(elapsed * 1000, 2), 'sql': ' '.join(sql.split())[:2000],
+                 'params': params_shape(params, many), 'rows': rows, 'path': path, 'plan': None}
+        verb = sql.lstrip()[:7].upper()
+        if verb.startswith(('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')):
+            try:
+                first = (params[0] if params else ()) if many else params
+                cur = sqlite3.Connection.cursor(cn)
+                entry['plan'] = [r[3] for r in cur.execute('EXPLAIN QUERY PLAN ' + sql, first).fetchall()]
+                cur.close()
+            except Exception as e:
+                entry['plan'] = [f'unavailable: {e}']
+        self.entries.append(entry)
+        self.recorded += 1
+
+    def status(self):
+        return {'threshold_ms': self.threshold_ms, 'size': self.entries.maxlen, 'recorded': self.recorded, 'entries': list(reversed(self.entries))}
+
+slow_log = SlowQueryLog()
+
+class TracedCursor(sqlite3.Cursor):
+    _pending = None
+
+    def _finish(self):
+        p = self._pending
+        if p is None:
+            return
+        self._pending = None
+        sql, params, many, elapsed, rows, path = p
+        if elapsed * 1000 >= slow_log.threshold_ms:
+            slow_log.record(self.connection, sql, params, many, elapsed, rows or max(self.rowcount, 0), path)
+
+    def _run(self, fn, sql, params, many):
+        self._finish()
+        t0 = time.perf_counter()
+        try:
+            return fn(sql, params)
+        finally:
+            # streamed responses drain the cursor after the request context is gone
+            path = request.path if has_request_context() else None
+            self._pending = [sql, params, many, time.perf_counter() - t0, 0, path]
+            if self.description is None:
+                self._finish()
+
+    def execute(self, sql, params=()):
+        return self._run(super().execute, sql, params, False)
+
+    def executemany(self, sql, params):
+        return self._run(super().executemany, sql, params, True)
+
+    def _fetched(self, t0, rows, done):
+        p = self._pending
+        if p is not None:
+            p[3] += time.perf_counter() - t0
+            p[4] += rows
+            if done:
+                self._finish()
+
+    def fetchone(self):
+        t0 = time.perf_counter()
+        r = super().fetchone()
+        self._fetched(t0, r is not None, r is None)
+        return r
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        t0 = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(t0, len(rows), len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(t0, len(rows), True)
+        return rows
+
+    def __next__(self):
+        t0 = time.perf_counter()
+        try:
+            r = super().__next__()
+        except StopIteration:
+            self._fetched(t0, 0, True)
+            raise
+        self._fetched(t0, 1, False)
+        return r
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+class TracedConnection(sqlite3.Connection):
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, params):
+        return self.cursor().executemany(sql, params)
+
+def connection_factory():
+    return TracedConnection if slow_log.enabled else sqlite3.Connection
+
 def conn():
-    cn = sqlite3.connect(db_params()['path'])
+    cn = sqlite3.connect(db_params()['path'], factory=connection_factory())
     cn.row_factory = sqlite3.Row
     return cn
 
@@ -169,27 +370,131 @@ def ensure_migration_normalize_phones():
     finally:
         cur.close(); cn.close()
 
+def ensure_duplicate_rollups():
+    cn = conn(); cur = cn.cursor()
+    try:
+        cur.execute(fmt("""
+            CREATE TABLE IF NOT EXISTS duplicate_rollups (
+              customer_id VARCHAR(64) NOT NULL,
+              duplicate_operator_id VARCHAR(64) NOT NULL,
+              duplicate_channel_id VARCHAR(64) NOT NULL,
+              first_owner_id VARCHAR(64),
+              cnt INTEGER DEFAULT 0,
+              first_at TIMESTAMP,
+              last_at TIMESTAMP,
+              PRIMARY KEY (customer_id, duplicate_operator_id, duplicate_channel_id)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        """))
+        cur.execute(fmt("CREATE INDEX IF NOT EXISTS idx_duplicates_at ON duplicates(duplicate_at)"))
+        cur.execute(fmt("CREATE INDEX IF NOT EXISTS idx_duplicates_customer ON duplicates(customer_id)"))
+        cn.commit()
+    finally:
+        cur.close(); cn.close()
+
+def compact_duplicates(retention_days=None, archive=True, throttle=None):
+    # `throttle` runs before every batch, so a scheduled run can stand aside
+    # for imports between write transactions
+    days = DUP_RETENTION_DAYS if retention_days is None else int(retention_days)
+    if days < 0:
+        raise ValueError('invalid')
+    cn = conn(); cur = cn.cursor()
+    cur.execute(fmt("SELECT datetime('now', %s) AS cutoff"), (f'-{days} days',))
+    cutoff = dict(cur.fetchone())['cutoff']
+    archived = 0
+    groups = 0
+    archive_name = None
+    out = None
+    try:
+        while True:
+            if throttle:
+                throttle()
+            # read the batch under the write lock, so a concurrent run cannot
+            # roll up the same rows before this one deletes them
+            cur.execute("BEGIN IMMEDIATE")
+            cur.execute(fmt("SELECT rowid AS rno, * FROM duplicates WHERE duplicate_at < %s ORDER BY rowid LIMIT %s"), (cutoff, COMPACT_BATCH))
+            rows = [dict(r) for r in cur.fetchall()]
+            if not rows:
+                cn.rollback()
+                break
+            lo, hi = rows[0]['rno'], rows[-1]['rno']
+            if archive and out is None:
+                os.makedirs(DUP_ARCHIVE_DIR, exist_ok=True)
+                archive_name = 'duplicates-' + datetime.now().strftime('%Y%m%dT%H%M%S') + '.jsonl.gz'
+                out = gzip.open(os.path.join(DUP_ARCHIVE_DIR, archive_name), 'at', encoding='utf-8')
+            acc = {}
+            for r in rows:
+                r.pop('rno', None)
+                if out is not None:
+                    out.write(json.dumps(r, ensure_ascii=False) + '\n')
+                k = (r['customer_id'] or '', r['duplicate_operator_id'] or '', r['duplicate_channel_id'] or '')
+                at = r['duplicate_at'] or ''
+                g = acc.get(k)
+                if g is None:
+                    acc[k] = [r['first_owner_id'], 1, at, at]
+                else:
+                    g[1] += 1
+                    g[2] = min(g[2], at)
+                    g[3] = max(g[3], at)
+            if out is not None:
+                out.flush()
+            cur.executemany(fmt("""
+                INSERT INTO duplicate_rollups (customer_id,duplicate_operator_id,duplicate_channel_id,first_owner_id,cnt,first_at,last_at)
+                VALUES (%s,%s,%s,%s,%s,%s,%s)
+                ON CONFLICT(customer_id,duplicate_operator_id,duplicate_channel_id) DO UPDATE SET
+                  cnt=cnt+excluded.cnt, first_at=MIN(first_at,excluded.first_at), last_at=MAX(last_at,excluded.last_at)
+            """), [(k[0], k[1], k[2], g[0], g[1], g[2], g[3]) for k, g in acc.items()])
+            cur.execute(fmt("DELETE FROM duplicates WHERE rowid BETWEEN %s AND %s AND duplicate_at < %s"), (lo, hi, cutoff))
+            cn.commit()
+            archived += len(rows)
+            groups += len(acc)
+    except Exception:
+        cn.rollback()
+        raise
+    finally:
+        if out is not None:
+            out.close()
+        maintenance.note(cn.total_changes)
+        cur.close(); cn.close()
+    return {'cutoff': cutoff, 'archived': archived, 'rolled_up': groups, 'archive_file': archive_name}
+
 def rid():
     return str(uuid.uuid4())
 
+ASCII_LETTER = re.compile('[A-Za-z]')
+ASCII_NON_DIGIT = re.compile('[^0-9]')
+
 def normalize_phone(p):
     s = (p or '').strip()
-    if any(ch.isalpha() for ch in s):
-        raise ValueError('invalid')
-    blocked_ranges = [('\u4e00', '\u9fff')]  # Chinese range
-    try:
-        import re
-        if re.search(r"[\u4e00-\u9fff]", s):
+    if s.isascii():
+        # same result as the general path below, without the per-char Python loops
+        if ASCII_LETTER.search(s):
             raise ValueError('invalid')
-    except Exception:
-        pass
-    for ch in [' ', '+', '(', ')', '-', '－', '—']:
-        s = s.replace(ch, '')
-    digits = ''.join(c for c in s if c.isdigit())
-    if not 4 <= len(digits) <= 11:
+        digits = ASCII_NON_DIGIT.sub('', s)
+    else:
+        if any(ch.isalpha() for ch in s):
+            raise ValueError('invalid')
+        blocked_ranges = [('\u4e00', '\u9fff')]  # Chinese range
+        try:
+            if re.search(r"[\u4e00-\u9fff]", s):
+                raise ValueError('invalid')
+        except Exception:
+            pass
+        for ch in [' ', '+', '(', ')', '-', '－', '—']:
+            s = s.replace(ch, '')
+        digits = ''.join(c for c in s if c.isdigit())
+    if not 4 <= len(digits) <= 15:
         raise ValueError('invalid')
     return digits
 
+def national_number(digits):
+    # only numbers longer than a national number can carry a country code
+    if len(digits) > NATIONAL_MAX_DIGITS:
+        for cc in COUNTRY_CODES:
+            for prefix in ('00' + cc, cc):
+                if digits.startswith(prefix) and 4 <= len(digits) - len(prefix) <= NATIONAL_MAX_DIGITS:
+                    return digits[len(prefix):]
+    return digits
+
 def sig6(digits: str):
     s = ''.join(c for c in (digits or '') if c.isdigit())
     return s if len(s) <= 6 else s[-6:]
@@ -197,6 +502,1026 @@ def sig6(digits: str):
 def sha256_hex(text):
     return hashlib.sha256(text.encode('utf-8')).hexdigest()
 
+def national_hash(digits):
+    return sha256_hex(national_number(digits or ''))
+
+# rules in rank order; each one is an equality lookup on an indexed column
+MATCH_RULES = {'exact': 'phone_hash', 'national': 'national_hash', 'suffix': 'sig6'}
+
+def match_policy(value):
+    rules = [r.strip() for r in (value or '').split(',') if r.strip()]
+    if not rules or any(r not in MATCH_RULES for r in rules):
+        raise ValueError('invalid policy')
+    return tuple(r for r in MATCH_RULES if r in rules)
+
+DEFAULT_POLICY = match_policy(MATCH_POLICY)
+
+def common_suffix(a, b):
+    n = 0
+    while n < min(len(a), len(b)) and a[-1 - n] == b[-1 - n]:
+        n += 1
+    return n
+
+MATCH_KEYS = {
+    'exact': lambda normalized, national: sha256_hex(normalized),
+    'national': lambda normalized, national: sha256_hex(national),
+    'suffix': lambda normalized, national: sig6(national),
+}
+
+def match_keys(normalized, national):
+    return {rule: key(normalized, national) for rule, key in MATCH_KEYS.items()}
+
+def match_phone(cur, normalized, policy=None, limit=1, scope=None):
+    national = national_number(normalized)
+    keys = match_keys(normalized, national)
+    found = []
+    seen = set()
+    for rule in policy or DEFAULT_POLICY:
+        sql = f"SELECT * FROM customers WHERE {MATCH_RULES[rule]}=%s"
+        params = [keys[rule]]
+        if scope:
+            sql += " AND " + scope[0]; params.append(scope[1])
+        sql += " ORDER BY created_at ASC LIMIT %s"
+        params.append(limit + len(seen))
+        cur.execute(fmt(sql), tuple(params))
+        hits = []
+        for r in cur.fetchall():
+            d = dict(r)
+            if d['id'] in seen:
+                continue
+            seen.add(d['id'])
+            d['rule'] = rule
+            d['score'] = common_suffix(national, national_number(d['phone_normalized'] or ''))
+            hits.append(d)
+        # within a rule, longer shared tails first, then the earliest record
+        hits.sort(key=lambda d: -d['score'])
+        found += hits
+        if len(found) >= limit:
+            break
+    found = found[:limit]
+    for i, d in enumerate(found):
+        d['rank'] = i + 1
+    return found
+
+def match_many(cur, numbers, policy=None):
+    # set-based match_phone: per rule, one indexed join against a JSON array
+    # of keys instead of one query per number; returns {normalized: best hit}
+    cols = ('id', 'phone_normalized', 'channel_id', 'owner_operator_id', 'owner_admin_id', 'created_at')
+    found = {}
+    nationals = {n: national_number(n) for n in numbers}
+    for rule in policy or DEFAULT_POLICY:
+        key = MATCH_KEYS[rule]
+        by_key = {}
+        for n in numbers:
+            if n not in found:
+                by_key.setdefault(key(n, nationals[n]), []).append(n)
+        if not by_key:
+            break
+        cur.execute(fmt(f"SELECT j.value, c.{', c.'.join(cols)} FROM json_each(%s) j JOIN customers c ON c.{MATCH_RULES[rule]}=j.value ORDER BY c.created_at ASC"),
+                    (json.dumps(sorted(by_key)),))  # sorted keys walk the index in order
+        for r in cur.fetchall():
+            for n in by_key[r[0]]:
+                best = found.get(n)
+                if rule != 'suffix':
+                    # rows come oldest first and every hit shares the full number
+                    if best is None:
+                        found[n] = (rule, len(nationals[n]), r)
+                    continue
+                score = common_suffix(nationals[n], national_number(r[2] or ''))
+                if best is None or score > best[1]:
+                    found[n] = (rule, score, r)
+    return {n: dict(zip(cols, r[1:]), rule=rule, score=score) for n, (rule, score, r) in found.items()}
+
+# rules whose keys are sha256 digests and can be answered by PhoneIndex
+INDEXED_RULES = ('exact', 'national')
+
+def index_key(digest):
+    return int(digest[:16], 16)
+
+class PhoneIndex:
+    # a "definitely absent" filter shared by every worker process: the
+    # 64-bit prefixes of phone_hash and national_hash, sorted in a file that
+    # each worker maps read-only (pages are shared through the OS cache).
+    # Keys written since the file was built are read from phone_index_log,
+    # which triggers on customers fill inside the writing transaction, so
+    # every committed key is in the file or the log whoever wrote it. Rows
+    # deleted since the build only cost a confirming SQL lookup.
+    HEADER = struct.Struct('<8sQQQ')  # magic, built_at ms, key count, last log seq
+    MAGIC = b'QCPHIDX1'
+
+    def __init__(self, enabled=PHONE_INDEX, rebuild_after=PHONE_INDEX_REBUILD, interval=PHONE_INDEX_INTERVAL):
+        self.enabled = enabled
+        self.rebuild_after = rebuild_after
+        self.interval = interval
+        self.builds = 0
+        self.skipped = 0
+        self.last_build = None
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._keys = None
+        self._inode = None
+        self._built_at = None
+        self._base_seq = 0
+        self._seq = 0
+        self._recent = set()
+
+    def path(self):
+        return db_params()['path'] + '.phones'
+
+    def _inode_on_disk(self):
+        try:
+            return os.stat(self.path()).st_ino
+        except OSError:
+            return None
+
+    def _load(self):
+        # (inode, built_at, log seq, keys) of the file on disk, or None; the
+        # inode comes from the open file, so it is the one that was mapped
+        try:
+            f = open(self.path(), 'rb')
+        except OSError:
+            return None
+        with f:
+            inode = os.fstat(f.fileno()).st_ino
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, built_at, count, seq = self.HEADER.unpack_from(m)
+        if magic != self.MAGIC or len(m) != self.HEADER.size + count * 8:
+            m.close()
+            return None
+        return inode, built_at, seq, memoryview(m)[self.HEADER.size:].cast('Q')
+
+    def _file_seq(self):
+        # log position of the file on disk, read from its header alone
+        try:
+            with open(self.path(), 'rb') as f:
+                magic, built_at, count, seq = self.HEADER.unpack(f.read(self.HEADER.size))
+        except (OSError, struct.error):
+            return 0
+        return seq if magic == self.MAGIC else 0
+
+    def sync(self, cur, attempts=3):
+        # once per request, on the request's own connection: pick up a file
+        # rebuilt by another worker, then read the log past what we have seen.
+        # A rebuild prunes the log behind the file it replaced only after the
+        # os.replace, so if the same file is still on disk once the log has
+        # been read, nothing this mapping needs was pruned before the read.
+        # Otherwise another rebuild overtook us and we start over on its file.
+        if not self.enabled:
+            return False
+        with self._lock:
+            for _ in range(attempts):
+                inode = self._inode_on_disk()
+                if inode is None:
+                    break
+                if inode == self._inode:
+                    loaded, seq = None, self._seq
+                else:
+                    loaded = self._load()
+                    if loaded is None:
+                        break
+                    inode, seq = loaded[0], loaded[2]
+                cur.execute(fmt("SELECT seq, phone_hash, national_hash FROM phone_index_log WHERE seq>%s ORDER BY seq"), (seq,))
+                rows = cur.fetchall()
+                if self._inode_on_disk() != inode:
+                    continue
+                recent = set() if loaded else self._recent
+                for _, h, nh in rows:
+                    recent.update(index_key(k) for k in (h, nh) if k)
+                if loaded:
+                    # threads still searching the old view keep it mapped until
+                    # they finish; the keys go first, so a reader in between
+                    # pairs the newer file with the older, longer log
+                    self._inode, self._built_at, self._base_seq, self._keys = loaded
+                    self._recent = recent
+                if rows:
+                    seq = rows[-1][0]
+                self._seq = seq
+                return True
+            self._keys = self._inode = None
+            return False
+
+    def ready(self):
+        return self._keys is not None
+
+    def maybe(self, text, added=()):
+        # same 64 bits as index_key(sha256_hex(text)), without the hex round trip
+        k = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'big')
+        if k in added or k in self._recent:
+            return True
+        keys = self._keys
+        i = bisect.bisect_left(keys, k)
+        return i < len(keys) and keys[i] == k
+
+    def absent(self, normalized, policy=None, added=()):
+        # True only when no rule in the policy can match; suffix keys are too
+        # dense to filter, so a policy with suffix always goes to SQL. `added`
+        # holds the keys the caller inserted earlier in its still open
+        # transaction: they are in no file or committed log row yet, and a
+        # sync() on another thread may swap the view while the caller runs
+        policy = policy or DEFAULT_POLICY
+        if self._keys is None or any(r not in INDEXED_RULES for r in policy):
+            return False
+        if 'exact' in policy and self.maybe(normalized, added):
+            return False
+        if 'national' in policy:
+            national = national_number(normalized)
+            if (national != normalized or 'exact' not in policy) and self.maybe(national, added):
+                return False
+        self.skipped += 1
+        return True
+
+    def pending(self):
+        return self._seq - self._base_seq
+
+    def rebuild(self):
+        # one worker builds at a time; the others keep their current mapping
+        # and pick the new file up on their next sync()
+        path = self.path()
+        lock = sqlite3.connect(path + '-lock', timeout=0, isolation_level=None)
+        try:
+            lock.execute("BEGIN EXCLUSIVE")
+        except sqlite3.OperationalError:
+            lock.close()
+            return None
+        started = time.time()
+        try:
+            cn = sqlite3.connect(db_params()['path'], timeout=30, isolation_level=None)
+            try:
+                # the log position and the scan come from the same snapshot
+                cn.execute("BEGIN")
+                seq = cn.execute("SELECT COALESCE(MAX(seq), 0) FROM phone_index_log").fetchone()[0]
+                cur = cn.execute("SELECT phone_hash, national_hash FROM customers")
+                keys = set()
+                while True:
+                    rows = cur.fetchmany(10000)
+                    if not rows:
+                        break
+                    for h, nh in rows:
+                        if h:
+                            keys.add(index_key(h))
+                        if nh:
+                            keys.add(index_key(nh))
+                cn.execute("COMMIT")
+            finally:
+                cn.close()
+            previous = self._file_seq()
+            tmp = f'{path}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(self.HEADER.pack(self.MAGIC, int(started * 1000), len(keys), seq))
+                array('Q', sorted(keys)).tofile(f)
+            os.replace(tmp, path)
+            # keep one build of log behind for workers still on the old file;
+            # sync() notices when a worker falls further behind than that
+            self.prune(previous)
+            self.builds += 1
+            self.last_build = {'keys': len(keys), 'log_seq': seq, 'seconds': round(time.time() - started, 3)}
+            self.last_error = None
+            return self.last_build
+        except Exception as e:
+            self.last_error = str(e)
+            raise
+        finally:
+            lock.close()
+
+    def prune(self, upto):
+        cn = sqlite3.connect(db_params()['path'], timeout=30, isolation_level=None)
+        try:
+            return cn.execute("DELETE FROM phone_index_log WHERE seq<=?", (upto,)).rowcount
+        finally:
+            cn.close()
+
+    def invalidate(self):
+        # after migrations: drop the file so every worker falls back to SQL
+        # until the next rebuild
+        try:
+            os.remove(self.path())
+        except OSError:
+            pass
+
+    def _run(self):
+        while True:
+            try:
+                cn = conn(); cur = cn.cursor()
+                try:
+                    self.sync(cur)
+                finally:
+                    cur.close(); cn.close()
+                if self._keys is None or self.pending() >= self.rebuild_after:
+                    self.rebuild()
+            except Exception as e:
+                self.last_error = str(e)
+            time.sleep(self.interval)
+
+    def start(self):
+        # a Thread object inherited through fork is not running in the child
+        if not self.enabled or (self._thread is not None and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='phone-index', daemon=True)
+                self._thread.start()
+
+    def status(self):
+        keys = self._keys
+        return {'enabled': self.enabled, 'ready': keys is not None, 'keys': len(keys) if keys is not None else 0,
+                'log_seq': self._seq, 'pending': self.pending(), 'rebuild_after': self.rebuild_after, 'built_at': self._built_at,
+                'builds': self.builds, 'last_build': self.last_build, 'skipped': self.skipped, 'last_error': self.last_error}
+
+phone_index = PhoneIndex()
+
+def now_ms():
+    return int(time.time() * 1000)
+
+# created_at/duplicate_at keep their CURRENT_TIMESTAMP text for display; the
+# *_ts columns hold the same UTC instant as epoch milliseconds for range scans
+TS_COLUMNS = [('customers', 'created_at', 'created_ts'), ('duplicates', 'duplicate_at', 'duplicate_ts')]
+EPOCH_MS = "CAST(ROUND((julianday({}) - 2440587.5) * 86400000) AS INTEGER)"
+
+class TimestampBackfill:
+    # rows written before the epoch_columns migration, or later by anything
+    # that left the column NULL, are filled a batch at a time in rowid order,
+    # one short transaction per batch, so writers only ever wait for a single
+    # batch. Maintenance repeats the sweep whenever rows are pending.
+    def __init__(self, enabled=TS_BACKFILL, batch=BACKFILL_BATCH):
+        self.enabled = enabled
+        self.batch = batch
+        self.filled = 0
+        self.runs = 0
+        self.last_error = None
+        self.last_duration = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def pending(self):
+        cn = conn()
+        try:
+            return {table: cn.execute(f"SELECT COUNT(*) FROM {table} WHERE {ts} IS NULL AND julianday({text}) IS NOT NULL").fetchone()[0]
+                    for table, text, ts in TS_COLUMNS}
+        finally:
+            cn.close()
+
+    def run(self, pause=0.01):
+        with self._lock:
+            started = time.time()
+            filled = 0
+            cn = conn()
+            try:
+                for table, text, ts in TS_COLUMNS:
+                    # the ts index finds the NULL rows; rows whose text does not
+                    # parse stay NULL, are not pending and are stepped over by rowid
+                    lo = 0
+                    while True:
+                        ids = [r[0] for r in cn.execute(f"SELECT rowid FROM {table} WHERE {ts} IS NULL AND rowid>? ORDER BY rowid LIMIT ?", (lo, self.batch))]
+                        if not ids:
+                            break
+                        cur = cn.execute(f"UPDATE {table} SET {ts}={EPOCH_MS.format(text)} WHERE rowid IN (SELECT value FROM json_each(?)) AND {ts} IS NULL AND julianday({text}) IS NOT NULL",
+                                         (json.dumps(ids),))
+                        filled += cur.rowcount
+                        cn.commit()
+                        lo = ids[-1]
+                        time.sleep(pause)
+            finally:
+                cn.close()
+            self.filled += filled
+            self.runs += 1
+            self.last_duration = time.time() - started
+            return filled
+
+    def _run(self):
+        try:
+            if any(self.pending().values()):
+                self.run()
+            self.last_error = None
+        except Exception:
+            self.last_error = traceback.format_exc()
+
+    def start(self):
+        if self.enabled and self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='ts-backfill', daemon=True)
+                    self._thread.start()
+
+    def status(self):
+        return {'enabled': self.enabled, 'batch': self.batch, 'pending': self.pending(), 'filled': self.filled, 'runs': self.runs,
+                'running': self._thread is not None and self._thread.is_alive(), 'last_duration': self.last_duration, 'last_error': self.last_error}
+
+backfill = TimestampBackfill()
+
+class Maintenance:
+    # runs every `interval` seconds, or sooner once this process has changed
+    # `mutations` rows. Every step is a short slice followed by a pause, and
+    # write slices first wait for in-flight batch imports, so writers are
+    # delayed by at most one slice.
+    def __init__(self, interval=MAINT_INTERVAL, mutations=MAINT_MUTATIONS, pages=MAINT_VACUUM_PAGES, pause=MAINT_PAUSE,
+                 integrity=MAINT_INTEGRITY, analysis_limit=MAINT_ANALYSIS_LIMIT):
+        self.interval = interval
+        self.mutations = mutations
+        self.pages = pages
+        self.pause = pause
+        self.integrity = integrity
+        self.analysis_limit = analysis_limit
+        self.changes = 0
+        self.running = False
+        self.reports = deque(maxlen=20)
+        self.last_error = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def stamp(self):
+        return db_params()['path'] + '.maint-stamp'
+
+    def last_run(self):
+        try:
+            return os.path.getmtime(self.stamp())
+        except OSError:
+            return None
+
+    def touch(self):
+        with open(self.stamp(), 'w') as f:
+            f.write(repr(time.time()))
+
+    def note(self, changes):
+        self.changes += changes
+        if self.mutations and self.changes >= self.mutations:
+            self._wake.set()
+
+    def due(self):
+        last = self.last_run()
+        if last is None:
+            # a fresh deployment starts its first interval now
+            self.touch()
+            return False
+        return bool((self.interval and time.time() - last >= self.interval) or (self.mutations and self.changes >= self.mutations))
+
+    def _yield(self):
+        waited = 0.0
+        while admission.in_flight and waited < 30:
+            time.sleep(0.1)
+            waited += 0.1
+        time.sleep(self.pause)
+
+    def _write(self, fn, retries=20):
+        for _ in range(retries):
+            self._yield()
+            try:
+                return fn()
+            except sqlite3.OperationalError as e:
+                if 'locked' not in str(e) and 'busy' not in str(e):
+                    raise
+        return None
+
+    def run(self, integrity=None):
+        integrity = self.integrity if integrity is None else integrity
+        path = db_params()['path']
+        # other workers run the same scheduler; whoever holds the lock does the work
+        lock = sqlite3.connect(path + '.maint-lock', timeout=0, isolation_level=None)
+        try:
+            lock.execute("BEGIN EXCLUSIVE")
+        except sqlite3.OperationalError:
+            lock.close()
+            return None
+        with self._lock:
+            self.running = True
+            started = time.time()
+            report = {'started': started, 'changes': self.changes}
+            self.changes = 0
+            sizes = lambda: sum(os.path.getsize(p) for p in (path, path + '-wal') if os.path.exists(p))
+            report['file_bytes_before'] = sizes()
+            cn = sqlite3.connect(path, timeout=1, isolation_level=None)
+            try:
+                page = cn.execute("PRAGMA page_size").fetchone()[0]
+                busy, frames, done = cn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+                report['checkpoint'] = {'wal_frames': frames, 'checkpointed': done}
+
+                if backfill.enabled and any(backfill.pending().values()):
+                    report['ts_backfill'] = backfill.run(pause=self.pause)
+
+                if DUP_COMPACT:
+                    # the retention policy: duplicates past DUP_RETENTION_DAYS
+                    # move into duplicate_rollups and the archive
+                    report['compact'] = compact_duplicates(throttle=self._yield)
+
+                if not phone_index.enabled:
+                    # the customers triggers keep logging; with the index off nothing reads it
+                    report['phone_index_log_pruned'] = self._write(lambda: cn.execute("DELETE FROM phone_index_log").rowcount)
+
+                mode = cn.execute("PRAGMA auto_vacuum").fetchone()[0]
+                before = free = cn.execute("PRAGMA freelist_count").fetchone()[0]
+                slices = 0
+                while mode == 2 and free:
+                    # executescript steps the pragma to completion; execute() frees one page
+                    if self._write(lambda: cn.executescript(f"PRAGMA incremental_vacuum({self.pages});")) is None:
+                        break
+                    slices += 1
+                    free = cn.execute("PRAGMA freelist_count").fetchone()[0]
+                report['vacuum'] = {'auto_vacuum': ('none', 'full', 'incremental')[mode], 'free_pages_before': before, 'free_pages_after': free,
+                                    'reclaimed_bytes': (before - free) * page, 'slices': slices}
+
+                cn.execute(f"PRAGMA analysis_limit={int(self.analysis_limit)}")
+                tables = [r[0] for r in cn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")]
+                analyzed = [t for t in tables if self._write(lambda: cn.execute(f'ANALYZE "{t}"')) is not None]
+                self._write(lambda: cn.execute("PRAGMA optimize"))
+                report['analyze'] = {'tables': analyzed, 'analysis_limit': self.analysis_limit}
+
+                busy, frames, done = cn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+                report['checkpoint']['truncated'] = not busy
+
+                if integrity in ('quick', 'full'):
+                    rows = [r[0] for r in cn.execute("PRAGMA integrity_check(20)" if integrity == 'full' else "PRAGMA quick_check(20)")]
+                    report['integrity'] = {'mode': integrity, 'ok': rows == ['ok'], 'errors': [] if rows == ['ok'] else rows}
+            finally:
+                cn.close()
+                lock.close()
+                self.running = False
+            report['file_bytes_after'] = sizes()
+            report['reclaimed_bytes'] = max(0, report['file_bytes_before'] - report['file_bytes_after'])
+            report['duration'] = round(time.time() - started, 3)
+            self.touch()
+            self.reports.append(report)
+            if report.get('integrity') and not report['integrity']['ok']:
+                app.logger.error('maintenance: %s integrity check failed: %s', report['integrity']['mode'], report['integrity']['errors'])
+            return report
+
+    def _run(self):
+        while True:
+            self._wake.wait(min(60, self.interval or 60))
+            self._wake.clear()
+            try:
+                if self.due():
+                    self.run()
+                self.last_error = None
+            except Exception:
+                self.last_error = traceback.format_exc()
+                app.logger.exception('maintenance run failed')
+
+    def start(self):
+        if (self.interval or self.mutations) and (self._thread is None or not self._thread.is_alive()):
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='maintenance', daemon=True)
+                    self._thread.start()
+
+    def status(self):
+        return {'interval': self.interval, 'mutations': self.mutations, 'changes': self.changes, 'pages': self.pages, 'pause': self.pause,
+                'integrity': self.integrity, 'running': self.running, 'last_run': self.last_run(), 'last_error': self.last_error,
+                'reports': list(reversed(self.reports))}
+
+maintenance = Maintenance()
+
+def parse_ts(value, tz_minutes=0):
+    # epoch milliseconds, or an ISO date/datetime read in the report timezone
+    if value is None or value == '':
+        return None
+    if re.fullmatch(r'-?\d+', value):
+        return int(value)
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone(timedelta(minutes=tz_minutes)))
+    return int(dt.timestamp() * 1000)
+
+class EventHub:
+    # events are rows of event_log, so every worker process hands out the
+    # same ids in the same order and a client can resume across restarts
+    # and workers. Each process tails the table into an in-memory window
+    # and a condition variable; a subscriber is only a cursor into it, but
+    # each open stream still occupies one server thread.
+    def __init__(self, backlog=EVENT_BACKLOG, poll=EVENT_POLL):
+        self.backlog = backlog
+        self.poll_interval = poll
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=backlog)
+        self._last_id = None
+        self._floor = None  # the window holds every event with id > _floor
+        self._tail = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.subscribers = 0
+        self.published = 0
+        self.last_error = None
+
+    def _connect(self):
+        cn = sqlite3.connect(db_params()['path'], timeout=30, isolation_level=None)
+        # an event lost to a power cut only costs clients a reload
+        cn.execute("PRAGMA synchronous=NORMAL")
+        return cn
+
+    @staticmethod
+    def _event(row):
+        eid, kind, data, admin_ids, operator_ids = row
+        return (eid, kind, data, frozenset(json.loads(admin_ids)), frozenset(json.loads(operator_ids)))
+
+    def publish(self, kind, data, admin_ids=(), operator_ids=()):
+        return self.publish_many([(kind, data, admin_ids, operator_ids)])
+
+    def publish_many(self, items):
+        # called after the write has committed; a failure here must not fail the request
+        try:
+            cn = self._connect()
+            try:
+                cn.execute("BEGIN IMMEDIATE")
+                cur = cn.cursor()
+                for kind, data, admin_ids, operator_ids in items:
+                    cur.execute("INSERT INTO event_log (ts,kind,data,admin_ids,operator_ids) VALUES (?,?,?,?,?)",
+                                (now_ms(), kind, json.dumps(data, ensure_ascii=False, default=str),
+                                 json.dumps(sorted({a for a in admin_ids if a})), json.dumps(sorted({o for o in operator_ids if o}))))
+                eid = cur.lastrowid
+                if eid // 1000 != (eid - len(items)) // 1000:
+                    cur.execute("DELETE FROM event_log WHERE id<=?", (eid - self.backlog,))
+                cn.execute("COMMIT")
+            finally:
+                cn.close()
+        except sqlite3.Error:
+            app.logger.exception('event not published')
+            return None
+        self.published += len(items)
+        self.poll()
+        return eid
+
+    def poll(self):
+        # append what any process has committed since the last poll, in id order
+        with self._tail:
+            cn = self._connect()
+            try:
+                if self._last_id is None:
+                    head, rows = cn.execute("SELECT COALESCE(MAX(id), 0) FROM event_log").fetchone()[0], []
+                else:
+                    head, rows = self._last_id, cn.execute("SELECT id,kind,data,admin_ids,operator_ids FROM event_log WHERE id>? ORDER BY id", (self._last_id,)).fetchall()
+            finally:
+                cn.close()
+            with self._cond:
+                if self._last_id is None:
+                    self._last_id = self._floor = head
+                for r in rows:
+                    if len(self._events) == self._events.maxlen:
+                        self._floor = self._events[0][0]
+                    self._events.append(self._event(r))
+                    self._last_id = r[0]
+                if rows:
+                    self._cond.notify_all()
+
+    def since(self, last_id):
+        # (events after last_id, gap); gap tells the client to reload
+        if self._last_id is None or last_id > self._last_id:
+            self.poll()
+        with self._cond:
+            if last_id > self._last_id:
+                # never issued here, e.g. an id from before the log was reset
+                return [], True
+            if last_id >= self._floor:
+                return [e for e in self._events if e[0] > last_id], False
+        # older than this process's window: read the table itself
+        cn = self._connect()
+        try:
+            first = cn.execute("SELECT MIN(id) FROM event_log").fetchone()[0]
+            rows = cn.execute("SELECT id,kind,data,admin_ids,operator_ids FROM event_log WHERE id>? ORDER BY id LIMIT ?", (last_id, self.backlog)).fetchall()
+        finally:
+            cn.close()
+        return [self._event(r) for r in rows], first is None or first > last_id + 1
+
+    def wait(self, last_id, timeout):
+        with self._cond:
+            return self._cond.wait_for(lambda: self._last_id > last_id, timeout)
+
+    def last_id(self):
+        if self._last_id is None:
+            self.poll()
+        return self._last_id
+
+    def _run(self):
+        # brings in events published by other worker processes
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            if not self.subscribers:
+                continue
+            try:
+                self.poll()
+                self.last_error = None
+            except Exception:
+                self.last_error = traceback.format_exc()
+
+    def subscribe(self, delta):
+        with self._cond:
+            self.subscribers += delta
+        if delta > 0 and (self._thread is None or not self._thread.is_alive()):
+            with self._tail:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='event-tail', daemon=True)
+                    self._thread.start()
+
+    @staticmethod
+    def visible(ev, who):
+        if who['role'] == 'super_admin':
+            return True
+        if who['role'] == 'admin':
+            return who['id'] in ev[3]
+        if ev[1] == 'channel':
+            return who.get('parent_id') in ev[3]
+        return who['id'] in ev[4]
+
+    def status(self):
+        return {'subscribers': self.subscribers, 'published': self.published, 'backlog': len(self._events), 'last_id': self._last_id,
+                'poll': self.poll_interval, 'last_error': self.last_error}
+
+hub = EventHub()
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, burst, now):
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, rate, burst, now):
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+class Admission:
+    # rates are rows per second: a single create costs 1, a batch costs len(phones).
+    # A request is admitted once the bucket holds min(cost, burst) tokens and is then
+    # charged in full, so large batches push the bucket into debt instead of never fitting.
+    def __init__(self, limits=ADMISSION_LIMITS):
+        self.limits = dict(limits)
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._buckets = {}
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = {'operator_rate': 0, 'admin_rate': 0, 'batch_queue_full': 0, 'batch_timeout': 0}
+        self.max_wait = 0.0
+
+    def configure(self, changes):
+        parsed = {}
+        for k, v in changes.items():
+            if k not in self.limits:
+                raise KeyError(k)
+            parsed[k] = type(self.limits[k])(v)
+            if parsed[k] <= 0:
+                raise ValueError(k)
+        with self._cond:
+            self.limits.update(parsed)
+            # buckets refill lazily against the current limits; start them over so new quotas apply at once
+            self._buckets.clear()
+            self._cond.notify_all()
+        return dict(self.limits)
+
+    def charge(self, operator_id, admin_id, cost):
+        now = time.monotonic()
+        with self._lock:
+            checks = []
+            for kind, key in (('operator', operator_id), ('admin', admin_id)):
+                if not key:
+                    continue
+                rate, burst = self.limits[kind + '_rate'], self.limits[kind + '_burst']
+                b = self._buckets.get((kind, key))
+                if b is None:
+                    b = self._buckets[(kind, key)] = TokenBucket(burst, now)
+                b.refill(rate, burst, now)
+                need = min(cost, burst)
+                if b.tokens < need:
+                    self.rejected[kind + '_rate'] += 1
+                    return kind + '_rate', (need - b.tokens) / rate
+                checks.append(b)
+            for b in checks:
+                b.tokens -= cost
+            self.admitted += 1
+        return None, 0
+
+    def refund(self, operator_id, admin_id, cost):
+        # a charged request that never ran (queue full, queue timeout) gives its tokens back
+        with self._lock:
+            for kind, key in (('operator', operator_id), ('admin', admin_id)):
+                b = self._buckets.get((kind, key))
+                if b is not None:
+                    b.tokens = min(self.limits[kind + '_burst'], b.tokens + cost)
+
+    def enter_batch(self):
+        deadline = time.monotonic() + self.limits['queue_timeout']
+        with self._cond:
+            if self.in_flight >= self.limits['batch_concurrency'] and self.queued >= self.limits['batch_queue']:
+                self.rejected['batch_queue_full'] += 1
+                self.admitted -= 1
+                return 'batch_queue_full', self.limits['queue_timeout']
+            self.queued += 1
+            started = time.monotonic()
+            try:
+                while self.in_flight >= self.limits['batch_concurrency']:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        self.rejected['batch_timeout'] += 1
+                        self.admitted -= 1
+                        return 'batch_timeout', self.limits['queue_timeout']
+                    self._cond.wait(left)
+            finally:
+                self.queued -= 1
+            self.max_wait = max(self.max_wait, time.monotonic() - started)
+            self.in_flight += 1
+        return None, 0
+
+    def leave_batch(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def status(self):
+        with self._lock:
+            return {'limits': dict(self.limits), 'in_flight': self.in_flight, 'queued': self.queued, 'admitted': self.admitted,
+                    'rejected': dict(self.rejected), 'max_wait': round(self.max_wait, 3), 'buckets': len(self._buckets)}
+
+admission = Admission()
+
+class SharedGeneration:
+    # an 8-byte counter in a file every worker maps; bump() after a commit
+    # tells the other processes that their cached copies are stale. Each bump
+    # writes a fresh value, so concurrent bumps never cancel out.
+    def __init__(self):
+        self._map = None
+        self._lock = threading.Lock()
+
+    def _mapped(self):
+        if self._map is None:
+            with self._lock:
+                if self._map is None:
+                    path = db_params()['path'] + '.generation'
+                    with open(path, 'a+b') as f:
+                        if f.seek(0, os.SEEK_END) < 8:
+                            f.write(bytes(8 - f.tell()))
+                            f.flush()
+                        self._map = mmap.mmap(f.fileno(), 8)
+        return self._map
+
+    def value(self):
+        return struct.unpack_from('<Q', self._mapped())[0]
+
+    def bump(self):
+        struct.pack_into('<Q', self._mapped(), 0, time.time_ns())
+
+generation = SharedGeneration()
+
+class Directory:
+    # users and channels are small and change rarely; every handler that
+    # mutates them calls invalidate(), which also bumps the shared generation
+    # so other worker processes reload on their next lookup. The TTL and the
+    # reload on an unknown id cover writes made outside this server.
+    def __init__(self, ttl=DIRECTORY_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._tables = None
+        self._loaded_at = 0.0
+        self._generation = None
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.invalidations = 0
+
+    def load(self):
+        gen = generation.value()
+        cn = conn(); cur = cn.cursor()
+        try:
+            cur.execute(fmt("SELECT id, username, role, parent_id, is_active FROM users"))
+            users = {r['id']: dict(r) for r in cur.fetchall()}
+            cur.execute(fmt("SELECT id, name, owner_admin_id, is_active FROM channels"))
+            channels = {r['id']: dict(r) for r in cur.fetchall()}
+        finally:
+            cur.close(); cn.close()
+        self._tables = {'users': users, 'channels': channels}
+        self._generation = gen
+        self._loaded_at = time.time()
+        self.loads += 1
+        return self._tables
+
+    def get(self, kind, key):
+        tables = self._tables
+        fresh = self._generation == generation.value()
+        if tables is not None and key in tables[kind] and fresh and time.time() - self._loaded_at < self.ttl:
+            self.hits += 1
+            return tables[kind][key]
+        with self._lock:
+            self.misses += 1
+            tables = self._tables
+            age = time.time() - self._loaded_at
+            if tables is None or age >= self.ttl or self._generation != generation.value() or (key not in tables[kind] and age >= 1):
+                tables = self.load()
+            return tables[kind].get(key)
+
+    def user(self, uid):
+        return self.get('users', uid) if uid else None
+
+    def channel(self, cid):
+        return self.get('channels', cid) if cid else None
+
+    def invalidate(self):
+        self._tables = None
+        self.invalidations += 1
+        generation.bump()
+
+    def status(self):
+        tables = self._tables
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'loads': self.loads, 'invalidations': self.invalidations, 'ttl': self.ttl,
+                'users': len(tables['users']) if tables else 0, 'channels': len(tables['channels']) if tables else 0,
+                'age': round(time.time() - self._loaded_at, 3) if tables else None}
+
+directory = Directory()
+
+def channel_name(cid):
+    ch = directory.channel(cid)
+    return (ch['name'] or '') if ch else ''
+
+def too_busy(reason, retry_after):
+    secs = max(1, math.ceil(retry_after))
+    resp = jsonify({'error':'busy','reason':reason,'retry_after':secs,'detail':f'请求过于频繁，请 {secs} 秒后重试'})
+    resp.status_code = 429
+    resp.headers['Retry-After'] = str(secs)
+    return resp
+
+def admitted(batch=False, free=None):
+    # free(kwargs, data) is true for a request that does no import work (a
+    # replayed chunk), which skips both the charge and the batch queue
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            data = request.get_json(force=True, silent=True) or {}
+            if free and free(kwargs, data):
+                return fn(*args, **kwargs)
+            operator_id = data.get('operator_id')
+            cost = 1
+            if batch:
+                phones = data.get('phones')
+                cost = max(1, len(phones)) if isinstance(phones, list) else 1
+            u = directory.user(operator_id)
+            admin_id = u['parent_id'] if u else None
+            reason, wait = admission.charge(operator_id, admin_id, cost)
+            if reason:
+                return too_busy(reason, wait)
+            if not batch:
+                return fn(*args, **kwargs)
+            reason, wait = admission.enter_batch()
+            if reason:
+                admission.refund(operator_id, admin_id, cost)
+                return too_busy(reason, wait)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                admission.leave_batch()
+        return wrapper
+    return deco
+
+def user_scope(uid):
+    r = directory.user(uid)
+    if not r:
+        return [], []
+    if r['role'] == 'operator':
+        return [r['parent_id']], [uid]
+    return [uid], []
+
+def json_dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def closing(resp, cn):
+    # a generator's finally only runs once iteration has started; the WSGI
+    # server calls close() on every response, including bodies never sent
+    resp.call_on_close(cn.close)
+    return resp
+
+def json_rows(cn, sql, params=()):
+    # rows go from the cursor to the socket in batches as tuples; a batch is
+    # encoded as one list and its brackets dropped, so no full result list or
+    # full JSON string is ever held. ?shape=tuples returns columns + arrays.
+    tuples = request.args.get('shape') == 'tuples'
+    cn.row_factory = None
+    cur = cn.cursor()
+    try:
+        cur.execute(fmt(sql), tuple(params))
+    except Exception:
+        cur.close(); cn.close()
+        raise
+    cols = [d[0] for d in cur.description]
+
+    def gen():
+        try:
+            yield (b'{"columns":' + json_dumps(cols) + b',"rows":[') if tuples else b'['
+            first = True
+            while True:
+                rows = cur.fetchmany(JSON_BATCH)
+                if not rows:
+                    break
+                body = json_dumps(rows if tuples else [dict(zip(cols, r)) for r in rows])[1:-1]
+                yield body if first else b',' + body
+                first = False
+            yield b']}' if tuples else b']'
+        finally:
+            cur.close(); cn.close()
+
+    return closing(Response(gen(), mimetype='application/json'), cn)
+
 app = Flask(__name__)
 
 @app.after_request
@@ -204,8 +1529,78 @@ def add_cors(resp):
     origin = request.headers.get('Origin') or '*'
     resp.headers['Access-Control-Allow-Origin'] = origin
     resp.headers['Access-Control-Allow-Credentials'] = 'true'
-    resp.headers['Access-Control-Allow-Headers'] = 'Content-Type'
-    resp.headers['Access-Control-Allow-Methods'] = 'GET,POST,DELETE,PATCH,OPTIONS'
+    resp.headers['Access-Control-Allow-Headers'] = 'Content-Type, X-Profile, X-Profile-Mode'
+    resp.headers['Access-Control-Allow-Methods'] = 'GET,POST,PUT,DELETE,PATCH,OPTIONS'
+    resp.headers['Access-Control-Expose-Headers'] = 'Retry-After'
+    return resp
+
+class Sampler:
+    # wall-clock stack sampler for one thread; writes the folded format read
+    # by flamegraph.pl and speedscope
+    def __init__(self, ident=None, interval=PROFILE_INTERVAL):
+        self.ident = threading.get_ident() if ident is None else ident
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            f = sys._current_frames().get(self.ident)
+            stack = []
+            while f is not None:
+                stack.append(f'{f.f_code.co_name} ({os.path.basename(f.f_code.co_filename)}:{f.f_code.co_firstlineno})')
+                f = f.f_back
+            if stack:
+                key = ';'.join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+                self.samples += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def folded(self):
+        return ''.join(f'{k} {v}\n' for k, v in sorted(self.stacks.items()))
+
+def profile_allowed():
+    token = request.headers.get('X-Profile') or request.args.get('profile')
+    return bool(PROFILE_TOKEN and token and hmac.compare_digest(token, PROFILE_TOKEN))
+
+@app.before_request
+def start_profile():
+    if not profile_allowed() or request.path.startswith('/api/profiles'):
+        return
+    mode = request.headers.get('X-Profile-Mode') or request.args.get('profile_mode') or 'folded'
+    if mode == 'pstats':
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+    else:
+        g.profiler = Sampler().start()
+
+@app.after_request
+def save_profile(resp):
+    # a streamed body is produced after this point, so only the handler is covered
+    p = g.pop('profiler', None)
+    if p is None:
+        return resp
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint or 'unknown'}-{uuid.uuid4().hex[:6]}"
+    if isinstance(p, Sampler):
+        p.stop()
+        name += '.folded'
+        with open(os.path.join(PROFILE_DIR, name), 'w', encoding='utf-8') as f:
+            f.write(p.folded())
+    else:
+        p.disable()
+        name += '.pstats'
+        p.dump_stats(os.path.join(PROFILE_DIR, name))
+    resp.headers['X-Profile-File'] = name
     return resp
 
 @app.route('/', methods=['GET'])
@@ -272,13 +1667,7 @@ def debug():
 
 @app.route('/api/users', methods=['GET'])
 def get_users():
-    cn = conn()
-    cur = cn.cursor()
-    cur.execute(fmt('SELECT * FROM users'))
-    rows = [dict(r) for r in cur.fetchall()]
-    cur.close()
-    cn.close()
-    return jsonify(rows)
+    return json_rows(conn(), 'SELECT * FROM users')
 
 @app.route('/api/admins', methods=['POST'])
 def create_admin():
@@ -303,6 +1692,8 @@ def create_admin():
         cur.close(); cn.close()
         return jsonify({'error':'exists'}), 409
     cn.commit(); cur.close(); cn.close()
+    directory.invalidate()
+    hub.publish('user', {'action':'created','id':user_id,'role':'admin'}, admin_ids=[user_id])
     return jsonify({'id':user_id,'username':username,'display_name':display_name,'role':'admin','parent_id':parent_id,'is_active':1,'salt':salt,'password_hash':password+salt})
 
 @app.route('/api/operators', methods=['POST'])
@@ -325,8 +1716,87 @@ def create_operator():
         cur.close(); cn.close()
         return jsonify({'error':'exists'}), 409
     cn.commit(); cur.close(); cn.close()
+    directory.invalidate()
+    hub.publish('user', {'action':'created','id':user_id,'role':'operator','parent_id':owner_admin_id}, admin_ids=[owner_admin_id], operator_ids=[user_id])
     return jsonify({'id':user_id,'username':username,'display_name':display_name,'role':'operator','parent_id':owner_admin_id,'is_active':1,'salt':salt,'password_hash':password+salt})
 
+def bulk_user_rows(data):
+    rows = data.get('users')
+    if rows is None and isinstance(data.get('csv'), str):
+        rows = []
+        for rec in csv.reader(io.StringIO(data['csv'])):
+            rec = [x.strip() for x in rec] + ['', '', '', '']
+            if not any(rec):
+                continue
+            rows.append({'username': rec[0], 'display_name': rec[1], 'password': rec[2], 'owner_admin_id': rec[3] or None})
+        if rows and rows[0]['username'].lower() in ('username', '用户名'):
+            rows = rows[1:]
+    return rows
+
+@app.route('/api/users/bulk', methods=['POST'])
+def create_users_bulk():
+    data = request.get_json(force=True)
+    rows = bulk_user_rows(data)
+    if not isinstance(rows, list) or not rows or len(rows) > BULK_USERS_MAX or not all(isinstance(r, dict) for r in rows):
+        return jsonify({'error':'invalid'}), 400
+    role = data.get('role') or 'operator'
+    owner = data.get('owner_admin_id')
+    if owner is not None and not isinstance(owner, str):
+        return jsonify({'error':'invalid'}), 400
+    cn = conn(); cur = cn.cursor()
+    try:
+        cur.execute(fmt("SELECT id FROM users WHERE role='super_admin' LIMIT 1"))
+        row = cur.fetchone()
+        super_id = row['id'] if row else None
+        names = [str(r.get('username') or '').strip() for r in rows]
+        owners = [r.get('owner_admin_id') or owner for r in rows]
+        # one round trip each for taken usernames and valid owners, however many rows
+        cur.execute(fmt("SELECT username FROM users WHERE username IN (SELECT value FROM json_each(%s))"), (json.dumps(names),))
+        taken = {r['username'] for r in cur.fetchall()}
+        cur.execute(fmt("SELECT id FROM users WHERE role='admin' AND id IN (SELECT value FROM json_each(%s))"), (json.dumps([o for o in owners if isinstance(o, str)]),))
+        admins = {r['id'] for r in cur.fetchall()}
+        results = []
+        todo = []
+        seen = set()
+        for i, r in enumerate(rows):
+            username = names[i]
+            display_name = str(r.get('display_name') or '').strip()
+            password = str(r.get('password') or '')
+            r_role = r.get('role') or role
+            parent_id = super_id if r_role == 'admin' else owners[i]
+            res = {'row': i + 1, 'username': username}
+            if not username or not display_name or not password or r_role not in ('admin', 'operator') or not isinstance(owners[i] or '', str):
+                res.update(status='error', error='invalid')
+            elif username in taken:
+                res.update(status='error', error='exists')
+            elif username in seen:
+                res.update(status='error', error='duplicate')
+            elif r_role == 'operator' and parent_id not in admins:
+                res.update(status='error', error='owner')
+            else:
+                salt = uuid.uuid4().hex[:4]
+                res.update(status='created', id=rid(), role=r_role, parent_id=parent_id)
+                todo.append((res, display_name, salt, password + salt))
+            seen.add(username)
+            results.append(res)
+        for res, display_name, salt, password_hash in todo:
+            try:
+                cur.execute(fmt("INSERT INTO users (id,username,display_name,role,parent_id,is_active,salt,password_hash) VALUES (%s,%s,%s,%s,%s,1,%s,%s)"),
+                            (res['id'], res['username'], display_name, res['role'], res['parent_id'], salt, password_hash))
+            except sqlite3.IntegrityError:
+                res.update(status='error', error='exists')
+                del res['id'], res['role'], res['parent_id']
+        cn.commit()
+    finally:
+        cur.close(); cn.close()
+    created = [r for r in results if r['status'] == 'created']
+    if created:
+        directory.invalidate()
+        hub.publish_many([('user', {'action':'created','id':r['id'],'role':'admin'}, [r['id']], []) if r['role'] == 'admin' else
+                          ('user', {'action':'created','id':r['id'],'role':'operator','parent_id':r['parent_id']}, [r['parent_id']], [r['id']])
+                          for r in created])
+    return jsonify({'status':'ok','created': len(created),'failed': len(results) - len(created),'results': results})
+
 @app.route('/api/users/<uid>', methods=['PATCH'])
 def patch_user(uid):
     data = request.get_json(force=True)
@@ -334,6 +1804,7 @@ def patch_user(uid):
     new_password = data.get('new_password')
     cn = conn()
     cur = cn.cursor()
+    admin_ids, operator_ids = user_scope(uid)
     if is_active is not None:
         cur.execute(fmt("UPDATE users SET is_active=%s WHERE id=%s"), (1 if is_active else 0, uid))
     if new_password:
@@ -346,6 +1817,8 @@ def patch_user(uid):
         ph = new_password + salt
         cur.execute(fmt("UPDATE users SET password_hash=%s WHERE id=%s"), (ph, uid))
     cn.commit(); cur.close(); cn.close()
+    directory.invalidate()
+    hub.publish('user', {'action':'updated','id':uid,'is_active':is_active}, admin_ids, operator_ids)
     return jsonify({'status':'ok'})
 
 @app.route('/api/admins/<uid>', methods=['DELETE'])
@@ -369,39 +1842,42 @@ def delete_admin(uid):
         custs = [dict(r)['id'] if USE_SQLITE else r['id'] for r in cur.fetchall()]
     if custs:
         cur.execute(fmt("DELETE FROM duplicates WHERE customer_id IN ("+ ",".join(["%s"]*len(custs))+")"), tuple(custs))
+        cur.execute(fmt("DELETE FROM duplicate_rollups WHERE customer_id IN ("+ ",".join(["%s"]*len(custs))+")"), tuple(custs))
         cur.execute(fmt("DELETE FROM customers WHERE id IN ("+ ",".join(["%s"]*len(custs))+")"), tuple(custs))
     if ops:
         cur.execute(fmt("DELETE FROM users WHERE id IN ("+ ",".join(["%s"]*len(ops))+")"), tuple(ops))
     if chs:
         cur.execute(fmt("DELETE FROM channels WHERE id IN ("+ ",".join(["%s"]*len(chs))+")"), tuple(chs))
     cur.execute(fmt("DELETE FROM users WHERE id=%s"), (uid,))
+    maintenance.note(cn.total_changes)
     cn.commit(); cur.close(); cn.close()
+    directory.invalidate()
+    hub.publish('user', {'action':'deleted','id':uid,'role':'admin','operators':ops,'channels':chs}, [uid], ops)
     return jsonify({'status':'ok'})
 
 @app.route('/api/operators/<uid>', methods=['DELETE'])
 def delete_operator(uid):
     cn = conn(); cur = cn.cursor()
+    admin_ids, operator_ids = user_scope(uid)
     cur.execute(fmt("SELECT id FROM customers WHERE owner_operator_id=%s"), (uid,))
     custs = [dict(r)['id'] if USE_SQLITE else r['id'] for r in cur.fetchall()]
     if custs:
         cur.execute(fmt("DELETE FROM duplicates WHERE customer_id IN ("+ ",".join(["%s"]*len(custs))+")"), tuple(custs))
+        cur.execute(fmt("DELETE FROM duplicate_rollups WHERE customer_id IN ("+ ",".join(["%s"]*len(custs))+")"), tuple(custs))
         cur.execute(fmt("DELETE FROM customers WHERE id IN ("+ ",".join(["%s"]*len(custs))+")"), tuple(custs))
     cur.execute(fmt("DELETE FROM users WHERE id=%s"), (uid,))
+    maintenance.note(cn.total_changes)
     cn.commit(); cur.close(); cn.close()
+    directory.invalidate()
+    hub.publish('user', {'action':'deleted','id':uid,'role':'operator'}, admin_ids, operator_ids)
     return jsonify({'status':'ok'})
 
 @app.route('/api/channels', methods=['GET'])
 def get_channels():
     name = request.args.get('name')
-    cn = conn(); cur = cn.cursor()
     if name:
-        cur.execute(fmt('SELECT * FROM channels WHERE LOWER(name)=LOWER(%s)'), (name,))
-        rows = [dict(r) for r in cur.fetchall()]
-    else:
-        cur.execute(fmt('SELECT * FROM channels'))
-        rows = [dict(r) for r in cur.fetchall()]
-    cur.close(); cn.close()
-    return jsonify(rows)
+        return json_rows(conn(), 'SELECT * FROM channels WHERE LOWER(name)=LOWER(%s)', (name,))
+    return json_rows(conn(), 'SELECT * FROM channels')
 
 @app.route('/api/channels', methods=['POST'])
 def create_channel():
@@ -423,6 +1899,8 @@ def create_channel():
         cur.execute(fmt("INSERT INTO channels (id,name,created_by,owner_admin_id,is_active,created_at) VALUES (%s,%s,%s,%s,1,NOW())"),
                     (cid, name, creator_id, owner_admin_id))
         cn.commit()
+        directory.invalidate()
+        hub.publish('channel', {'action':'created','id':cid,'name':name,'owner_admin_id':owner_admin_id}, [owner_admin_id])
         return jsonify({'id':cid,'name':name,'created_by':creator_id,'owner_admin_id':owner_admin_id,'is_active':1,'created_at':datetime.now().isoformat()})
     except Exception as e:
         try:
@@ -440,42 +1918,626 @@ def patch_channel(cid):
     cn = conn(); cur = cn.cursor()
     if is_active is not None:
         cur.execute(fmt("UPDATE channels SET is_active=%s WHERE id=%s"), (1 if is_active else 0, cid))
+    cur.execute(fmt("SELECT owner_admin_id FROM channels WHERE id=%s"), (cid,))
+    r = cur.fetchone()
     cn.commit(); cur.close(); cn.close()
+    directory.invalidate()
+    hub.publish('channel', {'action':'updated','id':cid,'is_active':is_active}, [dict(r)['owner_admin_id']] if r else [])
     return jsonify({'status':'ok'})
 
 @app.route('/api/channels/<cid>', methods=['DELETE'])
 def delete_channel(cid):
     cn = conn(); cur = cn.cursor()
+    cur.execute(fmt("SELECT owner_admin_id FROM channels WHERE id=%s"), (cid,))
+    r = cur.fetchone()
+    owner = dict(r)['owner_admin_id'] if r else None
     cur.execute(fmt("SELECT id FROM customers WHERE channel_id=%s"), (cid,))
     custs = [dict(r)['id'] if USE_SQLITE else r['id'] for r in cur.fetchall()]
     if custs:
         cur.execute(fmt("DELETE FROM duplicates WHERE customer_id IN ("+ ",".join(["%s"]*len(custs))+")"), tuple(custs))
+        cur.execute(fmt("DELETE FROM duplicate_rollups WHERE customer_id IN ("+ ",".join(["%s"]*len(custs))+")"), tuple(custs))
         cur.execute(fmt("DELETE FROM customers WHERE id IN ("+ ",".join(["%s"]*len(custs))+")"), tuple(custs))
     cur.execute(fmt("DELETE FROM channels WHERE id=%s"), (cid,))
+    maintenance.note(cn.total_changes)
     cn.commit(); cur.close(); cn.close()
+    directory.invalidate()
+    hub.publish('channel', {'action':'deleted','id':cid}, [owner])
     return jsonify({'status':'ok'})
 
 @app.route('/api/customers', methods=['GET'])
 def get_customers():
-    cn = conn(); cur = cn.cursor()
-    cur.execute(fmt('SELECT * FROM customers'))
-    rows = [dict(r) for r in cur.fetchall()]
-    cur.close(); cn.close()
-    return jsonify(rows)
+    return json_rows(conn(), 'SELECT * FROM customers')
 
 @app.route('/api/duplicates', methods=['GET'])
 def get_duplicates():
-    cn = conn(); cur = cn.cursor()
-    cur.execute(fmt('SELECT * FROM duplicates'))
-    rows = [dict(r) for r in cur.fetchall()]
-    cur.close(); cn.close()
-    return jsonify(rows)
+    since_days = request.args.get('since_days')
+    if since_days:
+        try:
+            days = int(since_days)
+        except ValueError:
+            return jsonify({'error':'invalid'}), 400
+        if days < 0:
+            return jsonify({'error':'invalid'}), 400
+        return json_rows(conn(), "SELECT * FROM duplicates WHERE duplicate_ts >= %s", (now_ms() - days * BUCKETS['day'],))
+    return json_rows(conn(), 'SELECT * FROM duplicates')
 
-@app.route('/api/cleanup', methods=['POST'])
-def cleanup_orphan_duplicates():
-    cn = conn(); cur = cn.cursor()
+@app.route('/api/duplicates/rollups', methods=['GET'])
+def get_duplicate_rollups():
+    customer_id = request.args.get('customer_id')
+    if customer_id:
+        return json_rows(conn(), 'SELECT * FROM duplicate_rollups WHERE customer_id=%s', (customer_id,))
+    return json_rows(conn(), 'SELECT * FROM duplicate_rollups')
+
+@app.route('/api/duplicates/compact', methods=['POST'])
+def compact_duplicates_api():
+    if not super_admin_caller():
+        return jsonify({'error':'auth'}), 403
+    data = request.get_json(silent=True) or {}
+    archive = data.get('archive', True)
+    if isinstance(archive, str) and archive.lower() in ('1', 'true', '0', 'false'):
+        archive = archive.lower() in ('1', 'true')
+    if not isinstance(archive, bool):
+        return jsonify({'error':'invalid'}), 400
+    try:
+        res = compact_duplicates(data.get('retention_days'), archive)
+    except (TypeError, ValueError):
+        return jsonify({'error':'invalid'}), 400
+    except Exception as e:
+        app.logger.exception('duplicates compaction failed')
+        return jsonify({'error':'compact_failed','detail':str(e)}), 500
+    return jsonify({'status':'ok', **res})
+
+def caller(user_id):
+    r = directory.user(user_id)
+    if not r or not r['is_active']:
+        return None
+    return {'id': r['id'], 'role': r['role'], 'parent_id': r['parent_id']}
+
+# a cell starting with one of these is read as a formula by spreadsheet apps
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+def csv_cell(v):
+    return "'" + v if isinstance(v, str) and v.startswith(FORMULA_PREFIXES) else v
+
+def csv_stream(cn, cur, header, gz=False):
+    enc = zlib.compressobj(6, zlib.DEFLATED, 31) if gz else None
+    buf = io.StringIO()
+    w = csv.writer(buf, quoting=csv.QUOTE_ALL, lineterminator='\r\n')
+    try:
+        buf.write('\ufeff')
+        w.writerow(header)
+        while True:
+            rows = cur.fetchmany(EXPORT_BATCH)
+            if rows:
+                w.writerows([csv_cell(v) for v in r] for r in rows)
+            chunk = buf.getvalue().encode('utf-8')
+            buf.seek(0); buf.truncate()
+            if enc is not None:
+                chunk = enc.compress(chunk)
+            if chunk:
+                yield chunk
+            if not rows:
+                break
+        if enc is not None:
+            yield enc.flush()
+    finally:
+        cur.close(); cn.close()
+
+def export_response(gen, name, gz):
+    fname = name + ('.csv.gz' if gz else '.csv')
+    resp = Response(gen, mimetype='application/gzip' if gz else 'text/csv; charset=utf-8')
+    resp.headers['Content-Disposition'] = f'attachment; filename="{fname}"'
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
+
+def export_filters(col, channel_col, params):
+    wh = []
+    channel_id = request.args.get('channel_id')
+    tz = int(request.args.get('tz') or REPORT_TZ_OFFSET)
+    date_from = parse_ts(request.args.get('from'), tz)
+    date_to = parse_ts(request.args.get('to'), tz)
+    if channel_id:
+        wh.append(channel_col + "=%s"); params.append(channel_id)
+    if date_from is not None:
+        wh.append(col + ">=%s"); params.append(date_from)
+    if date_to is not None:
+        wh.append(col + "<%s"); params.append(date_to)
+    return wh
+
+@app.route('/api/export/customers', methods=['GET'])
+def export_customers():
+    gz = request.args.get('gzip') in ('1', 'true')
+    who = caller(request.args.get('user_id'))
+    if not who:
+        return jsonify({'error':'auth'}), 403
+    params = []
+    try:
+        wh = export_filters('c.created_ts', 'c.channel_id', params)
+    except ValueError:
+        return jsonify({'error':'invalid'}), 400
+    if who['role'] == 'admin':
+        wh.append("c.owner_admin_id=%s"); params.append(who['id'])
+    elif who['role'] == 'operator':
+        wh.append("c.owner_operator_id=%s"); params.append(who['id'])
+    sql = """
+        SELECT COALESCE(c.phone_normalized,''), COALESCE(ch.name,''), COALESCE(op.display_name,''), COALESCE(ad.display_name,''), c.created_at,
+               (SELECT COUNT(*) FROM duplicates d WHERE d.customer_id=c.id) + COALESCE((SELECT SUM(r.cnt) FROM duplicate_rollups r WHERE r.customer_id=c.id),0)
+        FROM customers c
+        LEFT JOIN channels ch ON ch.id=c.channel_id
+        LEFT JOIN users op ON op.id=c.owner_operator_id
+        LEFT JOIN users ad ON ad.id=c.owner_admin_id
+    """
+    if wh:
+        sql += " WHERE " + " AND ".join(wh)
+    cn = conn()
+    cn.row_factory = None
+    cur = cn.cursor()
+    cur.execute(fmt(sql), tuple(params))
+    return closing(export_response(csv_stream(cn, cur, ['手机号','渠道','运营','管理员','录入时间','被重复次数'], gz), 'customers', gz), cn)
+
+@app.route('/api/export/duplicates', methods=['GET'])
+def export_duplicates():
+    gz = request.args.get('gzip') in ('1', 'true')
+    who = caller(request.args.get('user_id'))
+    if not who:
+        return jsonify({'error':'auth'}), 403
+    params = []
+    try:
+        wh = export_filters('d.duplicate_ts', 'd.duplicate_channel_id', params)
+    except ValueError:
+        return jsonify({'error':'invalid'}), 400
+    if who['role'] == 'admin':
+        wh.append("dop.parent_id=%s"); params.append(who['id'])
+    elif who['role'] == 'operator':
+        wh.append("d.duplicate_operator_id=%s"); params.append(who['id'])
+    sql = """
+        SELECT COALESCE(c.phone_normalized,''), COALESCE(och.name,''), COALESCE(fop.display_name,''), COALESCE(c.created_at,''),
+               COALESCE(dch.name,''), COALESCE(dop.display_name,''), d.duplicate_at
+        FROM duplicates d
+        LEFT JOIN customers c ON c.id=d.customer_id
+        LEFT JOIN channels och ON och.id=c.channel_id
+        LEFT JOIN users fop ON fop.id=d.first_owner_id
+        LEFT JOIN channels dch ON dch.id=d.duplicate_channel_id
+        LEFT JOIN users dop ON dop.id=d.duplicate_operator_id
+    """
+    if wh:
+        sql += " WHERE " + " AND ".join(wh)
+    cn = conn()
+    cn.row_factory = None
+    cur = cn.cursor()
+    cur.execute(fmt(sql), tuple(params))
+    return closing(export_response(csv_stream(cn, cur, ['手机号','原渠道','原运营','原录入时间','重复渠道','重复运营','重复时间'], gz), 'duplicates', gz), cn)
+
+TIME_TABLES = {
+    'customers': {'ts': 'created_ts', 'channel': 'channel_id', 'operator': 'owner_operator_id', 'admin': 'owner_admin_id'},
+    'duplicates': {'ts': 'duplicate_ts', 'channel': 'duplicate_channel_id', 'operator': 'duplicate_operator_id', 'admin': None},
+}
+
+def time_filters(table, who, params):
+    t = TIME_TABLES[table]
+    tz = int(request.args.get('tz') or REPORT_TZ_OFFSET)
+    date_from = parse_ts(request.args.get('from'), tz)
+    date_to = parse_ts(request.args.get('to'), tz)
+    # the lower bound is always present so rows still waiting for the
+    # backfill (NULL) never leak into a range or a NULL bucket
+    wh = [t['ts'] + ">=%s"]; params.append(date_from if date_from is not None else 0)
+    if date_to is not None:
+        wh.append(t['ts'] + "<%s"); params.append(date_to)
+    channel_id = request.args.get('channel_id')
+    if channel_id:
+        wh.append(t['channel'] + "=%s"); params.append(channel_id)
+    if who['role'] == 'operator':
+        wh.append(t['operator'] + "=%s"); params.append(who['id'])
+    elif who['role'] == 'admin':
+        if t['admin']:
+            wh.append(t['admin'] + "=%s")
+        else:
+            wh.append(t['operator'] + " IN (SELECT id FROM users WHERE parent_id=%s)")
+        params.append(who['id'])
+    return wh, tz
+
+def time_range(table):
+    who = caller(request.args.get('user_id'))
+    if not who:
+        return jsonify({'error':'auth'}), 403
+    params = []
+    try:
+        wh, tz = time_filters(table, who, params)
+        limit = min(int(request.args.get('limit') or RANGE_LIMIT), RANGE_LIMIT)
+    except ValueError:
+        return jsonify({'error':'invalid'}), 400
+    ts = TIME_TABLES[table]['ts']
+    return json_rows(conn(), f"SELECT * FROM {table} WHERE {' AND '.join(wh)} ORDER BY {ts} LIMIT {limit}", params)
+
+def time_buckets(table):
+    who = caller(request.args.get('user_id'))
+    if not who:
+        return jsonify({'error':'auth'}), 403
+    size = BUCKETS.get(request.args.get('bucket') or 'day')
+    params = []
+    try:
+        wh, tz = time_filters(table, who, params)
+    except ValueError:
+        return jsonify({'error':'invalid'}), 400
+    if not size:
+        return jsonify({'error':'invalid'}), 400
+    # bucket = start of the local day/hour, as epoch ms
+    off = tz * 60000
+    ts = TIME_TABLES[table]['ts']
+    sql = f"SELECT (({ts} + %s) / %s) * %s - %s AS bucket, COUNT(*) AS count FROM {table} WHERE {' AND '.join(wh)} GROUP BY 1 ORDER BY 1"
+    return json_rows(conn(), sql, [off, size, size, off] + params)
+
+@app.route('/api/customers/range', methods=['GET'])
+def customers_range():
+    return time_range('customers')
+
+@app.route('/api/customers/buckets', methods=['GET'])
+def customers_buckets():
+    return time_buckets('customers')
+
+@app.route('/api/duplicates/range', methods=['GET'])
+def duplicates_range():
+    return time_range('duplicates')
+
+@app.route('/api/duplicates/buckets', methods=['GET'])
+def duplicates_buckets():
+    return time_buckets('duplicates')
+
+@app.route('/api/backfill', methods=['GET'])
+def backfill_status():
+    return jsonify(backfill.status())
+
+@app.route('/api/customers/match', methods=['GET'])
+def match_customers():
+    try:
+        normalized = normalize_phone(request.args.get('phone'))
+        policy = match_policy(request.args.get('policy') or MATCH_POLICY)
+        limit = min(max(int(request.args.get('limit') or 20), 1), MATCH_LIMIT)
+    except ValueError:
+        return jsonify({'error':'invalid'}), 400
+    who = caller(request.args.get('user_id'))
+    if not who:
+        return jsonify({'error':'auth'}), 403
+    cn = conn(); cur = cn.cursor()
+    try:
+        scope = None
+        if who['role'] == 'admin':
+            scope = ("owner_admin_id=%s", who['id'])
+        elif who['role'] == 'operator':
+            scope = ("owner_operator_id=%s", who['id'])
+        found = match_phone(cur, normalized, policy, limit, scope)
+    finally:
+        cur.close(); cn.close()
+    return jsonify({'phone': normalized, 'national': national_number(normalized), 'policy': list(policy), 'matches': found})
+
+@app.route('/api/customers/check', methods=['POST'])
+def check_customers():
+    data = request.get_json(force=True)
+    phones = data.get('phones')
+    if not isinstance(phones, list) or len(phones) > CHECK_MAX:
+        return jsonify({'error':'invalid'}), 400
+    try:
+        policy = match_policy(data.get('policy') or MATCH_POLICY)
+    except ValueError:
+        return jsonify({'error':'invalid'}), 400
+    who = caller(data.get('user_id'))
+    if not who:
+        return jsonify({'error':'auth'}), 403
+    normalized = []
+    for p in phones:
+        try:
+            normalized.append(normalize_phone(str(p)))
+        except Exception:
+            normalized.append(None)
+    cn = conn(); cur = cn.cursor()
+    try:
+        phone_index.sync(cur)
+        candidates = [n for n in {n for n in normalized if n} if not phone_index.absent(n, policy)]
+        found = match_many(cur, candidates, policy)
+    finally:
+        cur.close(); cn.close()
+    owner_col = {'admin': 'owner_admin_id', 'operator': 'owner_operator_id'}.get(who['role'])
+    rows = []
+    summary = {'new': 0, 'mine': 0, 'other': 0, 'invalid': 0}
+    for p, n in zip(phones, normalized):
+        hit = found.get(n) if n else None
+        if n is None:
+            row = (p, None, 'invalid', None, None)
+        elif hit is None:
+            row = (p, n, 'new', None, None)
+        else:
+            mine = owner_col is None or hit[owner_col] == who['id']
+            row = (p, n, 'mine' if mine else 'other', hit['rule'], channel_name(hit['channel_id']))
+        summary[row[2]] += 1
+        rows.append(row)
+    columns = ['phone', 'normalized', 'status', 'rule', 'channel']
+    if request.args.get('shape') != 'tuples':
+        rows = [dict(zip(columns, r)) for r in rows]
+        body = {'policy': list(policy), 'summary': summary, 'results': rows}
+    else:
+        body = {'policy': list(policy), 'summary': summary, 'columns': columns, 'rows': rows}
+    return Response(json_dumps(body), mimetype='application/json')
+
+USER_COLUMNS = 'id, username, display_name, role, parent_id, is_active, created_at'
+BOOTSTRAP_TABLES = [('customers', 'created_ts'), ('duplicates', 'duplicate_ts'), ('duplicate_rollups', 'last_at')]
+# another admin's customer that one of the caller's operators ran into: enough
+# to place the duplicate, never the number itself
+MASKED_CUSTOMER_COLUMNS = ("id, NULL AS phone_raw, '****' || SUBSTR(phone_normalized, -4) AS phone_normalized, NULL AS phone_hash, "
+                           "NULL AS national_hash, NULL AS phone_encrypted, NULL AS sig6, channel_id, owner_operator_id, owner_admin_id, "
+                           "created_at, created_ts, 1 AS masked")
+
+def bootstrap_scope(who):
+    # each table's slice is a list of WHERE branches that are each served by
+    # one index; an admin also gets, masked and uncounted, the other admins'
+    # customers its operators ran into as duplicates. first_owner_id is the
+    # customer's operator at insert time and customers never change owner, so
+    # it stands in for a join.
+    uid = who['id']
+    if who['role'] == 'super_admin':
+        return {'customers': [('1=1', [])], 'duplicates': [('1=1', [])], 'users': [('1=1', [])], 'channels': [('1=1', [])]}
+    if who['role'] == 'admin':
+        ops = "SELECT id FROM users WHERE role='operator' AND parent_id=%s"
+        return {
+            'customers': [("owner_admin_id=%s", [uid])],
+            'customer_refs': [(f"owner_admin_id IS NOT %s AND id IN (SELECT customer_id FROM duplicates WHERE duplicate_operator_id IN ({ops}))", [uid, uid])],
+            'duplicates': [(f"duplicate_operator_id IN ({ops})", [uid]), (f"first_owner_id IN ({ops})", [uid])],
+            'users': [("id=%s OR parent_id=%s", [uid, uid])],
+            'channels': [("owner_admin_id=%s", [uid])],
+        }
+    return {
+        'customers': [("owner_operator_id=%s", [uid])],
+        'duplicates': [("duplicate_operator_id=%s", [uid]), ("first_owner_id=%s", [uid])],
+        'users': [("id IN (%s, %s)", [uid, who['parent_id']])],
+        'channels': [("owner_admin_id=%s", [who['parent_id']])],
+    }
+
+def scope_where(branches):
+    return ' OR '.join(f'({w})' for w, _ in branches), [p for _, params in branches for p in params]
+
+def scope_rows(table, ts, branches, limit, columns='*'):
+    # newest-first pages take the top `limit` of every branch from its own
+    # index and sort only those; limit=0 streams the whole slice unsorted
+    if not limit:
+        where, params = scope_where(branches)
+        return f"SELECT {columns} FROM {table} WHERE {where}", params
+    parts = ' UNION '.join(f"SELECT id FROM (SELECT id FROM {table} WHERE {w} ORDER BY {ts} DESC LIMIT {limit})" for w, _ in branches)
+    return f"SELECT {columns} FROM {table} WHERE id IN ({parts}) ORDER BY {ts} DESC LIMIT {limit}", [p for _, params in branches for p in params]
+
+@app.route('/api/bootstrap', methods=['GET'])
+def bootstrap():
+    # everything the UI needs after login in one response and one read
+    # transaction, cut down to what the caller's role may see
+    who = caller(request.args.get('user_id'))
+    if not who:
+        return jsonify({'error':'auth'}), 403
+    try:
+        limit = max(0, int(request.args.get('limit', BOOTSTRAP_LIMIT)))
+    except ValueError:
+        return jsonify({'error':'invalid'}), 400
+    scope = bootstrap_scope(who)
+    # straight after a write the UI reloads from here, so it reads the primary
+    cn = conn()
+    cn.row_factory = None
+    cur = cn.cursor()
+
+    def gen():
+        try:
+            cur.execute("BEGIN")
+            counts = {}
+            for table in ('customers', 'duplicates', 'users', 'channels'):
+                where, params = scope_where(scope[table])
+                cur.execute(fmt(f"SELECT COUNT(*) FROM {table} WHERE {where}"), params)
+                counts[table] = cur.fetchone()[0]
+            # compacted duplicates still count; their rollups carry the same
+            # operator and first-owner columns the duplicates scope filters on
+            where, params = scope_where(scope['duplicates'])
+            cur.execute(fmt(f"SELECT COALESCE(SUM(cnt), 0) FROM duplicate_rollups WHERE {where}"), params)
+            counts['compacted_duplicates'] = cur.fetchone()[0]
+            counts['duplicates'] += counts['compacted_duplicates']
+            yield b'{"limit":' + json_dumps(limit) + b',"counts":' + json_dumps(counts)
+            # users and channels go last so the rows above can pull in every
+            # name they reference
+            refs = {'users': set(), 'channels': set()}
+            for table, ts in BOOTSTRAP_TABLES:
+                if table == 'duplicate_rollups':
+                    # one row per customer, operator and channel, and no id to page on
+                    where, params = scope_where(scope['duplicates'])
+                    queries = [(f"SELECT * FROM {table} WHERE {where}" + (f" ORDER BY {ts} DESC LIMIT {limit}" if limit else ''), params)]
+                else:
+                    queries = [scope_rows(table, ts, scope[table], limit)]
+                if table == 'customers' and scope.get('customer_refs'):
+                    queries.append(scope_rows(table, ts, scope['customer_refs'], limit, MASKED_CUSTOMER_COLUMNS))
+                yield f',"{table}":['.encode()
+                first = True
+                for sql, params in queries:
+                    cur.execute(fmt(sql), params)
+                    cols = [d[0] for d in cur.description]
+                    while True:
+                        rows = [dict(zip(cols, r)) for r in cur.fetchmany(JSON_BATCH)]
+                        if not rows:
+                            break
+                        for r in (rows if who['role'] != 'super_admin' else ()):
+                            if table == 'customers':
+                                refs['users'].update((r['owner_operator_id'], r['owner_admin_id'])); refs['channels'].add(r['channel_id'])
+                            else:
+                                refs['users'].update((r['first_owner_id'], r['duplicate_operator_id'])); refs['channels'].add(r['duplicate_channel_id'])
+                        body = json_dumps(rows)[1:-1]
+                        yield body if first else b',' + body
+                        first = False
+                yield b']'
+            small = {}
+            for table, columns in (('users', USER_COLUMNS), ('channels', '*')):
+                where, params = scope_where(scope[table])
+                cur.execute(fmt(f"SELECT {columns} FROM {table} WHERE {where} OR id IN (SELECT value FROM json_each(%s))"),
+                            params + [json.dumps(sorted(filter(None, refs[table])))])
+                cols = [d[0] for d in cur.description]
+                small[table] = [dict(zip(cols, r)) for r in cur.fetchall()]
+            me = next((u for u in small['users'] if u['id'] == who['id']), None)
+            yield b',"users":' + json_dumps(small['users']) + b',"channels":' + json_dumps(small['channels']) + b',"user":' + json_dumps(me) + b'}'
+            cur.execute("COMMIT")
+        finally:
+            cur.close(); cn.close()
+
+    return closing(Response(gen(), mimetype='application/json'), cn)
+
+@app.route('/api/events', methods=['GET'])
+def events():
+    who = caller(request.args.get('user_id'))
+    if not who:
+        return jsonify({'error':'auth'}), 403
+    try:
+        last = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0)
+    except ValueError:
+        last = 0
+    if not last:
+        last = hub.last_id()
+
+    def stream():
+        cursor = last
+        hub.subscribe(1)
+        try:
+            yield f'retry: 3000\nid: {cursor}\n\n' if cursor else 'retry: 3000\n\n'
+            while True:
+                evs, gap = hub.since(cursor)
+                if gap:
+                    # the client was away longer than the log covers, or holds an
+                    # id this log never issued: tell it to reload from here
+                    cursor = hub.last_id()
+                    yield f'id: {cursor}\nevent: reset\ndata: {{}}\n\n'
+                    continue
+                for ev in evs:
+                    cursor = ev[0]
+                    if hub.visible(ev, who):
+                        yield f'id: {ev[0]}\nevent: {ev[1]}\ndata: {ev[2]}\n\n'
+                if not evs and not hub.wait(cursor, EVENT_HEARTBEAT):
+                    yield ': ping\n\n'
+        finally:
+            hub.subscribe(-1)
+
+    resp = Response(stream(), mimetype='text/event-stream')
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['X-Accel-Buffering'] = 'no'
+    return resp
+
+@app.route('/api/events/status', methods=['GET'])
+def events_status():
+    return jsonify(hub.status())
+
+def super_admin_caller():
+    # operational settings and the slow query log (SQL text, plans, request
+    # paths) are only for the super admin
+    data = request.get_json(silent=True) or {}
+    who = caller(request.args.get('user_id') or data.get('user_id'))
+    return who is not None and who['role'] == 'super_admin'
+
+@app.route('/api/admission', methods=['GET'])
+def admission_status():
+    return jsonify(admission.status())
+
+@app.route('/api/admission', methods=['PATCH'])
+def patch_admission():
+    if not super_admin_caller():
+        return jsonify({'error':'auth'}), 403
+    data = request.get_json(force=True) or {}
+    try:
+        limits = admission.configure({k: v for k, v in data.items() if k != 'user_id'})
+    except (KeyError, ValueError, TypeError) as e:
+        return jsonify({'error':'invalid','detail':str(e)}), 400
+    return jsonify({'status':'ok','limits':limits})
+
+@app.route('/api/directory', methods=['GET'])
+def directory_status():
+    return jsonify(directory.status())
+
+@app.route('/api/slow_queries', methods=['GET'])
+def slow_queries():
+    if not super_admin_caller():
+        return jsonify({'error':'auth'}), 403
+    return jsonify(slow_log.status())
+
+@app.route('/api/slow_queries', methods=['PATCH'])
+def patch_slow_queries():
+    if not super_admin_caller():
+        return jsonify({'error':'auth'}), 403
+    data = request.get_json(silent=True) or {}
+    try:
+        if 'threshold_ms' in data:
+            slow_log.threshold_ms = float(data['threshold_ms'])
+        if 'size' in data:
+            slow_log.entries = deque(slow_log.entries, maxlen=max(1, int(data['size'])))
+    except (TypeError, ValueError):
+        return jsonify({'error':'invalid'}), 400
+    return jsonify(slow_log.status())
+
+@app.route('/api/slow_queries', methods=['DELETE'])
+def clear_slow_queries():
+    if not super_admin_caller():
+        return jsonify({'error':'auth'}), 403
+    slow_log.entries.clear()
+    return jsonify({'status':'ok'})
+
+@app.route('/api/profiles', methods=['GET'])
+def list_profiles():
+    if not profile_allowed():
+        return jsonify({'error':'auth'}), 403
+    names = sorted(os.listdir(PROFILE_DIR), reverse=True) if os.path.isdir(PROFILE_DIR) else []
+    return jsonify([{'name': n, 'size': os.path.getsize(os.path.join(PROFILE_DIR, n))} for n in names])
+
+@app.route('/api/profiles/<name>', methods=['GET'])
+def get_profile(name):
+    if not profile_allowed():
+        return jsonify({'error':'auth'}), 403
+    return send_from_directory(PROFILE_DIR, name, as_attachment=True)
+
+@app.route('/api/maintenance', methods=['GET'])
+def maintenance_status():
+    return jsonify(maintenance.status())
+
+@app.route('/api/maintenance', methods=['POST'])
+def run_maintenance():
+    if not super_admin_caller():
+        return jsonify({'error':'auth'}), 403
+    data = request.get_json(silent=True) or {}
+    integrity = data.get('integrity')
+    if integrity not in (None, 'off', 'quick', 'full'):
+        return jsonify({'error':'invalid'}), 400
+    if maintenance.running:
+        return jsonify({'error':'running'}), 409
+    if not data.get('wait'):
+        threading.Thread(target=maintenance.run, args=(integrity,), name='maintenance-now', daemon=True).start()
+        return jsonify({'status':'started'}), 202
+    report = maintenance.run(integrity)
+    if report is None:
+        return jsonify({'error':'running'}), 409
+    return jsonify({'status':'ok', 'report': report})
+
+@app.route('/api/phone_index', methods=['GET'])
+def phone_index_status():
+    cn = conn(); cur = cn.cursor()
+    try:
+        phone_index.sync(cur)
+    finally:
+        cur.close(); cn.close()
+    return jsonify({**phone_index.status(), 'pid': os.getpid(), 'generation': generation.value()})
+
+@app.route('/api/phone_index', methods=['POST'])
+def rebuild_phone_index():
+    if not super_admin_caller():
+        return jsonify({'error':'auth'}), 403
+    if not phone_index.enabled:
+        return jsonify({'error':'disabled'}), 409
+    build = phone_index.rebuild()
+    if build is None:
+        return jsonify({'error':'running'}), 409
+    return jsonify({'status':'ok', 'build': build})
+
+@app.route('/api/cleanup', methods=['POST'])
+def cleanup_orphan_duplicates():
+    cn = conn(); cur = cn.cursor()
     try:
         cur.execute(fmt("DELETE FROM duplicates WHERE customer_id NOT IN (SELECT id FROM customers)"))
+        cur.execute(fmt("DELETE FROM duplicate_rollups WHERE customer_id NOT IN (SELECT id FROM customers)"))
+        maintenance.note(cn.total_changes)
         cn.commit()
         return jsonify({'status':'ok'})
     except Exception as e:
@@ -488,6 +2550,7 @@ def cleanup_orphan_duplicates():
         cur.close(); cn.close()
 
 @app.route('/api/customers', methods=['POST'])
+@admitted()
 def create_customer():
     data = request.get_json(force=True)
     phone_raw = data.get('phone_raw')
@@ -495,50 +2558,117 @@ def create_customer():
     operator_id = data.get('operator_id')
     if not phone_raw or not channel_id or not operator_id:
         return jsonify({'error':'invalid'}), 400
-    cn = conn(); cur = cn.cursor()
-    cur.execute(fmt("SELECT parent_id FROM users WHERE id=%s AND role='operator'"), (operator_id,))
-    r = cur.fetchone()
-    if not r:
-        cur.close(); cn.close()
+    op = directory.user(operator_id)
+    if not op or op['role'] != 'operator':
         return jsonify({'error':'auth'}), 403
-    admin_id = dict(r)['parent_id'] if USE_SQLITE else r['parent_id']
+    admin_id = op['parent_id']
     try:
         normalized = normalize_phone(phone_raw)
     except Exception:
-        cur.close(); cn.close()
         return jsonify({'error':'invalid'}), 400
+    cn = conn(); cur = cn.cursor()
     phone_hash = sha256_hex(normalized)
     phone_encrypted = normalized.encode('utf-8').hex()
     s6 = sig6(normalized)
-    try:
-        cust_id = rid()
-        cur.execute(fmt("INSERT INTO customers (id,phone_raw,phone_normalized,phone_hash,phone_encrypted,sig6,channel_id,owner_operator_id,owner_admin_id,created_at) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,NOW())"),
-                    (cust_id, phone_raw, normalized, phone_hash, phone_encrypted, s6, channel_id, operator_id, admin_id))
-        cn.commit(); cur.close(); cn.close()
+    # hold the write lock from lookup to insert so two requests cannot both miss
+    cur.execute("BEGIN IMMEDIATE")
+    phone_index.sync(cur)
+    found = [] if phone_index.absent(normalized) else match_phone(cur, normalized)
+    if not found:
+        try:
+            cust_id = rid()
+            nh = national_hash(normalized)
+            cur.execute(fmt("INSERT INTO customers (id,phone_raw,phone_normalized,phone_hash,national_hash,phone_encrypted,sig6,channel_id,owner_operator_id,owner_admin_id,created_at,created_ts) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,NOW(),%s)"),
+                        (cust_id, phone_raw, normalized, phone_hash, nh, phone_encrypted, s6, channel_id, operator_id, admin_id, now_ms()))
+            cn.commit()
+        except Exception:
+            cn.rollback(); cur.close(); cn.close()
+            return jsonify({'error':'conflict'}), 409
+        cur.execute(fmt("SELECT * FROM customers WHERE id=%s"), (cust_id,))
+        row = dict(cur.fetchone())
+        cur.close(); cn.close()
+        hub.publish('customer', row, [admin_id], [operator_id])
         return jsonify({'status':'success'})
-    except Exception:
-        cur.execute(fmt("SELECT * FROM customers WHERE (phone_hash=%s OR sig6=%s) ORDER BY created_at ASC LIMIT 1"), (phone_hash, s6))
-        existing = cur.fetchone()
-        if not existing:
-            cur.execute(fmt("SELECT * FROM customers WHERE owner_admin_id=%s AND REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(phone_normalized,' ',''),'+',''),'(',''),')',''),'-',''),'－',''),'—','')=%s ORDER BY created_at ASC LIMIT 1"), (admin_id, normalized))
-            existing = cur.fetchone()
-        if existing:
+    ex = found[0]
+    dup_id = rid()
+    ch_name = channel_name(ex['channel_id'])
+    cur.execute(fmt("INSERT INTO duplicates (id,customer_id,first_owner_id,duplicate_operator_id,duplicate_channel_id,duplicate_at,duplicate_ts) VALUES (%s,%s,%s,%s,%s,NOW(),%s)"),
+                (dup_id, ex['id'], ex['owner_operator_id'], operator_id, channel_id, now_ms()))
+    cn.commit()
+    cur.execute(fmt("SELECT * FROM duplicates WHERE id=%s"), (dup_id,))
+    drow = dict(cur.fetchone())
+    cur.close(); cn.close()
+    hub.publish('duplicate', {**drow, 'existing_owner':ex['owner_operator_id'], 'existing_channel_id':ex['channel_id'], 'existing_channel_name':ch_name, 'rule':ex['rule']},
+                [admin_id, ex['owner_admin_id']], [operator_id, ex['owner_operator_id']])
+    return jsonify({'status':'duplicate','existing_owner':ex['owner_operator_id'],'existing_created_at':ex['created_at'],'existing_channel_id':ex['channel_id'],'existing_channel_name': ch_name,'rule':ex['rule']})
+
+def import_phones(cur, phones, channel_id, operator_id, admin_id):
+    # the body of a batch import, run inside the caller's write transaction
+    success = 0
+    duplicate = 0
+    failed = 0
+    duplicate_sources = set()
+    duplicate_rules = {}
+    failed_reasons = []
+    added = set()
+    phone_index.sync(cur)
+    for p in phones:
+        try:
+            if p is None or str(p).strip()=='':
+                failed += 1
+                failed_reasons.append('空行')
+                continue
+        except Exception:
+            failed += 1
+            failed_reasons.append('空行')
+            continue
+        try:
+            normalized = normalize_phone(p)
+        except Exception:
+            failed += 1
+            try:
+                failed_reasons.append(f"{str(p)[:32]} (格式错误)")
+            except Exception:
+                failed_reasons.append('格式错误')
+            continue
+        phone_hash = sha256_hex(normalized)
+        phone_encrypted = normalized.encode('utf-8').hex()
+        s6 = sig6(normalized)
+        found = [] if phone_index.absent(normalized, added=added) else match_phone(cur, normalized)
+        if found:
             dup_id = rid()
-            ex = dict(existing)
-            ch_name = ''
+            exd = found[0]
+            cur.execute(fmt("INSERT INTO duplicates (id,customer_id,first_owner_id,duplicate_operator_id,duplicate_channel_id,duplicate_at,duplicate_ts) VALUES (%s,%s,%s,%s,%s,NOW(),%s)"),
+                        (dup_id, exd['id'], exd['owner_operator_id'], operator_id, channel_id, now_ms()))
+            duplicate += 1
+            duplicate_rules[exd['rule']] = duplicate_rules.get(exd['rule'], 0) + 1
+            nm = channel_name(exd.get('channel_id'))
+            if nm:
+                duplicate_sources.add(nm)
+            continue
+        try:
+            cust_id = rid()
+            nh = national_hash(normalized)
+            cur.execute(fmt("INSERT INTO customers (id,phone_raw,phone_normalized,phone_hash,national_hash,phone_encrypted,sig6,channel_id,owner_operator_id,owner_admin_id,created_at,created_ts) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,NOW(),%s)"),
+                        (cust_id, p, normalized, phone_hash, nh, phone_encrypted, s6, channel_id, operator_id, admin_id, now_ms()))
+            added.update((index_key(phone_hash), index_key(nh)))
+            success += 1
+        except Exception:
+            failed += 1
             try:
-                cur.execute(fmt("SELECT name FROM channels WHERE id=%s"), (ex['channel_id'],))
-                rch = cur.fetchone(); ch_name = (dict(rch)['name'] if rch else '') if USE_SQLITE else (rch['name'] if rch else '')
+                failed_reasons.append(f"{str(p)[:32]} (插入失败)")
             except Exception:
-                ch_name = ''
-            cur.execute(fmt("INSERT INTO duplicates (id,customer_id,first_owner_id,duplicate_operator_id,duplicate_channel_id,duplicate_at) VALUES (%s,%s,%s,%s,%s,NOW())"),
-                        (dup_id, ex['id'], ex['owner_operator_id'], operator_id, channel_id))
-            cn.commit(); cur.close(); cn.close()
-            return jsonify({'status':'duplicate','existing_owner':ex['owner_operator_id'],'existing_created_at':ex['created_at'],'existing_channel_id':ex['channel_id'],'existing_channel_name': ch_name})
-        cn.commit(); cur.close(); cn.close()
-        return jsonify({'error':'conflict'}), 409
+                failed_reasons.append('插入失败')
+    return {'success': success, 'duplicate': duplicate, 'failed': failed, 'duplicate_channels': list(duplicate_sources),
+            'duplicate_rules': duplicate_rules, 'failed_samples': failed_reasons[:5]}
+
+def publish_import(stats, operator_id, channel_id, admin_id):
+    if stats['success'] or stats['duplicate']:
+        hub.publish('import', {'operator_id':operator_id,'channel_id':channel_id,'success':stats['success'],'duplicate':stats['duplicate'],'failed':stats['failed'],'duplicate_channels':stats['duplicate_channels']},
+                    [admin_id], [operator_id])
 
 @app.route('/api/customers/batch', methods=['POST'])
+@admitted(batch=True)
 def batch_create_customers():
     try:
         data = request.get_json(force=True)
@@ -547,105 +2677,23 @@ def batch_create_customers():
         operator_id = data.get('operator_id')
         if not isinstance(phones, list) or not channel_id or not operator_id:
             return jsonify({'error':'invalid'}), 400
-        cn = conn(); cur = cn.cursor()
-        cur.execute(fmt("SELECT parent_id FROM users WHERE id=%s AND role='operator'"), (operator_id,))
-        r = cur.fetchone()
-        if not r:
+        op = directory.user(operator_id)
+        if not op or op['role'] != 'operator':
             return jsonify({'error':'auth'}), 403
-        admin_id = (dict(r)['parent_id'] if USE_SQLITE else r['parent_id'])
-        success = 0
-        duplicate = 0
-        failed = 0
-        channel_cache = {}
-        duplicate_sources = set()
-        failed_reasons = []
-        for p in phones:
-            try:
-                if p is None or str(p).strip()=='':
-                    failed += 1
-                    failed_reasons.append('空行')
-                    continue
-            except Exception:
-                failed += 1
-                failed_reasons.append('空行')
-                continue
-            try:
-                normalized = normalize_phone(p)
-            except Exception:
-                failed += 1
-                try:
-                    failed_reasons.append(f"{str(p)[:32]} (格式错误)")
-                except Exception:
-                    failed_reasons.append('格式错误')
-                continue
-            phone_hash = sha256_hex(normalized)
-            phone_encrypted = normalized.encode('utf-8').hex()
-            s6 = sig6(normalized)
-            cur.execute(fmt("SELECT id, owner_operator_id, channel_id, created_at FROM customers WHERE phone_hash=%s AND owner_admin_id=%s LIMIT 1"), (phone_hash, admin_id))
-            ex = cur.fetchone()
-            if ex:
-                dup_id = rid()
-                exd = dict(ex) if USE_SQLITE else ex
-                cur.execute(fmt("INSERT INTO duplicates (id,customer_id,first_owner_id,duplicate_operator_id,duplicate_channel_id,duplicate_at) VALUES (%s,%s,%s,%s,%s,NOW())"),
-                            (dup_id, exd['id'], exd['owner_operator_id'], operator_id, channel_id))
-                duplicate += 1
-                try:
-                    ex_ch = exd.get('channel_id')
-                    if ex_ch:
-                        nm = channel_cache.get(ex_ch)
-                        if nm is None:
-                            cur.execute(fmt("SELECT name FROM channels WHERE id=%s"), (ex_ch,))
-                            rr = cur.fetchone()
-                            nm = (dict(rr)['name'] if rr else '') if USE_SQLITE else (rr['name'] if rr else '')
-                            channel_cache[ex_ch] = nm or ''
-                        if nm:
-                            duplicate_sources.add(nm)
-                except Exception:
-                    pass
-                continue
-            try:
-                cust_id = rid()
-                cur.execute(fmt("INSERT INTO customers (id,phone_raw,phone_normalized,phone_hash,phone_encrypted,sig6,channel_id,owner_operator_id,owner_admin_id,created_at) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,NOW())"),
-                            (cust_id, p, normalized, phone_hash, phone_encrypted, s6, channel_id, operator_id, admin_id))
-                success += 1
-            except Exception:
-                cur.execute(fmt("SELECT * FROM customers WHERE (phone_hash=%s OR sig6=%s) ORDER BY created_at ASC LIMIT 1"), (phone_hash, s6))
-                existing = cur.fetchone()
-                if existing:
-                    dup_id = rid()
-                    ex = dict(existing) if USE_SQLITE else existing
-                    cur.execute(fmt("INSERT INTO duplicates (id,customer_id,first_owner_id,duplicate_operator_id,duplicate_channel_id,duplicate_at) VALUES (%s,%s,%s,%s,%s,NOW())"),
-                                (dup_id, ex['id'], ex['owner_operator_id'], operator_id, channel_id))
-                    duplicate += 1
-                    try:
-                        ex_ch = ex.get('channel_id') if isinstance(ex, dict) else (ex['channel_id'])
-                        if ex_ch:
-                            nm = channel_cache.get(ex_ch)
-                            if nm is None:
-                                cur.execute(fmt("SELECT name FROM channels WHERE id=%s"), (ex_ch,))
-                                rr = cur.fetchone()
-                                nm = (dict(rr)['name'] if rr else '') if USE_SQLITE else (rr['name'] if rr else '')
-                                channel_cache[ex_ch] = nm or ''
-                            if nm:
-                                duplicate_sources.add(nm)
-                    except Exception:
-                        pass
-                else:
-                    failed += 1
-                    try:
-                        failed_reasons.append(f"{str(p)[:32]} (插入失败)")
-                    except Exception:
-                        failed_reasons.append('插入失败')
+        admin_id = op['parent_id']
+        cn = conn(); cur = cn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        stats = import_phones(cur, phones, channel_id, operator_id, admin_id)
         cn.commit()
-        dup_list = list(duplicate_sources)
-        failed_samples = failed_reasons[:5]
-        return jsonify({'status':'ok','stats': {'success': success, 'duplicate': duplicate, 'failed': failed, 'duplicate_channels': dup_list, 'failed_samples': failed_samples}})
+        maintenance.note(cn.total_changes)
+        publish_import(stats, operator_id, channel_id, admin_id)
+        return jsonify({'status':'ok','stats': stats})
     except Exception as e:
         try:
             cn.rollback()
         except Exception:
             pass
-        print(traceback.format_exc())
+        app.logger.exception('batch import failed')
         return jsonify({'error':'server_error','detail': str(e)}), 500
     finally:
         try:
@@ -653,6 +2701,165 @@ def batch_create_customers():
         except Exception:
             pass
 
+def chunk_checksum(phones):
+    return sha256_hex('\n'.join('' if p is None else str(p) for p in phones))
+
+def import_session(sid):
+    cn = conn(); cur = cn.cursor()
+    try:
+        cur.execute(fmt("SELECT * FROM import_sessions WHERE id=%s"), (sid,))
+        r = cur.fetchone()
+        return dict(r) if r else None
+    finally:
+        cur.close(); cn.close()
+
+def merge_stats(chunks):
+    out = {'success': 0, 'duplicate': 0, 'failed': 0, 'duplicate_channels': [], 'duplicate_rules': {}, 'failed_samples': []}
+    channels = set()
+    for st in chunks:
+        for k in ('success', 'duplicate', 'failed'):
+            out[k] += st[k]
+        channels.update(st['duplicate_channels'])
+        for rule, n in st['duplicate_rules'].items():
+            out['duplicate_rules'][rule] = out['duplicate_rules'].get(rule, 0) + n
+        out['failed_samples'] += st['failed_samples'][:5 - len(out['failed_samples'])]
+    out['duplicate_channels'] = sorted(channels)
+    return out
+
+@app.route('/api/imports', methods=['POST'])
+def open_import():
+    data = request.get_json(force=True)
+    channel_id = data.get('channel_id')
+    operator_id = data.get('operator_id')
+    total = data.get('total_chunks')
+    if not channel_id or not operator_id or (total is not None and (not isinstance(total, int) or total < 1)):
+        return jsonify({'error':'invalid'}), 400
+    op = directory.user(operator_id)
+    if not op or op['role'] != 'operator':
+        return jsonify({'error':'auth'}), 403
+    sid = rid()
+    cn = conn(); cur = cn.cursor()
+    try:
+        cur.execute(fmt("DELETE FROM import_chunks WHERE session_id IN (SELECT id FROM import_sessions WHERE created_ts<%s)"), (now_ms() - IMPORT_SESSION_TTL * 1000,))
+        cur.execute(fmt("DELETE FROM import_sessions WHERE created_ts<%s"), (now_ms() - IMPORT_SESSION_TTL * 1000,))
+        cur.execute(fmt("INSERT INTO import_sessions (id,operator_id,admin_id,channel_id,total_chunks,status,created_ts) VALUES (%s,%s,%s,%s,%s,'open',%s)"),
+                    (sid, operator_id, op['parent_id'], channel_id, total, now_ms()))
+        cn.commit()
+    finally:
+        cur.close(); cn.close()
+    return jsonify({'id': sid, 'chunk_max': IMPORT_CHUNK_MAX, 'expires_in': IMPORT_SESSION_TTL})
+
+def chunk_recorded(kwargs, data):
+    cn = conn(); cur = cn.cursor()
+    try:
+        cur.execute(fmt("SELECT 1 FROM import_chunks WHERE session_id=%s AND seq=%s"), (kwargs['sid'], kwargs['seq']))
+        return cur.fetchone() is not None
+    finally:
+        cur.close(); cn.close()
+
+@app.route('/api/imports/<sid>', methods=['GET'])
+def get_import(sid):
+    sess = import_session(sid)
+    if not sess:
+        return jsonify({'error':'notfound'}), 404
+    if request.args.get('operator_id') != sess['operator_id']:
+        return jsonify({'error':'auth'}), 403
+    cn = conn(); cur = cn.cursor()
+    try:
+        cur.execute(fmt("SELECT seq, checksum FROM import_chunks WHERE session_id=%s ORDER BY seq"), (sid,))
+        chunks = [dict(r) for r in cur.fetchall()]
+    finally:
+        cur.close(); cn.close()
+    sess['stats'] = json.loads(sess['stats']) if sess['stats'] else None
+    return jsonify({**sess, 'received': [c['seq'] for c in chunks], 'checksums': {c['seq']: c['checksum'] for c in chunks}})
+
+@app.route('/api/imports/<sid>/chunks/<int:seq>', methods=['PUT'])
+@admitted(batch=True, free=chunk_recorded)
+def put_import_chunk(sid, seq):
+    data = request.get_json(force=True)
+    sess = import_session(sid)
+    if not sess:
+        return jsonify({'error':'notfound'}), 404
+    if data.get('operator_id') != sess['operator_id']:
+        return jsonify({'error':'auth'}), 403
+    phones = data.get('phones')
+    if not isinstance(phones, list) or len(phones) > IMPORT_CHUNK_MAX:
+        return jsonify({'error':'invalid'}), 400
+    checksum = chunk_checksum(phones)
+    if data.get('checksum') != checksum:
+        return jsonify({'error':'checksum', 'expected': checksum}), 422
+    if sess['total_chunks'] is not None and not 0 <= seq < sess['total_chunks']:
+        return jsonify({'error':'invalid'}), 400
+    cn = conn(); cur = cn.cursor()
+    try:
+        # the chunk row is written in the same transaction as its customers,
+        # so a chunk is either fully imported and recorded or not at all
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute(fmt("SELECT status FROM import_sessions WHERE id=%s"), (sid,))
+        r = cur.fetchone()
+        if r is None:
+            # purged as expired since the lookup above
+            cn.rollback()
+            return jsonify({'error':'notfound'}), 404
+        if r['status'] != 'open':
+            cn.rollback()
+            return jsonify({'error':'finalized'}), 409
+        cur.execute(fmt("SELECT checksum, stats FROM import_chunks WHERE session_id=%s AND seq=%s"), (sid, seq))
+        done = cur.fetchone()
+        if done:
+            cn.rollback()
+            if done['checksum'] != checksum:
+                return jsonify({'error':'conflict', 'checksum': done['checksum']}), 409
+            return jsonify({'status':'replayed', 'seq': seq, 'stats': json.loads(done['stats'])})
+        stats = import_phones(cur, phones, sess['channel_id'], sess['operator_id'], sess['admin_id'])
+        cur.execute(fmt("INSERT INTO import_chunks (session_id,seq,checksum,count,stats,created_ts) VALUES (%s,%s,%s,%s,%s,%s)"),
+                    (sid, seq, checksum, len(phones), json.dumps(stats, ensure_ascii=False), now_ms()))
+        cn.commit()
+        maintenance.note(cn.total_changes)
+    except Exception as e:
+        cn.rollback()
+        app.logger.exception('import chunk %s/%s failed', sid, seq)
+        return jsonify({'error':'server_error','detail': str(e)}), 500
+    finally:
+        cur.close(); cn.close()
+    return jsonify({'status':'ok', 'seq': seq, 'stats': stats})
+
+@app.route('/api/imports/<sid>/finalize', methods=['POST'])
+def finalize_import(sid):
+    data = request.get_json(force=True, silent=True) or {}
+    sess = import_session(sid)
+    if not sess:
+        return jsonify({'error':'notfound'}), 404
+    if data.get('operator_id') != sess['operator_id']:
+        return jsonify({'error':'auth'}), 403
+    cn = conn(); cur = cn.cursor()
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute(fmt("SELECT status, stats FROM import_sessions WHERE id=%s"), (sid,))
+        r = cur.fetchone()
+        if r is None:
+            cn.rollback()
+            return jsonify({'error':'notfound'}), 404
+        if r['status'] == 'finalized':
+            cn.rollback()
+            return jsonify({'status':'ok', 'stats': json.loads(r['stats'])})
+        cur.execute(fmt("SELECT seq, stats FROM import_chunks WHERE session_id=%s ORDER BY seq"), (sid,))
+        rows = cur.fetchall()
+        if sess['total_chunks'] is not None:
+            missing = sorted(set(range(sess['total_chunks'])) - {r['seq'] for r in rows})
+            if missing:
+                cn.rollback()
+                return jsonify({'error':'incomplete', 'missing': missing[:100]}), 409
+        stats = merge_stats(json.loads(r['stats']) for r in rows)
+        stats['chunks'] = len(rows)
+        cur.execute(fmt("UPDATE import_sessions SET status='finalized', stats=%s, finalized_ts=%s WHERE id=%s"),
+                    (json.dumps(stats, ensure_ascii=False), now_ms(), sid))
+        cn.commit()
+    finally:
+        cur.close(); cn.close()
+    publish_import(stats, sess['operator_id'], sess['channel_id'], sess['admin_id'])
+    return jsonify({'status':'ok', 'stats': stats})
+
 @app.route('/api/migrate/normalize_phones', methods=['POST'])
 def migrate_normalize_phones():
     cn = conn(); cur = cn.cursor()
@@ -670,7 +2877,7 @@ def migrate_normalize_phones():
             normalized = normalize_phone(raw)
             phone_hash = sha256_hex(normalized)
             s6 = sig6(normalized)
-            cur.execute(fmt('UPDATE customers SET phone_normalized=%s, phone_hash=%s, sig6=%s WHERE id=%s'), (normalized, phone_hash, s6, cid))
+            cur.execute(fmt('UPDATE customers SET phone_normalized=%s, phone_hash=%s, national_hash=%s, sig6=%s WHERE id=%s'), (normalized, phone_hash, national_hash(normalized), s6, cid))
             updated += 1
             ok = True
         except Exception:
@@ -685,22 +2892,24 @@ def migrate_normalize_phones():
                 normalized = normalize_phone(prev)
                 phone_hash = sha256_hex(normalized)
                 s6 = sig6(normalized)
-                cur.execute(fmt('UPDATE customers SET phone_normalized=%s, phone_hash=%s, sig6=%s WHERE id=%s'), (normalized, phone_hash, s6, cid))
+                cur.execute(fmt('UPDATE customers SET phone_normalized=%s, phone_hash=%s, national_hash=%s, sig6=%s WHERE id=%s'), (normalized, phone_hash, national_hash(normalized), s6, cid))
                 updated += 1
             except Exception:
                 skipped += 1
     cn.commit(); cur.close(); cn.close()
     return jsonify({'status':'ok','total': total, 'updated': updated, 'skipped': skipped})
 
-@app.route('/api/migrate/dedup_customers', methods=['POST'])
-def migrate_dedup_customers():
+def dedup_customers():
     cn = conn(); cur = cn.cursor()
-    cur.execute(fmt("SELECT sig6 AS s6, COUNT(*) AS cnt FROM customers GROUP BY s6 HAVING COUNT(*)>1"))
+    # also reachable through /api/migrate/dedup_customers after epoch_columns added duplicate_ts
+    cur.execute("PRAGMA table_info(duplicates)")
+    has_ts = any(c['name'] == 'duplicate_ts' for c in cur.fetchall())
+    cur.execute(fmt("SELECT phone_hash AS h, COUNT(*) AS cnt FROM customers GROUP BY h HAVING COUNT(*)>1"))
     groups = cur.fetchall()
     fixed = 0
     for g in groups:
-        s6 = (dict(g)['s6'] if USE_SQLITE else g['s6'])
-        cur.execute(fmt("SELECT * FROM customers WHERE sig6=%s ORDER BY created_at ASC"), (s6,))
+        h = (dict(g)['h'] if USE_SQLITE else g['h'])
+        cur.execute(fmt("SELECT * FROM customers WHERE phone_hash=%s ORDER BY created_at ASC"), (h,))
         rows = cur.fetchall()
         if not rows:
             continue
@@ -708,34 +2917,264 @@ def migrate_dedup_customers():
         for rr in rows[1:]:
             r = dict(rr) if USE_SQLITE else rr
             dup_id = rid()
-            cur.execute(fmt("INSERT INTO duplicates (id,customer_id,first_owner_id,duplicate_operator_id,duplicate_channel_id,duplicate_at) VALUES (%s,%s,%s,%s,%s,%s)"),
-                        (dup_id, first['id'], first['owner_operator_id'], r['owner_operator_id'], r['channel_id'], r['created_at']))
+            if has_ts:
+                cur.execute(fmt(f"INSERT INTO duplicates (id,customer_id,first_owner_id,duplicate_operator_id,duplicate_channel_id,duplicate_at,duplicate_ts) VALUES (%s,%s,%s,%s,%s,%s,{EPOCH_MS.format('%s')})"),
+                            (dup_id, first['id'], first['owner_operator_id'], r['owner_operator_id'], r['channel_id'], r['created_at'], r['created_at']))
+            else:
+                cur.execute(fmt("INSERT INTO duplicates (id,customer_id,first_owner_id,duplicate_operator_id,duplicate_channel_id,duplicate_at) VALUES (%s,%s,%s,%s,%s,%s)"),
+                            (dup_id, first['id'], first['owner_operator_id'], r['owner_operator_id'], r['channel_id'], r['created_at']))
             cur.execute(fmt("DELETE FROM customers WHERE id=%s"), (r['id'],))
             fixed += 1
+    maintenance.note(cn.total_changes)
     cn.commit(); cur.close(); cn.close()
-    return jsonify({'status':'ok','fixed': fixed})
+    return fixed
+
+@app.route('/api/migrate/dedup_customers', methods=['POST'])
+def migrate_dedup_customers():
+    return jsonify({'status':'ok','fixed': dedup_customers()})
 
 def ensure_unique_index_customers():
     cn = conn(); cur = cn.cursor()
     try:
         cur.execute(fmt("CREATE UNIQUE INDEX IF NOT EXISTS idx_customers_hash ON customers(phone_hash)"))
-        try:
-            cur.execute(fmt("CREATE UNIQUE INDEX IF NOT EXISTS idx_customers_sig6 ON customers(sig6)"))
-        except Exception:
-            pass
         cn.commit()
     finally:
         cur.close(); cn.close()
 
-if __name__ == '__main__':
-    init_db()
-    ensure_channels_name_not_unique()
-    ensure_super_admin()
-    ensure_sig6_column()
-    ensure_migration_normalize_phones()
+def ensure_match_index():
+    # sig6 used to be UNIQUE, which made different numbers sharing a tail
+    # collide; suffix is now a non-unique candidate key ranked below exact
+    cn = conn(); cur = cn.cursor()
     try:
-        migrate_dedup_customers()
-    except Exception:
-        pass
-    ensure_unique_index_customers()
+        cur.execute("PRAGMA table_info(customers)")
+        cols = [dict(r)['name'] for r in cur.fetchall()]
+        if 'national_hash' not in cols:
+            cur.execute(fmt("ALTER TABLE customers ADD COLUMN national_hash VARCHAR(64)"))
+        cn.create_function('national_hash', 1, national_hash, deterministic=True)
+        cur.execute(fmt("UPDATE customers SET national_hash=national_hash(phone_normalized) WHERE national_hash IS NULL"))
+        cur.execute(fmt("DROP INDEX IF EXISTS idx_customers_sig6"))
+        cur.execute(fmt("DROP INDEX IF EXISTS idx_customers_owner_sig6"))
+        cur.execute(fmt("CREATE INDEX IF NOT EXISTS idx_customers_national ON customers(national_hash, created_at)"))
+        cur.execute(fmt("CREATE INDEX IF NOT EXISTS idx_customers_suffix ON customers(sig6, created_at)"))
+        cn.commit()
+    finally:
+        cur.close(); cn.close()
+
+def ensure_epoch_columns():
+    # ADD COLUMN is instant; the values are filled by the online backfill.
+    # The channel indexes carry the owner columns so a scoped per-channel
+    # report is answered from the index alone.
+    cn = conn(); cur = cn.cursor()
+    try:
+        for table, text, ts in TS_COLUMNS:
+            cur.execute(f"PRAGMA table_info({table})")
+            if ts not in [dict(r)['name'] for r in cur.fetchall()]:
+                cur.execute(f"ALTER TABLE {table} ADD COLUMN {ts} INTEGER")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_customers_ts ON customers(created_ts)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_customers_admin_ts ON customers(owner_admin_id, created_ts)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_customers_operator_ts ON customers(owner_operator_id, created_ts)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_customers_channel_ts ON customers(channel_id, created_ts, owner_admin_id, owner_operator_id)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_duplicates_ts ON duplicates(duplicate_ts)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_duplicates_operator_ts ON duplicates(duplicate_operator_id, duplicate_ts)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_duplicates_channel_ts ON duplicates(duplicate_channel_id, duplicate_ts, duplicate_operator_id)")
+        cn.commit()
+    finally:
+        cur.close(); cn.close()
+
+def ensure_bootstrap_index():
+    # per-role bootstrap reads duplicates of a customer's owner newest first
+    cn = conn(); cur = cn.cursor()
+    try:
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_duplicates_owner_ts ON duplicates(first_owner_id, duplicate_ts)")
+        cn.commit()
+    finally:
+        cur.close(); cn.close()
+
+def ensure_phone_index_log():
+    # every write to a customer's keys lands here in the writer's own
+    # transaction; PhoneIndex workers tail it by seq
+    cn = conn(); cur = cn.cursor()
+    try:
+        cur.execute("CREATE TABLE IF NOT EXISTS phone_index_log (seq INTEGER PRIMARY KEY AUTOINCREMENT, phone_hash VARCHAR(64), national_hash VARCHAR(64))")
+        cur.execute("""CREATE TRIGGER IF NOT EXISTS customers_phone_index_insert AFTER INSERT ON customers
+                       BEGIN INSERT INTO phone_index_log (phone_hash, national_hash) VALUES (NEW.phone_hash, NEW.national_hash); END""")
+        cur.execute("""CREATE TRIGGER IF NOT EXISTS customers_phone_index_update AFTER UPDATE OF phone_hash, national_hash ON customers
+                       BEGIN INSERT INTO phone_index_log (phone_hash, national_hash) VALUES (NEW.phone_hash, NEW.national_hash); END""")
+        cn.commit()
+    finally:
+        cur.close(); cn.close()
+
+def ensure_import_sessions():
+    cn = conn(); cur = cn.cursor()
+    try:
+        cur.execute("""CREATE TABLE IF NOT EXISTS import_sessions (
+          id VARCHAR(64) PRIMARY KEY,
+          operator_id VARCHAR(64),
+          admin_id VARCHAR(64),
+          channel_id VARCHAR(64),
+          total_chunks INTEGER,
+          status VARCHAR(16),
+          stats TEXT,
+          created_ts INTEGER,
+          finalized_ts INTEGER
+        )""")
+        cur.execute("""CREATE TABLE IF NOT EXISTS import_chunks (
+          session_id VARCHAR(64),
+          seq INTEGER,
+          checksum VARCHAR(64),
+          count INTEGER,
+          stats TEXT,
+          created_ts INTEGER,
+          PRIMARY KEY (session_id, seq)
+        )""")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_import_sessions_ts ON import_sessions(created_ts)")
+        cn.commit()
+    finally:
+        cur.close(); cn.close()
+
+def ensure_event_log():
+    cn = conn(); cur = cn.cursor()
+    try:
+        cur.execute("""CREATE TABLE IF NOT EXISTS event_log (
+          id INTEGER PRIMARY KEY AUTOINCREMENT,
+          ts INTEGER,
+          kind VARCHAR(32),
+          data TEXT,
+          admin_ids TEXT,
+          operator_ids TEXT
+        )""")
+        cn.commit()
+    finally:
+        cur.close(); cn.close()
+
+def ensure_incremental_vacuum():
+    # auto_vacuum can only be switched by a full VACUUM; paid once here so
+    # maintenance can hand free pages back to the filesystem in small slices
+    cn = sqlite3.connect(db_params()['path'], isolation_level=None)
+    try:
+        if cn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            cn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            cn.execute("VACUUM")
+    finally:
+        cn.close()
+
+def ensure_wal_mode():
+    cn = conn()
+    try:
+        cn.execute("PRAGMA journal_mode=WAL")
+    finally:
+        cn.close()
+
+MIGRATIONS = [
+    ('init_db', init_db),
+    ('channels_name_not_unique', ensure_channels_name_not_unique),
+    ('super_admin', ensure_super_admin),
+    ('sig6_column', ensure_sig6_column),
+    ('normalize_phones_v1', ensure_migration_normalize_phones),
+    ('dedup_customers', dedup_customers),
+    ('unique_index_customers', ensure_unique_index_customers),
+    ('duplicate_rollups', ensure_duplicate_rollups),
+    ('wal_mode', ensure_wal_mode),
+    ('match_index', ensure_match_index),
+    ('epoch_columns', ensure_epoch_columns),
+    ('incremental_vacuum', ensure_incremental_vacuum),
+    ('bootstrap_index', ensure_bootstrap_index),
+    ('phone_index_log', ensure_phone_index_log),
+    ('import_sessions', ensure_import_sessions),
+    ('event_log', ensure_event_log),
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def schema_version():
+    cn = sqlite3.connect(db_params()['path'])
+    try:
+        return cn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        cn.close()
+
+def schema_current():
+    return schema_version() >= SCHEMA_VERSION
+
+def migrate(rerun=False):
+    # a second SQLite file serves as a cross-process mutex so that several
+    # WSGI workers starting together run the pending migrations only once
+    lock = sqlite3.connect(db_params()['path'] + '.migrate-lock', timeout=600, isolation_level=None)
+    try:
+        lock.execute("BEGIN EXCLUSIVE")
+        start = 0 if rerun else schema_version()
+        applied = []
+        for i, (name, fn) in enumerate(MIGRATIONS):
+            if i < start:
+                continue
+            t0 = time.time()
+            fn()
+            cn = sqlite3.connect(db_params()['path'])
+            cn.execute(f"PRAGMA user_version={i + 1}")
+            cn.close()
+            applied.append((name, round(time.time() - t0, 3)))
+        lock.execute("COMMIT")
+        directory.invalidate()
+        if applied:
+            phone_index.invalidate()
+        return applied
+    finally:
+        lock.close()
+
+def ensure_schema():
+    if not schema_current():
+        for name, secs in migrate():
+            print(f'migrated {name} ({secs}s)')
+
+def start_background():
+    backfill.start()
+    maintenance.start()
+    phone_index.start()
+
+# importing the module does no I/O: migrations belong to `python server.py
+# migrate` (some, like incremental_vacuum, rewrite the whole file), and
+# threads do not survive a fork, so under `gunicorn --preload` each worker
+# starts its own on its first request
+worker = {'pid': None, 'schema': False}
+worker_lock = threading.Lock()
+
+@app.before_request
+def start_worker():
+    if worker['pid'] == os.getpid() and worker['schema']:
+        return
+    with worker_lock:
+        if worker['pid'] != os.getpid():
+            worker['pid'] = os.getpid()
+            worker['schema'] = False
+        if not worker['schema']:
+            if not schema_current():
+                app.logger.error('schema version %s/%s: run `python server.py migrate`', schema_version(), SCHEMA_VERSION)
+                return jsonify({'error':'schema','detail':'数据库结构未更新，请先执行 python server.py migrate'}), 503
+            worker['schema'] = True
+            start_background()
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['migrate']:
+        applied = migrate(rerun='--all' in sys.argv[2:])
+        for name, secs in applied:
+            print(f'{name}: {secs}s')
+        print(f'schema version {schema_version()}/{SCHEMA_VERSION}')
+        sys.exit(0)
+    if sys.argv[1:2] == ['backfill']:
+        ensure_schema()
+        backfill.run(pause=0)
+        print(backfill.status())
+        sys.exit(0)
+    if sys.argv[1:2] == ['maintain']:
+        ensure_schema()
+        print(json.dumps(maintenance.run('full' if '--full' in sys.argv[2:] else None), indent=2))
+        sys.exit(0)
+    if sys.argv[1:2] == ['compact']:
+        ensure_schema()
+        print(json.dumps(compact_duplicates(), indent=2))
+        sys.exit(0)
+    if sys.argv[1:2] == ['phone-index']:
+        ensure_schema()
+        print(phone_index.rebuild() or 'another process is rebuilding the index')
+        sys.exit(0)
+    ensure_schema()
     app.run(host='127.0.0.1', port=5000)
@@ -0,0 +1,78 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server as server_module
+
+
+@pytest.fixture
+def blank(tmp_path, monkeypatch):
+    # a database path of its own, not yet migrated, and fresh module
+    # singletons per test; the worker is marked started so no background
+    # thread touches tmp_path
+    s = server_module
+    monkeypatch.setenv('QUCHONG_DB', str(tmp_path / 'quchong_admin.db'))
+    monkeypatch.setattr(s, 'DUP_ARCHIVE_DIR', str(tmp_path / 'archive'))
+    monkeypatch.setattr(s, 'generation', s.SharedGeneration())
+    monkeypatch.setattr(s, 'directory', s.Directory())
+    monkeypatch.setattr(s, 'phone_index', s.PhoneIndex(interval=3600))
+    monkeypatch.setattr(s, 'hub', s.EventHub())
+    monkeypatch.setattr(s, 'admission', s.Admission())
+    monkeypatch.setattr(s, 'maintenance', s.Maintenance())
+    monkeypatch.setattr(s, 'backfill', s.TimestampBackfill())
+    monkeypatch.setattr(s, 'worker', {'pid': os.getpid(), 'schema': True})
+    return s
+
+
+@pytest.fixture
+def server(blank):
+    blank.migrate()
+    return blank
+
+
+@pytest.fixture
+def client(server):
+    return server.app.test_client()
+
+
+@pytest.fixture
+def super_id(server):
+    cn = server.conn()
+    try:
+        return cn.execute("SELECT id FROM users WHERE role='super_admin'").fetchone()[0]
+    finally:
+        cn.close()
+
+
+def add_user(server, uid, role, parent_id=None):
+    cn = server.conn()
+    cn.execute("INSERT INTO users (id,username,display_name,role,parent_id,is_active) VALUES (?,?,?,?,?,1)",
+               (uid, uid, uid, role, parent_id))
+    cn.commit()
+    cn.close()
+    server.directory.invalidate()
+
+
+def add_channel(server, cid, owner_admin_id):
+    cn = server.conn()
+    cn.execute("INSERT INTO channels (id,name,created_by,owner_admin_id,is_active) VALUES (?,?,?,?,1)",
+               (cid, cid, owner_admin_id, owner_admin_id))
+    cn.commit()
+    cn.close()
+    server.directory.invalidate()
+
+
+@pytest.fixture
+def accounts(server):
+    # admin a with operators o1/o2 and channel c1; admin a2 with operator p1 and channel c2
+    add_user(server, 'a', 'admin')
+    add_user(server, 'o1', 'operator', 'a')
+    add_user(server, 'o2', 'operator', 'a')
+    add_user(server, 'a2', 'admin')
+    add_user(server, 'p1', 'operator', 'a2')
+    add_channel(server, 'c1', 'a')
+    add_channel(server, 'c2', 'a2')
+    return {'admin': 'a', 'operator': 'o1', 'channel': 'c1'}
@@ -0,0 +1,110 @@
+import threading
+
+
+def batch(client, phones, operator='o1'):
+    return client.post('/api/customers/batch', json={'phones': phones, 'channel_id': 'c1', 'operator_id': operator})
+
+
+def phones(n, start=0):
+    return [f'138{start + i:08d}' for i in range(n)]
+
+
+def hold_slots(server, n):
+    # occupy n batch slots as if n imports were running
+    for _ in range(n):
+        assert server.admission.enter_batch() == (None, 0)
+
+
+def tokens(server, kind, key):
+    return server.admission._buckets[(kind, key)].tokens
+
+
+def test_operator_rate_rejects_with_retry_after(server, client, accounts):
+    server.admission.configure({'operator_rate': 1, 'operator_burst': 3})
+    for i in range(3):
+        r = client.post('/api/customers', json={'phone_raw': f'1390000000{i}', 'channel_id': 'c1', 'operator_id': 'o1'})
+        assert r.status_code == 200, r.get_json()
+    r = client.post('/api/customers', json={'phone_raw': '13900000009', 'channel_id': 'c1', 'operator_id': 'o1'})
+    assert r.status_code == 429
+    assert r.get_json()['reason'] == 'operator_rate'
+    assert int(r.headers['Retry-After']) >= 1
+    # another operator has a bucket of its own
+    r = client.post('/api/customers', json={'phone_raw': '13900000009', 'channel_id': 'c1', 'operator_id': 'o2'})
+    assert r.status_code == 200
+    assert server.admission.status()['rejected']['operator_rate'] == 1
+
+
+def test_admin_rate_covers_all_operators(server, client, accounts):
+    server.admission.configure({'admin_rate': 1, 'admin_burst': 10})
+    assert batch(client, phones(6), 'o1').status_code == 200
+    r = batch(client, phones(6, 100), 'o2')
+    assert r.status_code == 429
+    assert r.get_json()['reason'] == 'admin_rate'
+    assert int(r.headers['Retry-After']) >= 1
+
+
+def test_batch_larger_than_burst_goes_into_debt(server, client, accounts):
+    server.admission.configure({'operator_rate': 1, 'operator_burst': 5})
+    assert batch(client, phones(8)).status_code == 200
+    assert tokens(server, 'operator', 'o1') < 0
+    assert batch(client, phones(1, 100)).status_code == 429
+
+
+def test_queue_full_refunds_tokens(server, client, accounts):
+    server.admission.configure({'operator_burst': 10, 'operator_rate': 0.001, 'batch_concurrency': 1, 'batch_queue': 1,
+                                'queue_timeout': 5})
+    hold_slots(server, 1)
+    waiter = threading.Thread(target=server.admission.enter_batch)
+    waiter.start()
+    try:
+        while server.admission.status()['queued'] < 1:
+            pass
+        r = batch(client, phones(10))
+        assert r.status_code == 429
+        assert r.get_json()['reason'] == 'batch_queue_full'
+        assert int(r.headers['Retry-After']) >= 1
+        assert tokens(server, 'operator', 'o1') == 10
+    finally:
+        server.admission.leave_batch()
+        waiter.join()
+        server.admission.leave_batch()
+    # the refunded quota admits the retry
+    r = batch(client, phones(10))
+    assert r.status_code == 200, r.get_json()
+    assert r.get_json()['stats']['success'] == 10
+
+
+def test_queue_timeout_refunds_tokens(server, client, accounts):
+    server.admission.configure({'operator_burst': 10, 'operator_rate': 0.001, 'batch_concurrency': 1, 'queue_timeout': 0.05})
+    hold_slots(server, 1)
+    try:
+        r = batch(client, phones(10))
+        assert r.status_code == 429
+        assert r.get_json()['reason'] == 'batch_timeout'
+        assert 'Retry-After' in r.headers
+        assert tokens(server, 'operator', 'o1') == 10
+    finally:
+        server.admission.leave_batch()
+    st = server.admission.status()
+    assert st['rejected']['batch_timeout'] == 1
+    assert st['in_flight'] == 0 and st['queued'] == 0
+    assert batch(client, phones(10)).status_code == 200
+
+
+def test_refund_never_exceeds_burst(server):
+    server.admission.configure({'operator_burst': 10, 'admin_burst': 10})
+    assert server.admission.charge('o1', 'a', 4) == (None, 0)
+    server.admission.refund('o1', 'a', 100)
+    assert tokens(server, 'operator', 'o1') == 10
+    assert tokens(server, 'admin', 'a') == 10
+
+
+def test_only_the_super_admin_changes_limits(server, client, accounts, super_id):
+    before = server.admission.status()['limits']
+    for user_id in (None, 'a', 'o1', 'missing'):
+        r = client.patch('/api/admission', json={'user_id': user_id, 'operator_rate': 1e9})
+        assert r.status_code == 403
+    assert server.admission.status()['limits'] == before
+    r = client.patch('/api/admission', json={'user_id': super_id, 'operator_rate': 50})
+    assert r.status_code == 200 and r.get_json()['limits']['operator_rate'] == 50
+    assert client.patch('/api/admission', json={'user_id': super_id, 'operator_rate': -1}).status_code == 400
@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+
+def create(client, phone, operator, channel):
+    r = client.post('/api/customers', json={'phone_raw': phone, 'channel_id': channel, 'operator_id': operator})
+    assert r.status_code == 200, r.get_json()
+    return r.get_json()
+
+
+def bootstrap(client, user_id, limit=0):
+    r = client.get(f'/api/bootstrap?user_id={user_id}&limit={limit}')
+    assert r.status_code == 200
+    return json.loads(r.get_data())
+
+
+@pytest.fixture
+def crossed(client, accounts):
+    # o1 (admin a) owns 13800138000; p1 (admin a2) runs into it as a duplicate
+    create(client, '13800138000', 'o1', 'c1')
+    create(client, '13800138001', 'o2', 'c1')
+    create(client, '13900139000', 'p1', 'c2')
+    assert create(client, '13800138000', 'p1', 'c2')['status'] == 'duplicate'
+
+
+@pytest.mark.parametrize('limit', [0, 50])
+def test_other_admins_customer_is_masked_and_uncounted(client, crossed, limit):
+    b = bootstrap(client, 'a2', limit)
+    assert b['counts']['customers'] == 1
+    rows = {r['phone_normalized']: r for r in b['customers']}
+    assert set(rows) == {'13900139000', '****8000'}
+    extra = rows['****8000']
+    assert extra['owner_admin_id'] == 'a' and extra['masked'] == 1
+    assert extra['phone_raw'] is None and extra['phone_hash'] is None and extra['phone_encrypted'] is None
+    assert '13800138000' not in json.dumps(b)
+    # the duplicate itself is a2's and names the customer it hit
+    assert [d['customer_id'] for d in b['duplicates']] == [extra['id']]
+
+
+def test_owner_admin_sees_full_rows(client, crossed):
+    b = bootstrap(client, 'a')
+    assert b['counts']['customers'] == 2
+    assert sorted(r['phone_normalized'] for r in b['customers']) == ['13800138000', '13800138001']
+    assert all('masked' not in r for r in b['customers'])
+    assert b['counts']['duplicates'] == 1
+
+
+def test_operator_and_super_admin_scopes(server, client, crossed):
+    b = bootstrap(client, 'p1')
+    assert [r['phone_normalized'] for r in b['customers']] == ['13900139000']
+    assert {u['id'] for u in b['users']} >= {'p1', 'a2'} and 'o2' not in {u['id'] for u in b['users']}
+    cn = server.conn()
+    super_id = cn.execute("SELECT id FROM users WHERE role='super_admin'").fetchone()[0]
+    cn.close()
+    b = bootstrap(client, super_id)
+    assert b['counts']['customers'] == 3 and len(b['customers']) == 3
+
+
+def test_bootstrap_requires_active_caller(client, accounts):
+    assert client.get('/api/bootstrap?user_id=nobody').status_code == 403
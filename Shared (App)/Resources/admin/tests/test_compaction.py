@@ -0,0 +1,115 @@
+import gzip
+import json
+import os
+
+import pytest
+
+
+def create(client, phone, operator='o1', channel='c1'):
+    r = client.post('/api/customers', json={'phone_raw': phone, 'channel_id': channel, 'operator_id': operator})
+    assert r.status_code == 200, r.get_json()
+
+
+def customer_id(server, phone):
+    cn = server.conn()
+    try:
+        return cn.execute("SELECT id FROM customers WHERE phone_normalized=?", (phone,)).fetchone()[0]
+    finally:
+        cn.close()
+
+
+def add_duplicate(server, did, cid, operator, channel, days_ago):
+    cn = server.conn()
+    cn.execute("INSERT INTO duplicates (id,customer_id,first_owner_id,duplicate_operator_id,duplicate_channel_id,duplicate_at) "
+               "VALUES (?,?,'o1',?,?,datetime('now', ?))", (did, cid, operator, channel, f'-{days_ago} days'))
+    cn.commit()
+    cn.close()
+
+
+def rows(server, sql):
+    cn = server.conn()
+    try:
+        return [tuple(r) for r in cn.execute(sql)]
+    finally:
+        cn.close()
+
+
+@pytest.fixture
+def history(server, client, accounts):
+    create(client, '13800000001')
+    cid = customer_id(server, '13800000001')
+    for did, operator, channel, days in (('d1', 'o2', 'c1', 200), ('d2', 'o2', 'c1', 120), ('d3', 'o2', 'c1', 91),
+                                         ('d4', 'p1', 'c2', 150), ('d5', 'o2', 'c1', 89), ('d6', 'p1', 'c2', 1)):
+        add_duplicate(server, did, cid, operator, channel, days)
+    return cid
+
+
+def test_compaction_rolls_up_and_archives(server, client, super_id, history):
+    r = client.post('/api/duplicates/compact', json={'user_id': super_id, 'retention_days': 90})
+    res = r.get_json()
+    assert r.status_code == 200 and (res['archived'], res['rolled_up']) == (4, 2)
+    # the cutoff is exclusive of the retention window: 89 days stays, 91 moves
+    assert sorted(rows(server, "SELECT id FROM duplicates")) == [('d5',), ('d6',)]
+    rollups = rows(server, "SELECT duplicate_operator_id, duplicate_channel_id, first_owner_id, cnt, first_at < last_at FROM duplicate_rollups ORDER BY 1")
+    assert rollups == [('o2', 'c1', 'o1', 3, 1), ('p1', 'c2', 'o1', 1, 0)]
+    with gzip.open(os.path.join(server.DUP_ARCHIVE_DIR, res['archive_file']), 'rt', encoding='utf-8') as f:
+        archived = [json.loads(line) for line in f]
+    assert sorted(a['id'] for a in archived) == ['d1', 'd2', 'd3', 'd4']
+    assert all(a['customer_id'] == history and a['duplicate_at'] < res['cutoff'] for a in archived)
+    # a later run adds to the same rollup instead of a second row
+    add_duplicate(server, 'd7', history, 'o2', 'c1', 300)
+    assert server.compact_duplicates(90, archive=False)['archived'] == 1
+    assert rows(server, "SELECT cnt FROM duplicate_rollups WHERE duplicate_operator_id='o2'") == [(4,)]
+    assert os.listdir(server.DUP_ARCHIVE_DIR) == [res['archive_file']]
+
+
+def test_counts_include_compacted_duplicates(server, client, super_id, history):
+    before = {who: client.get(f'/api/bootstrap?limit=0&user_id={who}').get_json()['counts']['duplicates'] for who in ('a', 'a2', super_id)}
+    # a sees every duplicate of its operator's customer, a2 only its own operator's
+    assert before == {'a': 6, 'a2': 2, super_id: 6}
+    server.compact_duplicates(90, archive=False)
+    for who, total in before.items():
+        b = client.get(f'/api/bootstrap?limit=0&user_id={who}').get_json()
+        assert b['counts']['duplicates'] == total, who
+        assert len(b['duplicates']) + sum(r['cnt'] for r in b['duplicate_rollups']) == total, who
+    b = client.get('/api/bootstrap?limit=0&user_id=a2').get_json()
+    assert [(r['duplicate_operator_id'], r['cnt']) for r in b['duplicate_rollups']] == [('p1', 1)]
+    assert b['counts']['compacted_duplicates'] == 1
+
+
+def test_maintenance_compacts_past_retention(server, history):
+    server.maintenance.pause = 0
+    report = server.maintenance.run(integrity='off')
+    assert report['compact']['archived'] == 4
+    assert rows(server, "SELECT SUM(cnt) FROM duplicate_rollups") == [(4,)]
+
+
+@pytest.mark.parametrize('body, status', [
+    ({'archive': 'false'}, 200),
+    ({'archive': 'maybe'}, 400),
+    ({'archive': None}, 400),
+    ({'retention_days': 'abc'}, 400),
+    ({'retention_days': [90]}, 400),
+    ({'retention_days': -1}, 400),
+])
+def test_compact_parameters(server, client, super_id, history, body, status):
+    r = client.post('/api/duplicates/compact', json={'user_id': super_id, **body})
+    assert r.status_code == status, r.get_json()
+    if status == 200:
+        assert r.get_json()['archive_file'] is None and not os.path.exists(server.DUP_ARCHIVE_DIR)
+
+
+def test_recent_duplicates(server, client, history):
+    cn = server.conn()
+    cn.execute("UPDATE duplicates SET duplicate_ts=" + server.EPOCH_MS.format('duplicate_at'))
+    cn.commit()
+    cn.close()
+    assert sorted(d['id'] for d in client.get('/api/duplicates?since_days=100').get_json()) == ['d3', 'd5', 'd6']
+    for bad in ('abc', '1.5', '-1'):
+        assert client.get(f'/api/duplicates?since_days={bad}').status_code == 400, bad
+
+
+@pytest.mark.parametrize('user_id', [None, 'a', 'o1'])
+def test_compact_requires_super_admin(server, client, history, user_id):
+    assert client.post('/api/duplicates/compact', json={'user_id': user_id, 'retention_days': 0}).status_code == 403
+    assert len(rows(server, "SELECT id FROM duplicates")) == 6
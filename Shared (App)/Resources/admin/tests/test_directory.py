@@ -0,0 +1,52 @@
+def rename_channel(server, cid, name):
+    cn = server.conn()
+    cn.execute("UPDATE channels SET name=? WHERE id=?", (name, cid))
+    cn.commit()
+    cn.close()
+
+
+def test_generation_is_shared_through_the_file(server):
+    # two mappings of the same file stand in for two worker processes
+    mine, other = server.SharedGeneration(), server.SharedGeneration()
+    before = mine.value()
+    other.bump()
+    assert mine.value() != before and mine.value() == other.value()
+
+
+def test_invalidate_reloads_every_directory(server, accounts):
+    mine, other = server.Directory(ttl=3600), server.Directory(ttl=3600)
+    assert mine.channel('c1')['name'] == other.channel('c1')['name'] == 'c1'
+    rename_channel(server, 'c1', 'renamed')
+    # a write made behind the cache's back stays invisible until the TTL
+    assert mine.channel('c1')['name'] == 'c1'
+    loads = mine.loads
+    other.invalidate()
+    assert mine.channel('c1')['name'] == 'renamed' and mine.loads == loads + 1
+    assert mine.channel('c1')['name'] == 'renamed' and mine.loads == loads + 1
+
+
+def test_handlers_invalidate(server, client, accounts, super_id):
+    mine = server.Directory(ttl=3600)
+    assert mine.channel('c1')['is_active'] == 1
+    assert client.patch('/api/channels/c1', json={'is_active': False}).status_code == 200
+    assert mine.channel('c1')['is_active'] == 0
+    # an id the cache has never seen is looked up again once the copy is a second old
+    r = client.post('/api/admins', json={'username': 'new_admin', 'display_name': 'N', 'password': 'pw', 'user_id': super_id})
+    assert r.status_code == 200, r.get_json()
+    assert mine.user(r.get_json()['id'])['username'] == 'new_admin'
+
+
+def test_ttl_and_unknown_ids(server, accounts, monkeypatch):
+    d = server.Directory(ttl=3600)
+    assert d.user('a')['role'] == 'admin'
+    cn = server.conn()
+    cn.execute("INSERT INTO users (id,username,display_name,role,is_active) VALUES ('late','late','late','admin',1)")
+    cn.commit()
+    cn.close()
+    # a miss right after a load does not reload; one on an older copy does
+    assert d.user('late') is None
+    d._loaded_at -= 2
+    assert d.user('late')['username'] == 'late'
+    expired = server.Directory(ttl=0)
+    expired.user('a'); expired.user('a')
+    assert expired.loads == 2 and expired.hits == 0
@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+
+def publish_all(server):
+    # one event for each audience, then one everybody sees to end a read on;
+    # the first, seen by no one, is where readers start (0 means "from now")
+    hub = server.hub
+    start = hub.publish('user', {}, [], [])
+    ids = [hub.publish('customer', {'n': 1}, ['a'], ['o1']),
+           hub.publish('customer', {'n': 2}, ['a'], ['o2']),
+           hub.publish('channel', {'n': 3}, ['a'], []),
+           hub.publish('customer', {'n': 4}, ['a2'], ['p1'])]
+    last = hub.publish('user', {'n': 5}, ['a', 'a2'], ['o1', 'o2', 'p1'])
+    return start, ids, last
+
+
+def read(client, user_id, until, last_event_id=None):
+    headers = {'Last-Event-ID': str(last_event_id)} if last_event_id is not None else {}
+    r = client.get(f'/api/events?user_id={user_id}', headers=headers, buffered=False)
+    assert r.status_code == 200 and r.mimetype == 'text/event-stream'
+    events = []
+    try:
+        chunks = iter(r.response)
+        assert next(chunks).startswith(b'retry:')
+        while not events or events[-1][0] < until:
+            fields = dict(line.split(': ', 1) for line in next(chunks).decode().strip().split('\n'))
+            events.append((int(fields['id']), fields['event'], json.loads(fields['data'])))
+    finally:
+        r.close()
+    return events
+
+
+@pytest.mark.parametrize('who, seen', [('o1', [1, 3, 5]), ('o2', [2, 3, 5]), ('p1', [4, 5]), ('a', [1, 2, 3, 5]), ('a2', [4, 5])])
+def test_events_by_role(server, client, accounts, who, seen):
+    start, ids, last = publish_all(server)
+    assert [e[2]['n'] for e in read(client, who, last, start)] == seen
+
+
+def test_super_admin_sees_everything(server, client, accounts, super_id):
+    start, ids, last = publish_all(server)
+    assert [e[0] for e in read(client, super_id, last, start)] == ids + [last]
+    # closing the stream ends its subscription
+    assert server.hub.subscribers == 0
+    assert client.get('/api/events?user_id=nobody').status_code == 403
+
+
+def test_resume_from_last_event_id(server, client, accounts):
+    start, ids, last = publish_all(server)
+    # a reconnect carries the id it last saw and gets only what came after
+    assert [e[0] for e in read(client, 'a', last, ids[1])] == [ids[2], last]
+    # another worker's hub, with an empty window, replays the same from event_log
+    other = server.EventHub()
+    assert [e[0] for e in other.since(ids[1])[0]] == [ids[2], ids[3], last]
+    # an id this log never issued resets the client to the head
+    events = read(client, 'a', last, last + 100)
+    assert events == [(last, 'reset', {})]
+
+
+def test_event_log_is_pruned_to_the_backlog(server, accounts, monkeypatch):
+    hub = server.EventHub(backlog=10)
+    monkeypatch.setattr(server, 'hub', hub)
+    first = hub.publish('user', {}, ['a'])
+    last = hub.publish_many([('user', {'n': i}, ['a'], []) for i in range(1000)])
+    cn = server.conn()
+    try:
+        assert cn.execute("SELECT MIN(id), MAX(id) FROM event_log").fetchone()[:] == (last - 9, last)
+    finally:
+        cn.close()
+    # the in-memory window is capped at the same size
+    assert len(hub._events) == 10
+    # a client that was away longer than the log covers is told to reload
+    other = server.EventHub(backlog=10)
+    assert other.since(first)[1]
+    events, gap = other.since(last - 3)
+    assert not gap and [e[0] for e in events] == [last - 2, last - 1, last]
@@ -0,0 +1,77 @@
+import csv
+import gzip
+import io
+
+import pytest
+
+
+def create(client, phone, operator, channel):
+    r = client.post('/api/customers', json={'phone_raw': phone, 'channel_id': channel, 'operator_id': operator})
+    assert r.status_code == 200, r.get_json()
+    return r.get_json()['status']
+
+
+def table(resp):
+    assert resp.status_code == 200
+    text = resp.get_data().decode('utf-8')
+    assert text.startswith('\ufeff')
+    return list(csv.reader(io.StringIO(text[1:])))
+
+
+@pytest.fixture
+def stored(server, client, accounts):
+    cn = server.conn()
+    cn.execute("UPDATE channels SET name='=HYPERLINK(\"http://x\")' WHERE id='c1'")
+    cn.execute("UPDATE users SET display_name='@op' WHERE id='o1'")
+    cn.commit()
+    cn.close()
+    server.directory.invalidate()
+    create(client, '13800000001', 'o1', 'c1')
+    create(client, '+86 139 0000 0002', 'o2', 'c1')
+    create(client, '13700000003', 'p1', 'c2')
+    assert create(client, '13800000001', 'p1', 'c2') == 'duplicate'
+
+
+def phones(rows):
+    return sorted(r[0] for r in rows[1:])
+
+
+def test_customers_by_role(server, client, stored, super_id):
+    assert phones(table(client.get(f'/api/export/customers?user_id={super_id}'))) == ['13700000003', '13800000001', '8613900000002']
+    assert phones(table(client.get('/api/export/customers?user_id=a'))) == ['13800000001', '8613900000002']
+    assert phones(table(client.get('/api/export/customers?user_id=a2'))) == ['13700000003']
+    assert phones(table(client.get('/api/export/customers?user_id=o2'))) == ['8613900000002']
+    assert phones(table(client.get('/api/export/customers?user_id=a&channel_id=c2'))) == []
+    assert client.get('/api/export/customers?user_id=nobody').status_code == 403
+
+
+def test_customer_rows(server, client, stored):
+    rows = table(client.get('/api/export/customers?user_id=o1'))
+    assert rows[0] == ['手机号', '渠道', '运营', '管理员', '录入时间', '被重复次数']
+    phone, channel, operator, admin, created, dups = rows[1]
+    # numbers go out as stored, never with a guessed country code; text
+    # that a spreadsheet would evaluate is prefixed with a quote
+    assert phone == '13800000001'
+    assert channel == '\'=HYPERLINK("http://x")' and operator == "'@op" and admin == 'a'
+    assert created and dups == '1'
+
+
+def test_duplicates_by_role(server, client, stored, super_id):
+    rows = table(client.get(f'/api/export/duplicates?user_id={super_id}'))
+    assert rows[0] == ['手机号', '原渠道', '原运营', '原录入时间', '重复渠道', '重复运营', '重复时间']
+    assert [r[:3] + r[4:6] for r in rows[1:]] == [['13800000001', '\'=HYPERLINK("http://x")', "'@op", 'c2', 'p1']]
+    assert len(table(client.get('/api/export/duplicates?user_id=a2'))) == 2
+    assert len(table(client.get('/api/export/duplicates?user_id=p1'))) == 2
+    assert len(table(client.get('/api/export/duplicates?user_id=a'))) == 1
+    assert len(table(client.get('/api/export/duplicates?user_id=o1'))) == 1
+
+
+def test_gzip_export(server, client, stored, super_id):
+    plain = client.get(f'/api/export/customers?user_id={super_id}').get_data()
+    r = client.get(f'/api/export/customers?user_id={super_id}&gzip=1')
+    assert r.headers['Content-Disposition'].endswith('customers.csv.gz"')
+    assert gzip.decompress(r.get_data()) == plain
+
+
+def test_csv_cell(server):
+    assert [server.csv_cell(v) for v in ('=1+1', '+1', '-1', '@a', '\tx', 'a=b', '', 3)] == ["'=1+1", "'+1", "'-1", "'@a", "'\tx", 'a=b', '', 3]
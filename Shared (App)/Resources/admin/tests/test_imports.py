@@ -0,0 +1,108 @@
+import pytest
+
+
+def chunk(server, phones, operator='o1'):
+    return {'operator_id': operator, 'phones': phones, 'checksum': server.chunk_checksum(phones)}
+
+
+@pytest.fixture
+def session(client, accounts):
+    r = client.post('/api/imports', json={'channel_id': 'c1', 'operator_id': 'o1', 'total_chunks': 2})
+    assert r.status_code == 200
+    return r.get_json()['id']
+
+
+def put(client, sid, seq, body):
+    return client.put(f'/api/imports/{sid}/chunks/{seq}', json=body)
+
+
+def count(server, sql):
+    cn = server.conn()
+    try:
+        return cn.execute(sql).fetchone()[0]
+    finally:
+        cn.close()
+
+
+def test_chunks_replay_and_finalize(server, client, session):
+    first = ['13800000001', '13800000002']
+    r = put(client, session, 0, chunk(server, first))
+    assert r.get_json()['status'] == 'ok' and r.get_json()['stats']['success'] == 2
+    # a lost response retried: same stats, nothing imported twice or counted as duplicate
+    r = put(client, session, 0, chunk(server, first))
+    assert r.get_json()['status'] == 'replayed' and r.get_json()['stats']['success'] == 2
+    r = client.post(f'/api/imports/{session}/finalize', json={'operator_id': 'o1'})
+    assert r.status_code == 409 and r.get_json()['missing'] == [1]
+    assert put(client, session, 1, chunk(server, ['13800000002', 'bad'])).status_code == 200
+    s = client.get(f'/api/imports/{session}?operator_id=o1').get_json()
+    assert s['received'] == [0, 1] and s['status'] == 'open'
+    r = client.post(f'/api/imports/{session}/finalize', json={'operator_id': 'o1'})
+    stats = r.get_json()['stats']
+    assert (stats['success'], stats['duplicate'], stats['failed'], stats['chunks']) == (2, 1, 1, 2)
+    assert client.post(f'/api/imports/{session}/finalize', json={'operator_id': 'o1'}).get_json()['stats'] == stats
+    assert put(client, session, 2, chunk(server, ['13800000003'])).status_code in (400, 409)
+    assert count(server, "SELECT COUNT(*) FROM customers") == 2
+
+
+def test_conflicting_chunk_and_checksum(server, client, session):
+    assert put(client, session, 0, chunk(server, ['13800000001'])).status_code == 200
+    r = put(client, session, 0, chunk(server, ['13800000009']))
+    assert r.status_code == 409 and r.get_json()['error'] == 'conflict'
+    body = chunk(server, ['13800000002'])
+    body['checksum'] = 'x'
+    assert put(client, session, 1, body).status_code == 422
+    assert put(client, session, 5, chunk(server, ['13800000002'])).status_code == 400
+
+
+def test_session_belongs_to_its_operator(server, client, session):
+    assert put(client, session, 0, chunk(server, ['13800000001'], operator='o2')).status_code == 403
+    assert put(client, session, 0, chunk(server, ['13800000001'], operator=None)).status_code == 403
+    assert client.get(f'/api/imports/{session}?operator_id=p1').status_code == 403
+    assert client.post(f'/api/imports/{session}/finalize', json={'operator_id': 'o2'}).status_code == 403
+    assert count(server, "SELECT COUNT(*) FROM customers") == 0
+
+
+def test_missing_and_purged_sessions(server, client, session, monkeypatch):
+    assert put(client, 'nope', 0, chunk(server, ['13800000001'])).status_code == 404
+    assert client.get('/api/imports/nope?operator_id=o1').status_code == 404
+    # purged as expired between the lookup and the write transaction
+    stale = server.import_session(session)
+    cn = server.conn()
+    cn.execute("DELETE FROM import_sessions WHERE id=?", (session,))
+    cn.commit()
+    cn.close()
+    monkeypatch.setattr(server, 'import_session', lambda sid: stale)
+    assert put(client, session, 0, chunk(server, ['13800000001'])).status_code == 404
+    assert client.post(f'/api/imports/{session}/finalize', json={'operator_id': 'o1'}).status_code == 404
+
+
+def test_replayed_chunks_are_not_charged(server, client, session):
+    phones = [f'1380000{i:04d}' for i in range(10)]
+    server.admission.configure({'operator_burst': 10, 'operator_rate': 0.001})
+    assert put(client, session, 0, chunk(server, phones)).status_code == 200
+    for _ in range(3):
+        r = put(client, session, 0, chunk(server, phones))
+        assert r.status_code == 200 and r.get_json()['status'] == 'replayed'
+    # the bucket is empty, so new work is still limited
+    r = put(client, session, 1, chunk(server, ['13900000001']))
+    assert r.status_code == 429 and r.get_json()['reason'] == 'operator_rate'
+    assert server.admission.status()['admitted'] == 1
+
+
+def test_cors_allows_put(client):
+    r = client.options('/api/imports/x/chunks/0', headers={'Origin': 'http://localhost'})
+    assert 'PUT' in r.headers['Access-Control-Allow-Methods'].split(',')
+
+
+def test_failed_imports_are_logged(server, client, session, monkeypatch, caplog):
+    def broken(*args, **kwargs):
+        raise RuntimeError('disk gone')
+    monkeypatch.setattr(server, 'import_phones', broken)
+    r = put(client, session, 0, chunk(server, ['13800000001']))
+    assert r.status_code == 500 and r.get_json()['detail'] == 'disk gone'
+    r = client.post('/api/customers/batch', json={'phones': ['13800000001'], 'channel_id': 'c1', 'operator_id': 'o1'})
+    assert r.status_code == 500
+    failed = [rec for rec in caplog.records if rec.levelname == 'ERROR']
+    assert [rec.getMessage() for rec in failed] == [f'import chunk {session}/0 failed', 'batch import failed']
+    assert all('disk gone' in rec.exc_text for rec in failed)
+    assert count(server, "SELECT COUNT(*) FROM import_chunks") == 0
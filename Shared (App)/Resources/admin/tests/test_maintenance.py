@@ -0,0 +1,79 @@
+import os
+import sqlite3
+
+import pytest
+
+
+@pytest.mark.parametrize('user_id', [None, 'a', 'o1', 'missing'])
+def test_only_the_super_admin_runs_maintenance(server, client, accounts, user_id):
+    r = client.post('/api/maintenance', json={'user_id': user_id, 'wait': True})
+    assert r.status_code == 403
+    assert not server.maintenance.reports
+
+
+def test_super_admin_runs_maintenance(server, client, accounts, super_id):
+    server.maintenance.pause = 0
+    r = client.post('/api/maintenance', json={'user_id': super_id, 'wait': True, 'integrity': 'off'})
+    assert r.status_code == 200 and 'integrity' not in r.get_json()['report']
+    assert client.post('/api/maintenance', json={'user_id': super_id, 'integrity': 'deep'}).status_code == 400
+    assert client.get('/api/maintenance').get_json()['reports']
+
+
+def execute(server, *statements):
+    cn = server.conn()
+    for sql in statements:
+        cn.execute(sql)
+    cn.commit()
+    cn.close()
+
+
+@pytest.fixture
+def churned(server, accounts):
+    server.maintenance.pause = 0
+    server.maintenance.pages = 16
+    execute(server, "CREATE TABLE scratch (id INTEGER PRIMARY KEY, body BLOB)",
+            "INSERT INTO scratch (body) SELECT randomblob(4000) FROM (WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i+1 FROM n WHERE i<200) SELECT i FROM n)")
+    execute(server, "DELETE FROM scratch")
+
+
+def test_vacuum_returns_free_pages_in_slices(server, churned):
+    report = server.maintenance.run(integrity='off')
+    vacuum = report['vacuum']
+    assert vacuum['auto_vacuum'] == 'incremental' and vacuum['free_pages_before'] >= 200
+    assert vacuum['free_pages_after'] == 0 and vacuum['slices'] >= vacuum['free_pages_before'] // 16
+    assert vacuum['reclaimed_bytes'] >= 200 * 4000
+    assert report['file_bytes_after'] < report['file_bytes_before']
+
+
+def test_analyze_and_checkpoint(server, churned):
+    # an open connection keeps the last close from checkpointing the WAL away
+    idle = server.conn()
+    idle.execute("SELECT COUNT(*) FROM users").fetchone()
+    try:
+        execute(server, "INSERT INTO scratch (body) VALUES (randomblob(4000))")
+        report = server.maintenance.run(integrity='quick')
+        wal = os.path.getsize(server.db_params()['path'] + '-wal')
+    finally:
+        idle.close()
+    assert {'users', 'customers', 'scratch'} <= set(report['analyze']['tables'])
+    assert report['analyze']['analysis_limit'] == server.maintenance.analysis_limit
+    cn = server.conn()
+    try:
+        assert cn.execute("SELECT COUNT(*) FROM sqlite_stat1 WHERE tbl='users'").fetchone()[0]
+    finally:
+        cn.close()
+    # the passive checkpoint sees the insert's frames; the closing one empties the WAL
+    assert report['checkpoint']['wal_frames'] > 0 and report['checkpoint']['truncated']
+    assert wal == 0
+    assert report['integrity'] == {'mode': 'quick', 'ok': True, 'errors': []}
+    assert server.maintenance.last_run() is not None
+
+
+def test_one_worker_runs_at_a_time(server, churned):
+    lock = sqlite3.connect(server.db_params()['path'] + '.maint-lock', isolation_level=None)
+    lock.execute("BEGIN EXCLUSIVE")
+    try:
+        assert server.maintenance.run(integrity='off') is None
+    finally:
+        lock.close()
+    assert server.maintenance.run(integrity='off')['vacuum']['free_pages_after'] == 0
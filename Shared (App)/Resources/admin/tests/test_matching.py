@@ -0,0 +1,108 @@
+import pytest
+
+
+@pytest.mark.parametrize('raw, normalized', [
+    ('13800138000', '13800138000'),
+    (' 138-0013 8000 ', '13800138000'),
+    ('+86 (138) 0013-8000', '8613800138000'),
+    ('0086 13800138000', '008613800138000'),
+])
+def test_normalize_phone(server, raw, normalized):
+    assert server.normalize_phone(raw) == normalized
+
+
+@pytest.mark.parametrize('raw', ['', '123', '1380013800a', '电话13800138000', '1' * 16])
+def test_normalize_phone_rejects(server, raw):
+    with pytest.raises(ValueError):
+        server.normalize_phone(raw)
+
+
+@pytest.mark.parametrize('digits, national', [
+    ('8613800138000', '13800138000'),
+    ('008613800138000', '13800138000'),
+    ('13800138000', '13800138000'),
+    ('861380013', '861380013'),
+    ('4413800138000', '4413800138000'),
+])
+def test_national_number(server, digits, national):
+    assert server.national_number(digits) == national
+
+
+def test_match_policy(server):
+    assert server.match_policy('suffix, exact') == ('exact', 'suffix')
+    assert server.match_policy('national') == ('national',)
+    for bad in ('', 'exact,fuzzy'):
+        with pytest.raises(ValueError):
+            server.match_policy(bad)
+
+
+def create(client, phone, operator='o1', channel='c1'):
+    r = client.post('/api/customers', json={'phone_raw': phone, 'channel_id': channel, 'operator_id': operator})
+    assert r.status_code == 200, r.get_json()
+    return r.get_json()
+
+
+@pytest.fixture
+def stored(client, accounts):
+    create(client, '13800138000')
+    create(client, '13912348000', operator='p1', channel='c2')
+
+
+def matches(server, phone, policy, limit=5):
+    cn = server.conn(); cur = cn.cursor()
+    try:
+        return server.match_phone(cur, server.normalize_phone(phone), server.match_policy(policy), limit)
+    finally:
+        cur.close(); cn.close()
+
+
+def many(server, phones, policy):
+    cn = server.conn(); cur = cn.cursor()
+    try:
+        return server.match_many(cur, [server.normalize_phone(p) for p in phones], server.match_policy(policy))
+    finally:
+        cur.close(); cn.close()
+
+
+def test_rules(server, stored):
+    assert [(m['rule'], m['phone_normalized']) for m in matches(server, '13800138000', 'exact')] == [('exact', '13800138000')]
+    assert matches(server, '+8613800138000', 'exact') == []
+    assert [m['rule'] for m in matches(server, '+8613800138000', 'exact,national')] == ['national']
+    assert matches(server, '13700138000', 'exact,national') == []
+    # both stored numbers end in 8000 and share sig6 only with the first
+    hits = matches(server, '13700138000', 'suffix')
+    assert [(m['rule'], m['phone_normalized'], m['score'], m['rank']) for m in hits] == [('suffix', '13800138000', 8, 1)]
+
+
+def test_rules_in_rank_order(server, stored):
+    hits = matches(server, '008613800138000', 'exact,national,suffix')
+    assert [(m['rule'], m['phone_normalized']) for m in hits] == [('national', '13800138000')]
+    assert matches(server, '13800138000', 'exact,suffix', limit=1)[0]['rule'] == 'exact'
+
+
+def test_match_many_agrees_with_match_phone(server, stored):
+    phones = ['13800138000', '+8613800138000', '13700138000', '13912348000', '13600000000']
+    for policy in ('exact', 'exact,national', 'exact,national,suffix', 'suffix'):
+        found = many(server, phones, policy)
+        for p in phones:
+            one = matches(server, p, policy, limit=1)
+            hit = found.get(server.normalize_phone(p))
+            assert ((hit['rule'], hit['id']) if hit else None) == ((one[0]['rule'], one[0]['id']) if one else None), (policy, p)
+
+
+def test_create_dedups_by_national_number(client, stored):
+    r = create(client, '+86 138 0013 8000', operator='o2')
+    assert r['status'] == 'duplicate'
+    assert create(client, '13700138000', operator='o2')['status'] != 'duplicate'
+
+
+def test_check_and_match_endpoints(server, client, stored):
+    r = client.post('/api/customers/check', json={'phones': ['13800138000', '8613912348000', '13600000000', 'abc'], 'user_id': 'o1'})
+    assert [x['status'] for x in r.get_json()['results']] == ['mine', 'other', 'new', 'invalid']
+    assert r.get_json()['summary'] == {'new': 1, 'mine': 1, 'other': 1, 'invalid': 1}
+    r = client.get('/api/customers/match?phone=13700138000&policy=suffix&user_id=a')
+    assert [m['phone_normalized'] for m in r.get_json()['matches']] == ['13800138000']
+    # an admin only sees its own customers
+    r = client.get('/api/customers/match?phone=13912348000&user_id=a')
+    assert r.get_json()['matches'] == []
+    assert client.get('/api/customers/match?phone=13912348000&policy=fuzzy&user_id=a').status_code == 400
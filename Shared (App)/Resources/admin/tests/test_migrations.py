@@ -0,0 +1,68 @@
+import os
+import shutil
+import sqlite3
+
+SHIPPED_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'quchong_admin.db')
+
+
+def tables(server):
+    cn = server.conn()
+    try:
+        return {r[0] for r in cn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    finally:
+        cn.close()
+
+
+def scalar(server, sql):
+    cn = server.conn()
+    try:
+        return cn.execute(sql).fetchone()[0]
+    finally:
+        cn.close()
+
+
+def test_fresh_database(blank):
+    assert blank.schema_version() == 0 and not blank.schema_current()
+    applied = blank.migrate()
+    assert [name for name, secs in applied] == [name for name, fn in blank.MIGRATIONS]
+    assert blank.schema_version() == blank.SCHEMA_VERSION and blank.schema_current()
+    assert {'users', 'channels', 'customers', 'duplicates', 'duplicate_rollups', 'phone_index_log',
+            'import_sessions', 'import_chunks', 'event_log'} <= tables(blank)
+    assert scalar(blank, "SELECT COUNT(*) FROM users WHERE role='super_admin'") == 1
+    assert scalar(blank, "PRAGMA journal_mode") == 'wal'
+    assert scalar(blank, "PRAGMA auto_vacuum") == 2
+    # a second run, or a second worker starting together, has nothing to do
+    assert blank.migrate() == []
+
+
+def test_existing_database(blank):
+    shutil.copy(SHIPPED_DB, blank.db_params()['path'])
+    src = sqlite3.connect(f'file:{SHIPPED_DB}?mode=ro', uri=True)
+    before = {t: src.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in ('users', 'channels', 'customers', 'duplicates')}
+    version = src.execute("PRAGMA user_version").fetchone()[0]
+    src.close()
+    assert blank.schema_version() == version < blank.SCHEMA_VERSION
+    applied = blank.migrate()
+    assert len(applied) == blank.SCHEMA_VERSION - version
+    assert blank.schema_current() and blank.migrate() == []
+    assert scalar(blank, "SELECT COUNT(*) FROM channels") == before['channels']
+    assert scalar(blank, "SELECT COUNT(*) FROM users") >= before['users']
+    # dedup moves same-number customers into duplicates, nothing is lost
+    customers, duplicates = scalar(blank, "SELECT COUNT(*) FROM customers"), scalar(blank, "SELECT COUNT(*) FROM duplicates")
+    assert customers + duplicates == before['customers'] + before['duplicates']
+    assert scalar(blank, "SELECT COUNT(*) - COUNT(DISTINCT phone_hash) FROM customers") == 0
+    assert scalar(blank, "SELECT COUNT(*) FROM customers WHERE phone_normalized IS NOT NULL AND national_hash IS NULL") == 0
+    blank.backfill.run(pause=0)
+    assert blank.backfill.pending() == {'customers': 0, 'duplicates': 0}
+    assert scalar(blank, "SELECT COUNT(*) FROM customers WHERE created_ts IS NULL") == 0
+
+
+def test_worker_refuses_an_old_schema(blank, monkeypatch):
+    monkeypatch.setattr(blank, 'worker', {'pid': None, 'schema': False})
+    monkeypatch.setattr(blank, 'start_background', lambda: None)
+    client = blank.app.test_client()
+    r = client.get('/api/channels')
+    assert r.status_code == 503 and r.get_json()['error'] == 'schema'
+    blank.migrate()
+    assert client.get('/api/channels').status_code == 200
+    assert blank.worker['schema']
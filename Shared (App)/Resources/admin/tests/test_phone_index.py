@@ -0,0 +1,179 @@
+import multiprocessing
+import os
+import random
+
+
+def create(client, phone, operator='o1'):
+    r = client.post('/api/customers', json={'phone_raw': phone, 'channel_id': 'c1', 'operator_id': operator})
+    assert r.status_code == 200, r.get_json()
+
+
+def synced(server, index, cur_factory=None):
+    cn = server.conn()
+    try:
+        cur = cn.cursor()
+        return index.sync(cur_factory(cur) if cur_factory else cur)
+    finally:
+        cn.close()
+
+
+class Overtaken:
+    # runs `before` once, right before the log query reaches the database
+    def __init__(self, cur, before):
+        self._cur = cur
+        self._before = before
+
+    def execute(self, sql, params=()):
+        if 'phone_index_log' in sql and self._before:
+            before, self._before = self._before, None
+            before()
+        return self._cur.execute(sql, params)
+
+    def fetchall(self):
+        return self._cur.fetchall()
+
+
+def test_index_filters_absent_numbers(server, client, accounts):
+    create(client, '13800000001')
+    index = server.PhoneIndex()
+    assert not synced(server, index) and not index.ready()
+    assert index.rebuild()['keys'] == 1
+    create(client, '13800000002')
+    assert synced(server, index)
+    assert not index.absent('13800000001')
+    assert not index.absent('13800000002')
+    assert index.absent('13800000003')
+    assert index.pending() == 1
+
+
+def test_only_the_super_admin_rebuilds(server, client, accounts, super_id):
+    for user_id in (None, 'a', 'o1'):
+        assert client.post('/api/phone_index', json={'user_id': user_id}).status_code == 403
+    assert not os.path.exists(server.phone_index.path())
+    r = client.post('/api/phone_index', json={'user_id': super_id})
+    assert r.status_code == 200 and r.get_json()['build']['keys'] == 0
+
+
+def test_sync_overtaken_by_two_rebuilds(server, client, accounts):
+    # worker A maps the first build; before its next log read another worker
+    # rebuilds twice, and the second build prunes the log A still needs
+    create(client, '13800000001')
+    builder = server.PhoneIndex()
+    builder.rebuild()
+    worker = server.PhoneIndex()
+    assert synced(server, worker)
+    create(client, '13800000002')
+
+    def rebuild_twice():
+        builder.rebuild()
+        create(client, '13800000003')
+        builder.rebuild()
+
+    assert synced(server, worker, lambda cur: Overtaken(cur, rebuild_twice))
+    cn = server.conn()
+    assert cn.execute("SELECT COUNT(*) FROM phone_index_log WHERE seq<=2").fetchone()[0] == 0
+    cn.close()
+    for phone in ('13800000001', '13800000002', '13800000003'):
+        assert not worker.absent(phone), phone
+    assert worker.pending() == 0
+
+
+def test_sync_gives_up_to_sql_when_the_file_keeps_changing(server, client, accounts):
+    create(client, '13800000001')
+    builder = server.PhoneIndex()
+    builder.rebuild()
+    worker = server.PhoneIndex()
+    cn = server.conn()
+    try:
+        class Racing(Overtaken):
+            def execute(self, sql, params=()):
+                builder.rebuild()
+                return self._cur.execute(sql, params)
+        assert not worker.sync(Racing(cn.cursor(), None))
+    finally:
+        cn.close()
+    assert not worker.ready()
+    assert not worker.absent('13800000009')
+
+
+def test_batch_keeps_its_own_keys_across_a_reload(server, client, accounts, monkeypatch):
+    # another thread of the same worker picks up a fresh build while the
+    # batch is between its two rows; the second row must still see the first
+    create(client, '13800000001')
+    server.phone_index.rebuild()
+    builder = server.PhoneIndex()
+    # the prune would wait for the batch's write lock; only the new file matters here
+    monkeypatch.setattr(builder, 'prune', lambda upto: 0)
+    normalize = server.normalize_phone
+
+    def normalize_phone(p):
+        if p == '13912345678':
+            builder.rebuild()
+            assert synced(server, server.phone_index)
+        return normalize(p)
+
+    monkeypatch.setattr(server, 'normalize_phone', normalize_phone)
+    r = client.post('/api/customers/batch', json={'phones': ['8613912345678', '13912345678'], 'channel_id': 'c1', 'operator_id': 'o1'})
+    assert (r.get_json()['stats']['success'], r.get_json()['stats']['duplicate']) == (1, 1)
+    cn = server.conn()
+    assert cn.execute("SELECT COUNT(*) FROM customers WHERE phone_normalized LIKE '%13912345678'").fetchone()[0] == 1
+    cn.close()
+
+
+def import_worker(db, plan, operator_id, union, start, done, out):
+    # a pre-fork style worker: its own interpreter and server module, the same
+    # database and index files as its siblings, rebuilding the index often
+    os.environ.update({'QUCHONG_DB': db, 'PHONE_INDEX_REBUILD': '40', 'PHONE_INDEX_INTERVAL': '0.01'})
+    import server
+    server.admission.configure({'operator_rate': 1e9, 'operator_burst': 1e9, 'admin_rate': 1e9, 'admin_burst': 1e9, 'batch_concurrency': 64})
+    c = server.app.test_client()
+    stats = {'success': 0, 'duplicate': 0, 'failed': 0}
+    try:
+        start.wait()
+        for phones in plan:
+            r = c.post('/api/customers/batch', json={'phones': phones, 'channel_id': 'c1', 'operator_id': operator_id})
+            if r.status_code != 200:
+                raise RuntimeError(f'{r.status_code} {r.get_data(as_text=True)[:200]}')
+            for k in stats:
+                stats[k] += r.get_json()['stats'][k]
+        done.wait()
+        check = c.post('/api/customers/check', json={'phones': union, 'user_id': operator_id}).get_json()['summary']
+        out.put({'stats': stats, 'check': check, 'index': server.phone_index.status()})
+    except Exception as e:
+        done.abort()
+        out.put({'error': repr(e)})
+
+
+def test_workers_store_each_number_once(server, client, accounts):
+    seeded = [f'1370000{i:04d}' for i in range(20)]
+    r = client.post('/api/customers/batch', json={'phones': seeded, 'channel_id': 'c1', 'operator_id': 'o1'})
+    assert r.get_json()['stats']['success'] == 20
+    server.phone_index.rebuild()
+    rnd = random.Random(7)
+    pool = [f'1390000{i:04d}' for i in range(300)] + seeded[:10]
+    operators = ['o1', 'o2', 'o1', 'o2']
+    plans = []
+    for _ in operators:
+        mine = rnd.sample(pool, 200)
+        plans.append([mine[i:i + 25] for i in range(0, len(mine), 25)])
+    union = sorted({p for plan in plans for b in plan for p in b})
+    ctx = multiprocessing.get_context('spawn')
+    start, done, out = ctx.Barrier(len(plans)), ctx.Barrier(len(plans)), ctx.Queue()
+    procs = [ctx.Process(target=import_worker, args=(server.db_params()['path'], plan, op, union, start, done, out))
+             for plan, op in zip(plans, operators)]
+    for p in procs:
+        p.start()
+    results = [out.get(timeout=120) for _ in procs]
+    for p in procs:
+        p.join(timeout=30)
+    assert not [r for r in results if 'error' in r], results
+    expected = set(union) - set(seeded)
+    cn = server.conn()
+    stored = cn.execute("SELECT phone_normalized, COUNT(*) FROM customers WHERE phone_normalized LIKE '139%' GROUP BY 1").fetchall()
+    cn.close()
+    assert {p for p, n in stored} == expected
+    assert all(n == 1 for p, n in stored)
+    assert sum(r['stats']['success'] for r in results) == len(expected)
+    assert sum(r['stats']['success'] + r['stats']['duplicate'] for r in results) == sum(len(b) for plan in plans for b in plan)
+    assert all(r['check']['new'] == 0 for r in results), results
+    assert sum(r['index']['skipped'] for r in results) > 0
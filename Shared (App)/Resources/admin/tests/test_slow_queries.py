@@ -0,0 +1,17 @@
+import pytest
+
+
+@pytest.mark.parametrize('user_id', [None, 'a', 'o1', 'missing'])
+def test_slow_queries_require_super_admin(client, accounts, user_id):
+    q = f'?user_id={user_id}' if user_id else ''
+    assert client.get('/api/slow_queries' + q).status_code == 403
+    assert client.patch('/api/slow_queries', json={'user_id': user_id, 'threshold_ms': 0}).status_code == 403
+    assert client.delete('/api/slow_queries' + q).status_code == 403
+
+
+def test_super_admin_manages_slow_queries(server, client, accounts, super_id, monkeypatch):
+    monkeypatch.setattr(server.slow_log, 'threshold_ms', server.slow_log.threshold_ms)
+    r = client.patch('/api/slow_queries', json={'user_id': super_id, 'threshold_ms': 250})
+    assert r.status_code == 200 and r.get_json()['threshold_ms'] == 250
+    assert client.get(f'/api/slow_queries?user_id={super_id}').status_code == 200
+    assert client.delete(f'/api/slow_queries?user_id={super_id}').get_json() == {'status': 'ok'}
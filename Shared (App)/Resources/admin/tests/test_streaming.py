@@ -0,0 +1,52 @@
+import sqlite3
+
+import pytest
+
+
+@pytest.fixture
+def opened(server, monkeypatch):
+    conns = []
+    primary = server.conn
+    def conn():
+        cn = primary()
+        conns.append(cn)
+        return cn
+    monkeypatch.setattr(server, 'conn', conn)
+    return conns
+
+
+def closed(cn):
+    try:
+        cn.execute('SELECT 1')
+    except sqlite3.ProgrammingError:
+        return True
+    return False
+
+
+@pytest.mark.parametrize('path', ['/api/users', '/api/channels', '/api/customers?shape=tuples'])
+def test_unread_body_closes_connection(client, accounts, opened, path):
+    resp = client.get(path, buffered=False)
+    assert resp.status_code == 200
+    assert opened and not closed(opened[-1])
+    resp.close()
+    assert closed(opened[-1])
+
+
+def test_read_body_closes_connection(client, accounts, opened):
+    resp = client.get('/api/users')
+    assert {u['id'] for u in resp.get_json()} >= {'a', 'o1', 'a2'}
+    assert closed(opened[-1])
+
+
+def test_bootstrap_unread_closes_connection(server, client, accounts, monkeypatch):
+    conns = []
+    primary = server.conn
+    def conn():
+        cn = primary()
+        conns.append(cn)
+        return cn
+    monkeypatch.setattr(server, 'conn', conn)
+    resp = client.get('/api/bootstrap?user_id=a', buffered=False)
+    assert resp.status_code == 200
+    resp.close()
+    assert conns and all(closed(cn) for cn in conns)
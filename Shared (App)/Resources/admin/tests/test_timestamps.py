@@ -0,0 +1,59 @@
+from datetime import datetime, timezone
+
+
+def ms(text):
+    return int(datetime.fromisoformat(text).replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def add_customer(server, cid, phone_hash, created_at, created_ts=None):
+    cn = server.conn()
+    cn.execute("INSERT INTO customers (id,phone_hash,channel_id,owner_operator_id,owner_admin_id,created_at,created_ts) VALUES (?,?,?,?,?,?,?)",
+               (cid, phone_hash, 'c1', 'o1', 'a', created_at, created_ts))
+    cn.commit()
+    cn.close()
+
+
+def column(server, sql, params=()):
+    cn = server.conn()
+    try:
+        return [r[0] for r in cn.execute(sql, params)]
+    finally:
+        cn.close()
+
+
+def test_write_paths_fill_epoch_columns(server, client, accounts):
+    assert client.post('/api/customers', json={'phone_raw': '13800000001', 'channel_id': 'c1', 'operator_id': 'o1'}).status_code == 200
+    assert client.post('/api/customers', json={'phone_raw': '13800000001', 'channel_id': 'c1', 'operator_id': 'o2'}).status_code == 200
+    r = client.post('/api/customers/batch', json={'phones': ['13800000002', '13800000001'], 'channel_id': 'c1', 'operator_id': 'o2'})
+    assert r.get_json()['stats']['duplicate'] == 1
+    assert server.backfill.pending() == {'customers': 0, 'duplicates': 0}
+
+
+def test_dedup_writes_duplicate_ts(server, accounts):
+    cn = server.conn()
+    cn.execute("DROP INDEX idx_customers_hash")
+    cn.commit()
+    cn.close()
+    add_customer(server, 'k1', 'h', '2024-01-01 08:00:00')
+    add_customer(server, 'k2', 'h', '2024-02-01 09:30:00')
+    assert server.dedup_customers() == 1
+    assert column(server, "SELECT duplicate_ts FROM duplicates WHERE customer_id='k1'") == [ms('2024-02-01 09:30:00')]
+
+
+def test_backfill_picks_up_rows_written_after_a_run(server, accounts):
+    add_customer(server, 'k1', 'h1', '2024-01-01 00:00:00')
+    add_customer(server, 'k2', 'h2', 'not a date')
+    assert server.backfill.run(pause=0) == 1
+    add_customer(server, 'k3', 'h3', '2024-03-01 00:00:00')
+    assert server.backfill.pending()['customers'] == 1
+    assert server.backfill.run(pause=0) == 1
+    assert column(server, "SELECT created_ts FROM customers WHERE id IN ('k1','k3') ORDER BY id") == [ms('2024-01-01 00:00:00'), ms('2024-03-01 00:00:00')]
+    assert server.backfill.filled == 2 and server.backfill.runs == 2
+
+
+def test_maintenance_sweeps_null_timestamps(server, accounts):
+    add_customer(server, 'k1', 'h1', '2024-01-01 00:00:00')
+    report = server.maintenance.run(integrity='off')
+    assert report['ts_backfill'] == 1
+    assert server.backfill.pending()['customers'] == 0
+    assert 'ts_backfill' not in server.maintenance.run(integrity='off')
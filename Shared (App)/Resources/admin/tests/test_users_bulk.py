@@ -0,0 +1,57 @@
+import pytest
+
+
+def bulk(client, **body):
+    r = client.post('/api/users/bulk', json=body)
+    assert r.status_code == 200, r.get_json()
+    return r.get_json()
+
+
+def user(server, username):
+    cn = server.conn()
+    try:
+        return cn.execute("SELECT * FROM users WHERE username=?", (username,)).fetchone()
+    finally:
+        cn.close()
+
+
+def test_statuses(server, client, accounts, super_id):
+    body = bulk(client, owner_admin_id='a', users=[
+        {'username': 'n1', 'display_name': 'N1', 'password': 'pw'},
+        {'username': 'n2', 'display_name': 'N2', 'password': 'pw', 'owner_admin_id': 'a2'},
+        {'username': 'n1', 'display_name': 'again', 'password': 'pw'},
+        {'username': 'o1', 'display_name': 'taken', 'password': 'pw'},
+        {'username': 'n3', 'display_name': 'N3', 'password': 'pw', 'owner_admin_id': 'o1'},
+        {'username': 'n4', 'display_name': 'N4', 'password': 'pw', 'owner_admin_id': ['a']},
+        {'username': 'n5', 'display_name': '', 'password': 'pw'},
+        {'username': 'n6', 'display_name': 'N6', 'password': 'pw', 'role': 'admin'},
+    ])
+    assert [(r['status'], r.get('error')) for r in body['results']] == [
+        ('created', None), ('created', None), ('error', 'duplicate'), ('error', 'exists'),
+        ('error', 'owner'), ('error', 'invalid'), ('error', 'invalid'), ('created', None)]
+    assert (body['created'], body['failed']) == (3, 5)
+    assert user(server, 'n1')['parent_id'] == 'a' and user(server, 'n2')['parent_id'] == 'a2'
+    assert user(server, 'n6')['role'] == 'admin' and user(server, 'n6')['parent_id'] == super_id
+    assert user(server, 'n3') is None and user(server, 'n4') is None
+    # the directory cache picks up the new accounts
+    assert 'n2' in {u['username'] for u in client.get('/api/users?user_id=a2').get_json()}
+
+
+def test_csv(server, client, accounts):
+    body = bulk(client, csv='username,display_name,password,owner\nc_1, C1 ,pw,a\n\nc_2,C2,pw,\n', owner_admin_id='a2')
+    assert [(r['row'], r['username'], r['status']) for r in body['results']] == [(1, 'c_1', 'created'), (2, 'c_2', 'created')]
+    assert user(server, 'c_1')['display_name'] == 'C1'
+    assert (user(server, 'c_1')['parent_id'], user(server, 'c_2')['parent_id']) == ('a', 'a2')
+
+
+@pytest.mark.parametrize('body', [
+    {'users': []},
+    {'users': 'n1'},
+    {'users': [['n1', 'N1', 'pw']]},
+    {'csv': ''},
+    {'owner_admin_id': ['a'], 'users': [{'username': 'n1', 'display_name': 'N1', 'password': 'pw'}]},
+    {'owner_admin_id': {'id': 'a'}, 'users': [{'username': 'n1', 'display_name': 'N1', 'password': 'pw'}]},
+])
+def test_rejects_malformed_requests(server, client, accounts, body):
+    assert client.post('/api/users/bulk', json=body).status_code == 400
+    assert user(server, 'n1') is None
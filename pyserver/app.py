@@ -1,17 +1,33 @@
 import os
+import sys
 import sqlite3
 import time
 import secrets
 import hmac
-import hashlib
+import json
+import csv
+import io
+import zlib
+import mmap
+import struct
+import threading
+import contextvars
+from collections import deque
+from datetime import datetime
 from base64 import b64encode, b64decode
 from uuid import uuid4
 from fastapi import FastAPI, Request, Response, Depends, HTTPException
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import StreamingResponse, FileResponse, JSONResponse
+from starlette.background import BackgroundTask
 from typing import Optional
 from fastapi.middleware.cors import CORSMiddleware
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-import jwt
+from functools import lru_cache
+from hashing import hash_password
+try:
+    import orjson
+except ImportError:
+    orjson=None
 
 PORT=int(os.getenv('PORT','8020'))
 AES_KEY=os.getenv('AES_KEY')
@@ -21,24 +37,259 @@ AES_KEY_BYTES=b64decode(AES_KEY)
 PEPPER=os.getenv('PEPPER') or b64encode(secrets.token_bytes(32)).decode()
 PEPPER_BYTES=b64decode(PEPPER)
 JWT_SECRET=os.getenv('JWT_SECRET') or b64encode(secrets.token_bytes(32)).decode()
+EXPORT_BATCH=2000
+JSON_BATCH=1000
+BULK_USERS_MAX=5000
+HASH_WORKERS=int(os.getenv('HASH_WORKERS','0')) or None
+DIRECTORY_TTL=float(os.getenv('DIRECTORY_TTL','30'))
+REPORT_TZ_OFFSET=int(os.getenv('REPORT_TZ_OFFSET','0'))
+RANGE_LIMIT=100000
+BUCKETS={'hour':3600000,'day':86400000}
+SLOW_QUERY_MS=float(os.getenv('SLOW_QUERY_MS','0'))
+SLOW_QUERY_LOG=int(os.getenv('SLOW_QUERY_LOG','200'))
+PROFILE_TOKEN=os.getenv('PROFILE_TOKEN')
+PROFILE_DIR=os.getenv('PROFILE_DIR') or os.path.join(os.path.dirname(__file__),'data','profiles')
+PROFILE_INTERVAL=float(os.getenv('PROFILE_INTERVAL','0.005'))
 
 app=FastAPI()
 app.add_middleware(CORSMiddleware,allow_origins=['*'],allow_credentials=True,allow_methods=['*'],allow_headers=['*'])
 
 data_dir=os.path.join(os.path.dirname(__file__),'data')
 os.makedirs(data_dir,exist_ok=True)
-db_path=os.path.join(data_dir,'app.db')
+db_path=os.getenv('APP_DB') or os.path.join(data_dir,'app.db')
 
 # 静态资源托管（admin 前端）
 static_root=os.path.join(os.path.dirname(__file__),'..','Shared (App)','Resources','admin')
 if os.path.isdir(static_root):
     app.mount('/', StaticFiles(directory=static_root, html=True), name='static')
 
+request_path=contextvars.ContextVar('request_path',default=None)
+
+def params_shape(params,many=False):
+    # types only, never values
+    if many:
+        rows=params if isinstance(params,(list,tuple)) else None
+        return {'rows':len(rows) if rows is not None else None,'each':params_shape(rows[0]) if rows else None}
+    if isinstance(params,dict):
+        return {k:type(v).__name__ for k,v in params.items()}
+    shape=[type(v).__name__ for v in params[:20]]
+    if len(params)>20:
+        shape.append(f'+{len(params)-20}')
+    return shape
+
+class SlowQueryLog:
+    # execute plus the fetches that drain it; kept with its plan when at or above threshold_ms
+    def __init__(self,threshold_ms=SLOW_QUERY_MS,size=SLOW_QUERY_LOG):
+        self.threshold_ms=threshold_ms
+        self.entries=deque(maxlen=size)
+        self.recorded=0
+
+    @property
+    def enabled(self):
+        return self.threshold_ms>0
+
+    def record(self,c,sql,params,many,elapsed,rows,path):
+        entry={'at':time.time(),'ms':round(elapsed*1000,2),'sql':' '.join(sql.split())[:2000],'params':params_shape(params,many),'rows':rows,'path':path,'plan':None}
+        if sql.lstrip()[:7].upper().startswith(('SELECT','WITH','INSERT','UPDATE','DELETE','REPLACE')):
+            try:
+                first=(params[0] if params else ()) if many else params
+                cur=sqlite3.Connection.cursor(c)
+                entry['plan']=[r[3] for r in cur.execute('EXPLAIN QUERY PLAN '+sql,first).fetchall()]
+                cur.close()
+            except Exception as e:
+                entry['plan']=[f'unavailable: {e}']
+        self.entries.append(entry)
+        self.recorded+=1
+
+    def status(self):
+        return {'threshold_ms':self.threshold_ms,'size':self.entries.maxlen,'recorded':self.recorded,'entries':list(reversed(self.entries))}
+
+slow_log=SlowQueryLog()
+
+class TracedCursor(sqlite3.Cursor):
+    _pending=None
+
+    def _finish(self):
+        p=self._pending
+        if p is None:
+            return
+        self._pending=None
+        sql,params,many,elapsed,rows,path=p
+        if elapsed*1000>=slow_log.threshold_ms:
+            slow_log.record(self.connection,sql,params,many,elapsed,rows or max(self.rowcount,0),path)
+
+    def _run(self,fn,sql,params,many):
+        self._finish()
+        t0=time.perf_counter()
+        try:
+            return fn(sql,params)
+        finally:
+            self._pending=[sql,params,many,time.perf_counter()-t0,0,request_path.get()]
+            if self.description is None:
+                self._finish()
+
+    def execute(self,sql,params=()):
+        return self._run(super().execute,sql,params,False)
+
+    def executemany(self,sql,params):
+        return self._run(super().executemany,sql,params,True)
+
+    def _fetched(self,t0,rows,done):
+        p=self._pending
+        if p is not None:
+            p[3]+=time.perf_counter()-t0
+            p[4]+=rows
+            if done:
+                self._finish()
+
+    def fetchone(self):
+        t0=time.perf_counter()
+        r=super().fetchone()
+        self._fetched(t0,r is not None,r is None)
+        return r
+
+    def fetchmany(self,size=None):
+        size=self.arraysize if size is None else size
+        t0=time.perf_counter()
+        rows=super().fetchmany(size)
+        self._fetched(t0,len(rows),len(rows)<size)
+        return rows
+
+    def fetchall(self):
+        t0=time.perf_counter()
+        rows=super().fetchall()
+        self._fetched(t0,len(rows),True)
+        return rows
+
+    def __next__(self):
+        t0=time.perf_counter()
+        try:
+            r=super().__next__()
+        except StopIteration:
+            self._fetched(t0,0,True)
+            raise
+        self._fetched(t0,1,False)
+        return r
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+class TracedConnection(sqlite3.Connection):
+    def cursor(self,factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self,sql,params=()):
+        return self.cursor().execute(sql,params)
+
+    def executemany(self,sql,params):
+        return self.cursor().executemany(sql,params)
+
+def connect(**kw):
+    return sqlite3.connect(db_path,factory=TracedConnection if slow_log.enabled else sqlite3.Connection,**kw)
+
+class Sampler:
+    # wall-clock sampler over every thread but its own (sync endpoints run in the
+    # threadpool, not in the middleware's thread); folded output for flamegraph.pl/speedscope
+    def __init__(self,interval=PROFILE_INTERVAL):
+        self.interval=interval
+        self.stacks={}
+        self.samples=0
+        self.stop_event=threading.Event()
+        self.thread=threading.Thread(target=self.run,name='profiler',daemon=True)
+
+    def run(self):
+        me=threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            names={t.ident:t.name for t in threading.enumerate()}
+            for ident,f in sys._current_frames().items():
+                if ident==me:
+                    continue
+                stack=[]
+                while f is not None:
+                    stack.append(f'{f.f_code.co_name} ({os.path.basename(f.f_code.co_filename)}:{f.f_code.co_firstlineno})')
+                    f=f.f_back
+                key=names.get(ident,str(ident))+';'+';'.join(reversed(stack))
+                self.stacks[key]=self.stacks.get(key,0)+1
+            self.samples+=1
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+    def folded(self):
+        return ''.join(f'{k} {v}\n' for k,v in sorted(self.stacks.items()))
+
+def profile_allowed(req:Request):
+    token=req.headers.get('X-Profile') or req.query_params.get('profile')
+    return bool(PROFILE_TOKEN and token and hmac.compare_digest(token,PROFILE_TOKEN))
+
+@app.middleware('http')
+async def profile_request(req:Request,call_next):
+    request_path.set(req.url.path)
+    if not profile_allowed(req) or req.url.path.startswith('/api/profiles'):
+        return await call_next(req)
+    p=Sampler().start()
+    try:
+        resp=await call_next(req)
+    finally:
+        p.stop()
+    os.makedirs(PROFILE_DIR,exist_ok=True)
+    name=f"{time.strftime('%Y%m%d-%H%M%S')}-{req.url.path.strip('/').replace('/','_')}-{uuid4().hex[:6]}.folded"
+    with open(os.path.join(PROFILE_DIR,name),'w',encoding='utf-8') as f:
+        f.write(p.folded())
+    resp.headers['X-Profile-File']=name
+    return resp
+
 def conn():
-    c=sqlite3.connect(db_path)
+    c=connect()
     c.row_factory=sqlite3.Row
     return c
 
+def stream_conn():
+    # StreamingResponse pulls sync generators from a threadpool, so the connection must be shareable
+    return connect(check_same_thread=False)
+
+def json_dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj,ensure_ascii=False,separators=(',',':')).encode('utf-8')
+
+def json_rows(sql,params=(),tuples=False):
+    c=stream_conn()
+    try:
+        cur=c.execute(sql,params)
+    except Exception:
+        c.close()
+        raise
+    cols=[d[0] for d in cur.description]
+    def gen():
+        try:
+            yield (b'{"columns":'+json_dumps(cols)+b',"rows":[') if tuples else b'['
+            first=True
+            while True:
+                rows=cur.fetchmany(JSON_BATCH)
+                if not rows:
+                    break
+                body=json_dumps(rows if tuples else [dict(zip(cols,r)) for r in rows])[1:-1]
+                yield body if first else b','+body
+                first=False
+            yield b']}' if tuples else b']'
+        finally:
+            c.close()
+    # the generator's finally only runs once iteration has started; the task also covers bodies never sent
+    return StreamingResponse(gen(),media_type='application/json',background=BackgroundTask(c.close))
+
 def init_db():
     c=conn()
     c.execute('CREATE TABLE IF NOT EXISTS users (id TEXT PRIMARY KEY, username TEXT UNIQUE, display_name TEXT, role TEXT, parent_id TEXT, is_active INTEGER, salt TEXT, password_hash TEXT, created_at INTEGER)')
@@ -53,9 +304,9 @@ def init_db():
         s1=secrets.token_hex(8)
         s2=secrets.token_hex(8)
         s3=secrets.token_hex(8)
-        h1=hashlib.pbkdf2_hmac('sha256','123456'.encode(),s1.encode(),100000).hex()
-        h2=hashlib.pbkdf2_hmac('sha256','123456'.encode(),s2.encode(),100000).hex()
-        h3=hashlib.pbkdf2_hmac('sha256','123456'.encode(),s3.encode(),100000).hex()
+        h1=hash_password('123456',s1)
+        h2=hash_password('123456',s2)
+        h3=hash_password('123456',s3)
         ts=int(time.time()*1000)
         c.execute('INSERT INTO users(id,username,display_name,role,parent_id,is_active,salt,password_hash,created_at) VALUES(?,?,?,?,?,?,?,?,?)',(super_id,'super','超级管理员','super_admin',None,1,s1,h1,ts))
         c.execute('INSERT INTO users(id,username,display_name,role,parent_id,is_active,salt,password_hash,created_at) VALUES(?,?,?,?,?,?,?,?,?)',(admin_id,'adminA','管理员A','admin',super_id,1,s2,h2,ts))
@@ -65,6 +316,73 @@ def init_db():
     c.commit()
     c.close()
 
+def time_indexes():
+    # created_at/duplicate_at are already epoch ms; the channel indexes carry
+    # the owner columns so scoped per-channel reports stay inside the index
+    c=conn()
+    c.execute('CREATE INDEX IF NOT EXISTS idx_customers_at ON customers(created_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_customers_admin_at ON customers(owner_admin_id,created_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_customers_operator_at ON customers(owner_operator_id,created_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_customers_channel_at ON customers(channel_id,created_at,owner_admin_id,owner_operator_id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_duplicates_at ON duplicates(duplicate_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_duplicates_operator_at ON duplicates(duplicate_operator_id,duplicate_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_duplicates_channel_at ON duplicates(duplicate_channel_id,duplicate_at,duplicate_operator_id)')
+    c.commit()
+    c.close()
+
+MIGRATIONS=[('init_db',init_db),('time_indexes',time_indexes)]
+SCHEMA_VERSION=len(MIGRATIONS)
+
+def schema_version():
+    c=sqlite3.connect(db_path)
+    try:
+        return c.execute('PRAGMA user_version').fetchone()[0]
+    finally:
+        c.close()
+
+def migrate(rerun=False):
+    lock=sqlite3.connect(db_path+'.migrate-lock',timeout=600,isolation_level=None)
+    try:
+        lock.execute('BEGIN EXCLUSIVE')
+        start=0 if rerun else schema_version()
+        applied=[]
+        for i,(name,fn) in enumerate(MIGRATIONS):
+            if i<start:
+                continue
+            t0=time.time()
+            fn()
+            c=sqlite3.connect(db_path)
+            c.execute(f'PRAGMA user_version={i+1}')
+            c.close()
+            applied.append((name,round(time.time()-t0,3)))
+        lock.execute('COMMIT')
+        directory.invalidate()
+        return applied
+    finally:
+        lock.close()
+
+def ensure_schema():
+    if schema_version()<SCHEMA_VERSION:
+        for name,secs in migrate():
+            print(f'migrated {name} ({secs}s)')
+
+@lru_cache(maxsize=1)
+def hash_pool():
+    from concurrent.futures import ProcessPoolExecutor
+    return ProcessPoolExecutor(max_workers=HASH_WORKERS)
+
+def hash_passwords(passwords,salts):
+    # PBKDF2 holds the GIL, so large batches fan out over worker processes
+    if len(passwords)<2:
+        return [hash_password(p,s) for p,s in zip(passwords,salts)]
+    workers=HASH_WORKERS or os.cpu_count() or 1
+    return list(hash_pool().map(hash_password,passwords,salts,chunksize=max(1,len(passwords)//(workers*4))))
+
+@lru_cache(maxsize=1)
+def aesgcm():
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    return AESGCM(AES_KEY_BYTES)
+
 def normalize_phone(s):
     s=str(s or '').strip()
     digits=''.join(ch for ch in s if ch.isdigit())
@@ -77,21 +395,120 @@ def phone_hmac(text):
 
 def phone_encrypt(text):
     iv=secrets.token_bytes(12)
-    a=AESGCM(AES_KEY_BYTES)
-    ct=a.encrypt(iv,text.encode(),None)
+    ct=aesgcm().encrypt(iv,text.encode(),None)
     return b64encode(iv+ct).decode()
 
+def phone_decrypt_many(items):
+    a=aesgcm()
+    out=[]
+    for b in items:
+        try:
+            raw=b64decode(b)
+            out.append(a.decrypt(raw[:12],raw[12:],None).decode())
+        except Exception:
+            out.append('')
+    return out
+
+class SharedGeneration:
+    # an 8-byte counter in a file every worker maps; bump() after a commit
+    # tells the other processes that their cached copies are stale. Each bump
+    # writes a fresh value, so concurrent bumps never cancel out.
+    def __init__(self):
+        self._map=None
+        self._lock=threading.Lock()
+
+    def _mapped(self):
+        if self._map is None:
+            with self._lock:
+                if self._map is None:
+                    with open(db_path+'.generation','a+b') as f:
+                        if f.seek(0,os.SEEK_END)<8:
+                            f.write(bytes(8-f.tell()))
+                            f.flush()
+                        self._map=mmap.mmap(f.fileno(),8)
+        return self._map
+
+    def value(self):
+        return struct.unpack_from('<Q',self._mapped())[0]
+
+    def bump(self):
+        struct.pack_into('<Q',self._mapped(),0,time.time_ns())
+
+generation=SharedGeneration()
+
+class Directory:
+    # in-memory users/channels, dropped by every handler that writes them;
+    # invalidate() also bumps the shared generation so other worker processes
+    # reload on their next lookup. TTL and reload-on-unknown-id cover writes
+    # made outside this server.
+    def __init__(self,ttl=DIRECTORY_TTL):
+        self.ttl=ttl
+        self.lock=threading.Lock()
+        self.tables=None
+        self.loaded_at=0.0
+        self.generation=None
+        self.hits=0
+        self.misses=0
+        self.loads=0
+        self.invalidations=0
+
+    def load(self):
+        gen=generation.value()
+        c=conn()
+        try:
+            users={r['id']:dict(r) for r in c.execute('SELECT id,username,display_name,role,parent_id,is_active,created_at FROM users')}
+            channels={r['id']:dict(r) for r in c.execute('SELECT id,name,is_active FROM channels')}
+        finally:
+            c.close()
+        self.tables={'users':users,'channels':channels}
+        self.generation=gen
+        self.loaded_at=time.time()
+        self.loads+=1
+        return self.tables
+
+    def get(self,kind,key):
+        t=self.tables
+        fresh=self.generation==generation.value()
+        if t is not None and key in t[kind] and fresh and time.time()-self.loaded_at<self.ttl:
+            self.hits+=1
+            return t[kind][key]
+        with self.lock:
+            self.misses+=1
+            t=self.tables
+            age=time.time()-self.loaded_at
+            if t is None or age>=self.ttl or self.generation!=generation.value() or (key not in t[kind] and age>=1):
+                t=self.load()
+            return t[kind].get(key)
+
+    def user(self,uid):
+        return self.get('users',uid) if uid else None
+
+    def channel(self,cid):
+        return self.get('channels',cid) if cid else None
+
+    def invalidate(self):
+        self.tables=None
+        self.invalidations+=1
+        generation.bump()
+
+    def status(self):
+        t=self.tables
+        n=self.hits+self.misses
+        return {'hits':self.hits,'misses':self.misses,'hit_rate':round(self.hits/n,4) if n else None,'loads':self.loads,'invalidations':self.invalidations,
+                'ttl':self.ttl,'users':len(t['users']) if t else 0,'channels':len(t['channels']) if t else 0}
+
+directory=Directory()
+
 def auth_user(req:Request):
     t=req.cookies.get('token')
     if not t:
         raise HTTPException(status_code=401,detail='unauth')
+    import jwt
     try:
         p=jwt.decode(t,JWT_SECRET,algorithms=['HS256'])
     except Exception:
         raise HTTPException(status_code=401,detail='unauth')
-    c=conn()
-    u=c.execute('SELECT id,username,display_name,role,parent_id,is_active,created_at FROM users WHERE id=?',(p['id'],)).fetchone()
-    c.close()
+    u=directory.user(p['id'])
     if not u:
         raise HTTPException(status_code=401,detail='unauth')
     return dict(u)
@@ -107,9 +524,10 @@ def login(body:dict,resp:Response):
     c.close()
     if not row:
         raise HTTPException(status_code=400,detail='invalid')
-    h=hashlib.pbkdf2_hmac('sha256',p.encode(),row['salt'].encode(),100000).hex()
+    h=hash_password(p,row['salt'])
     if h!=row['password_hash']:
         raise HTTPException(status_code=400,detail='invalid')
+    import jwt
     token=jwt.encode({'id':row['id'],'role':row['role'],'exp':int(time.time())+7200},JWT_SECRET,algorithm='HS256')
     resp.set_cookie('token',token,httponly=True,samesite='lax')
     return {'ok':True,'role':row['role'],'display_name':row['display_name']}
@@ -123,12 +541,54 @@ def logout(resp:Response):
 def me(user:dict=Depends(auth_user)):
     return user
 
+@app.get('/api/directory')
+def directory_status(user:dict=Depends(auth_user)):
+    return directory.status()
+
+def require_super(user):
+    if user['role']!='super_admin':
+        raise HTTPException(status_code=403,detail='forbidden')
+
+@app.get('/api/slow_queries')
+def slow_queries(user:dict=Depends(auth_user)):
+    require_super(user)
+    return slow_log.status()
+
+@app.patch('/api/slow_queries')
+def patch_slow_queries(body:dict,user:dict=Depends(auth_user)):
+    require_super(user)
+    try:
+        if 'threshold_ms' in body:
+            slow_log.threshold_ms=float(body['threshold_ms'])
+        if 'size' in body:
+            slow_log.entries=deque(slow_log.entries,maxlen=max(1,int(body['size'])))
+    except (TypeError,ValueError):
+        raise HTTPException(status_code=400,detail='invalid')
+    return slow_log.status()
+
+@app.delete('/api/slow_queries')
+def clear_slow_queries(user:dict=Depends(auth_user)):
+    require_super(user)
+    slow_log.entries.clear()
+    return {'status':'ok'}
+
+@app.get('/api/profiles')
+def list_profiles(user:dict=Depends(auth_user)):
+    require_super(user)
+    names=sorted(os.listdir(PROFILE_DIR),reverse=True) if os.path.isdir(PROFILE_DIR) else []
+    return [{'name':n,'size':os.path.getsize(os.path.join(PROFILE_DIR,n))} for n in names]
+
+@app.get('/api/profiles/{name}')
+def get_profile(name:str,user:dict=Depends(auth_user)):
+    require_super(user)
+    path=os.path.join(PROFILE_DIR,os.path.basename(name))
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404,detail='not_found')
+    return FileResponse(path,filename=os.path.basename(path))
+
 @app.get('/api/channels')
-def channels(user:dict=Depends(auth_user)):
-    c=conn()
-    rows=c.execute('SELECT id,name,is_active,created_at FROM channels WHERE is_active=1 ORDER BY created_at DESC').fetchall()
-    c.close()
-    return [dict(r) for r in rows]
+def channels(shape:Optional[str]=None,user:dict=Depends(auth_user)):
+    return json_rows('SELECT id,name,is_active,created_at FROM channels WHERE is_active=1 ORDER BY created_at DESC',tuples=shape=='tuples')
 
 @app.post('/api/channels')
 def create_channel(body:dict,user:dict=Depends(auth_user)):
@@ -146,32 +606,24 @@ def create_channel(body:dict,user:dict=Depends(auth_user)):
     c.execute('INSERT INTO channels(id,name,created_by,is_active,created_at) VALUES(?,?,?,?,?)',(id,name,user['id'],1,int(time.time()*1000)))
     c.commit()
     c.close()
+    directory.invalidate()
     return {'id':id,'name':name}
 
 @app.get('/api/users/admins')
-def admins(user:dict=Depends(auth_user)):
+def admins(shape:Optional[str]=None,user:dict=Depends(auth_user)):
     if user['role']!='super_admin':
         raise HTTPException(status_code=403,detail='forbidden')
-    c=conn()
-    rows=c.execute('SELECT id,username,display_name,role,is_active,created_at FROM users WHERE role=? ORDER BY created_at DESC',('admin',)).fetchall()
-    c.close()
-    return [dict(r) for r in rows]
+    return json_rows('SELECT id,username,display_name,role,is_active,created_at FROM users WHERE role=? ORDER BY created_at DESC',('admin',),tuples=shape=='tuples')
 
 @app.get('/api/users/operators')
-def operators(adminId:Optional[str]=None,user:dict=Depends(auth_user)):
-    c=conn()
+def operators(adminId:Optional[str]=None,shape:Optional[str]=None,user:dict=Depends(auth_user)):
+    t=shape=='tuples'
     if user['role']=='admin':
-        rows=c.execute('SELECT id,username,display_name,role,parent_id,is_active,created_at FROM users WHERE role=? AND parent_id=? ORDER BY created_at DESC',('operator',user['id'])).fetchall()
-        c.close()
-        return [dict(r) for r in rows]
+        return json_rows('SELECT id,username,display_name,role,parent_id,is_active,created_at FROM users WHERE role=? AND parent_id=? ORDER BY created_at DESC',('operator',user['id']),tuples=t)
     if user['role']=='super_admin':
         if adminId:
-            rows=c.execute('SELECT id,username,display_name,role,parent_id,is_active,created_at FROM users WHERE role=? AND parent_id=? ORDER BY created_at DESC',('operator',adminId)).fetchall()
-        else:
-            rows=c.execute('SELECT id,username,display_name,role,parent_id,is_active,created_at FROM users WHERE role=? ORDER BY created_at DESC',('operator',)).fetchall()
-        c.close()
-        return [dict(r) for r in rows]
-    c.close()
+            return json_rows('SELECT id,username,display_name,role,parent_id,is_active,created_at FROM users WHERE role=? AND parent_id=? ORDER BY created_at DESC',('operator',adminId),tuples=t)
+        return json_rows('SELECT id,username,display_name,role,parent_id,is_active,created_at FROM users WHERE role=? ORDER BY created_at DESC',('operator',),tuples=t)
     raise HTTPException(status_code=403,detail='forbidden')
 
 @app.post('/api/users/admin')
@@ -190,10 +642,11 @@ def create_admin(body:dict,user:dict=Depends(auth_user)):
         raise HTTPException(status_code=409,detail='exists')
     id=str(uuid4())
     salt=secrets.token_hex(8)
-    ph=hashlib.pbkdf2_hmac('sha256',password.encode(),salt.encode(),100000).hex()
+    ph=hash_password(password,salt)
     c.execute('INSERT INTO users(id,username,display_name,role,parent_id,is_active,salt,password_hash,created_at) VALUES(?,?,?,?,?,?,?,?,?)',(id,username,display_name,'admin',user['id'],1,salt,ph,int(time.time()*1000)))
     c.commit()
     c.close()
+    directory.invalidate()
     return {'id':id,'username':username,'display_name':display_name}
 
 @app.post('/api/users/operator')
@@ -215,12 +668,83 @@ def create_operator(body:dict,user:dict=Depends(auth_user)):
         raise HTTPException(status_code=409,detail='exists')
     id=str(uuid4())
     salt=secrets.token_hex(8)
-    ph=hashlib.pbkdf2_hmac('sha256',password.encode(),salt.encode(),100000).hex()
+    ph=hash_password(password,salt)
     c.execute('INSERT INTO users(id,username,display_name,role,parent_id,is_active,salt,password_hash,created_at) VALUES(?,?,?,?,?,?,?,?,?)',(id,username,display_name,'operator',owner_admin_id,1,salt,ph,int(time.time()*1000)))
     c.commit()
     c.close()
+    directory.invalidate()
     return {'id':id,'username':username,'display_name':display_name,'parent_id':owner_admin_id}
 
+def bulk_user_rows(body):
+    rows=body.get('users')
+    if rows is None and isinstance(body.get('csv'),str):
+        rows=[]
+        for rec in csv.reader(io.StringIO(body['csv'])):
+            rec=[x.strip() for x in rec]+['','','','']
+            if not any(rec):
+                continue
+            rows.append({'username':rec[0],'display_name':rec[1],'password':rec[2],'owner_admin_id':rec[3] or None})
+        if rows and rows[0]['username'].lower() in ('username','用户名'):
+            rows=rows[1:]
+    return rows
+
+@app.post('/api/users/bulk')
+def create_users_bulk(body:dict,user:dict=Depends(auth_user)):
+    if user['role'] not in ['super_admin','admin']:
+        raise HTTPException(status_code=403,detail='forbidden')
+    rows=bulk_user_rows(body)
+    if not isinstance(rows,list) or not rows or len(rows)>BULK_USERS_MAX or not all(isinstance(r,dict) for r in rows):
+        raise HTTPException(status_code=400,detail='invalid')
+    role=body.get('role') or 'operator'
+    if body.get('owner_admin_id') is not None and not isinstance(body.get('owner_admin_id'),str):
+        raise HTTPException(status_code=400,detail='invalid')
+    names=[str(r.get('username') or '').strip() for r in rows]
+    owners=[user['id'] if user['role']=='admin' else (r.get('owner_admin_id') or body.get('owner_admin_id')) for r in rows]
+    c=conn()
+    try:
+        taken={r[0] for r in c.execute('SELECT username FROM users WHERE username IN (SELECT value FROM json_each(?))',(json.dumps(names),))}
+        admins={r[0] for r in c.execute("SELECT id FROM users WHERE role='admin' AND id IN (SELECT value FROM json_each(?))",(json.dumps([o for o in owners if isinstance(o,str)]),))}
+        results=[]
+        todo=[]
+        seen=set()
+        for i,r in enumerate(rows):
+            username=names[i]
+            display_name=str(r.get('display_name') or '').strip()
+            password=str(r.get('password') or '')
+            r_role=r.get('role') or role
+            parent_id=user['id'] if r_role=='admin' else owners[i]
+            res={'row':i+1,'username':username}
+            if not username or not display_name or not password or r_role not in ('admin','operator') or not isinstance(owners[i] or '',str):
+                res.update(status='error',error='invalid')
+            elif r_role=='admin' and user['role']!='super_admin':
+                res.update(status='error',error='forbidden')
+            elif username in taken:
+                res.update(status='error',error='exists')
+            elif username in seen:
+                res.update(status='error',error='duplicate')
+            elif r_role=='operator' and parent_id not in admins:
+                res.update(status='error',error='owner')
+            else:
+                res.update(status='created',id=str(uuid4()),role=r_role,parent_id=parent_id)
+                todo.append((res,display_name,password,secrets.token_hex(8)))
+            seen.add(username)
+            results.append(res)
+        hashes=hash_passwords([t[2] for t in todo],[t[3] for t in todo])
+        ts=int(time.time()*1000)
+        for (res,display_name,_,salt),ph in zip(todo,hashes):
+            try:
+                c.execute('INSERT INTO users(id,username,display_name,role,parent_id,is_active,salt,password_hash,created_at) VALUES(?,?,?,?,?,?,?,?,?)',(res['id'],res['username'],display_name,res['role'],res['parent_id'],1,salt,ph,ts))
+            except sqlite3.IntegrityError:
+                res.update(status='error',error='exists')
+                del res['id'],res['role'],res['parent_id']
+        c.commit()
+    finally:
+        c.close()
+    created=sum(1 for r in results if r['status']=='created')
+    if created:
+        directory.invalidate()
+    return {'created':created,'failed':len(results)-created,'results':results}
+
 @app.patch('/api/users/{uid}/password')
 def change_password(uid:str,body:dict,user:dict=Depends(auth_user)):
     new_password=body.get('new_password')
@@ -236,7 +760,7 @@ def change_password(uid:str,body:dict,user:dict=Depends(auth_user)):
             c.close()
             raise HTTPException(status_code=403,detail='forbidden')
     salt=secrets.token_hex(8)
-    ph=hashlib.pbkdf2_hmac('sha256',new_password.encode(),salt.encode(),100000).hex()
+    ph=hash_password(new_password,salt)
     c.execute('UPDATE users SET salt=?, password_hash=? WHERE id=?',(salt,ph,uid))
     c.commit()
     c.close()
@@ -249,29 +773,26 @@ def create_customer(body:dict,user:dict=Depends(auth_user)):
     operator_id=body.get('operator_id')
     if not phone_raw or not channel_id or not operator_id:
         raise HTTPException(status_code=400,detail='invalid')
-    c=conn()
-    op=c.execute('SELECT * FROM users WHERE id=? AND role=? AND is_active=1',(operator_id,'operator')).fetchone()
-    if not op or not op['parent_id']:
-        c.close()
+    op=directory.user(operator_id)
+    if not op or op['role']!='operator' or not op['is_active'] or not op['parent_id']:
         raise HTTPException(status_code=403,detail='auth')
     if user['role']=='operator' and user['id']!=op['id']:
-        c.close()
         raise HTTPException(status_code=403,detail='forbidden')
     if user['role']=='admin' and op['parent_id']!=user['id']:
-        c.close()
         raise HTTPException(status_code=403,detail='forbidden')
     normalized=normalize_phone(phone_raw)
     phash=phone_hmac(normalized)
     pencrypt=phone_encrypt(normalized)
     admin_id=op['parent_id']
+    c=conn()
     existing=c.execute('SELECT * FROM customers WHERE phone_hash=? AND owner_admin_id=?',(phash,admin_id)).fetchone()
     if existing:
         dup_id=str(uuid4())
         c.execute('INSERT INTO duplicates(id,customer_id,first_owner_id,duplicate_operator_id,duplicate_channel_id,duplicate_at) VALUES(?,?,?,?,?,?)',(dup_id,existing['id'],existing['owner_operator_id'],op['id'],channel_id,int(time.time()*1000)))
-        owner=c.execute('SELECT id,username,display_name FROM users WHERE id=?',(existing['owner_operator_id'],)).fetchone()
+        owner=directory.user(existing['owner_operator_id'])
         c.commit()
         c.close()
-        return {'status':'duplicate','existing_owner':dict(owner) if owner else None,'existing_created_at':existing['created_at']}
+        return {'status':'duplicate','existing_owner':{k:owner[k] for k in ('id','username','display_name')} if owner else None,'existing_created_at':existing['created_at']}
     cid=str(uuid4())
     c.execute('INSERT INTO customers(id,phone_hash,phone_encrypted,channel_id,owner_operator_id,owner_admin_id,created_at) VALUES(?,?,?,?,?,?,?)',(cid,phash,pencrypt,channel_id,op['id'],admin_id,int(time.time()*1000)))
     c.commit()
@@ -279,8 +800,7 @@ def create_customer(body:dict,user:dict=Depends(auth_user)):
     return {'status':'success'}
 
 @app.get('/api/customers')
-def list_customers(q:Optional[str]=None,page:int=1,size:int=20,user:dict=Depends(auth_user)):
-    c=conn()
+def list_customers(q:Optional[str]=None,page:int=1,size:int=20,shape:Optional[str]=None,user:dict=Depends(auth_user)):
     base='SELECT c.id,c.channel_id,c.owner_operator_id,c.owner_admin_id,c.created_at,u.username AS op_username,a.username AS admin_username,ch.name AS channel_name FROM customers c JOIN users u ON c.owner_operator_id=u.id LEFT JOIN users a ON c.owner_admin_id=a.id LEFT JOIN channels ch ON c.channel_id=ch.id'
     wh=[]
     params=[]
@@ -299,12 +819,177 @@ def list_customers(q:Optional[str]=None,page:int=1,size:int=20,user:dict=Depends
     base+=' ORDER BY c.created_at DESC'
     off=(page-1)*size
     base+=f' LIMIT {size} OFFSET {off}'
-    rows=c.execute(base,params).fetchall()
-    c.close()
-    return [dict(r) for r in rows]
+    return json_rows(base,params,tuples=shape=='tuples')
+
+def ms_iso(ts):
+    return datetime.fromtimestamp(ts/1000).strftime('%Y-%m-%d %H:%M:%S') if ts else ''
+
+# a cell starting with one of these is read as a formula by spreadsheet apps
+FORMULA_PREFIXES=('=','+','-','@','\t','\r')
+
+def csv_cell(v):
+    return "'"+v if isinstance(v,str) and v.startswith(FORMULA_PREFIXES) else v
+
+def csv_stream(c,cur,header,convert,gz=False):
+    enc=zlib.compressobj(6,zlib.DEFLATED,31) if gz else None
+    buf=io.StringIO()
+    w=csv.writer(buf,quoting=csv.QUOTE_ALL,lineterminator='\r\n')
+    try:
+        buf.write('\ufeff')
+        w.writerow(header)
+        while True:
+            rows=cur.fetchmany(EXPORT_BATCH)
+            if rows:
+                w.writerows([csv_cell(v) for v in r] for r in convert(rows))
+            chunk=buf.getvalue().encode('utf-8')
+            buf.seek(0);buf.truncate()
+            if enc is not None:
+                chunk=enc.compress(chunk)
+            if chunk:
+                yield chunk
+            if not rows:
+                break
+        if enc is not None:
+            yield enc.flush()
+    finally:
+        c.close()
+
+def export_response(gen,name,gz,c):
+    fname=name+('.csv.gz' if gz else '.csv')
+    return StreamingResponse(gen,media_type='application/gzip' if gz else 'text/csv; charset=utf-8',headers={'Content-Disposition':f'attachment; filename="{fname}"','Cache-Control':'no-store'},background=BackgroundTask(c.close))
+
+TIME_TABLES={
+    'customers':{'ts':'created_at','channel':'channel_id','operator':'owner_operator_id','admin':'owner_admin_id'},
+    'duplicates':{'ts':'duplicate_at','channel':'duplicate_channel_id','operator':'duplicate_operator_id','admin':None},
+}
+
+def time_filters(table,user,start,end,channel_id):
+    t=TIME_TABLES[table]
+    wh=[t['ts']+'>=?']
+    params=[start if start is not None else 0]
+    if end is not None:
+        wh.append(t['ts']+'<?')
+        params.append(end)
+    if channel_id:
+        wh.append(t['channel']+'=?')
+        params.append(channel_id)
+    if user['role']=='operator':
+        wh.append(t['operator']+'=?')
+        params.append(user['id'])
+    elif user['role']=='admin':
+        wh.append(t['admin']+'=?' if t['admin'] else t['operator']+' IN (SELECT id FROM users WHERE parent_id=?)')
+        params.append(user['id'])
+    return ' AND '.join(wh),params
+
+def time_range(table,user,start,end,channel_id,limit,shape):
+    wh,params=time_filters(table,user,start,end,channel_id)
+    limit=min(limit or RANGE_LIMIT,RANGE_LIMIT)
+    return json_rows(f'SELECT * FROM {table} WHERE {wh} ORDER BY {TIME_TABLES[table]["ts"]} LIMIT {int(limit)}',params,tuples=shape=='tuples')
+
+def time_buckets(table,user,start,end,channel_id,bucket,tz,shape):
+    size=BUCKETS.get(bucket)
+    if not size:
+        raise HTTPException(status_code=400,detail='invalid')
+    wh,params=time_filters(table,user,start,end,channel_id)
+    off=(REPORT_TZ_OFFSET if tz is None else tz)*60000
+    ts=TIME_TABLES[table]['ts']
+    return json_rows(f'SELECT (({ts}+?)/?)*?-? AS bucket,COUNT(*) AS count FROM {table} WHERE {wh} GROUP BY 1 ORDER BY 1',[off,size,size,off]+params,tuples=shape=='tuples')
+
+@app.get('/api/customers/range')
+def customers_range(start:Optional[int]=None,end:Optional[int]=None,channel_id:Optional[str]=None,limit:Optional[int]=None,shape:Optional[str]=None,user:dict=Depends(auth_user)):
+    return time_range('customers',user,start,end,channel_id,limit,shape)
+
+@app.get('/api/customers/buckets')
+def customers_buckets(start:Optional[int]=None,end:Optional[int]=None,channel_id:Optional[str]=None,bucket:str='day',tz:Optional[int]=None,shape:Optional[str]=None,user:dict=Depends(auth_user)):
+    return time_buckets('customers',user,start,end,channel_id,bucket,tz,shape)
+
+@app.get('/api/duplicates/range')
+def duplicates_range(start:Optional[int]=None,end:Optional[int]=None,channel_id:Optional[str]=None,limit:Optional[int]=None,shape:Optional[str]=None,user:dict=Depends(auth_user)):
+    return time_range('duplicates',user,start,end,channel_id,limit,shape)
+
+@app.get('/api/duplicates/buckets')
+def duplicates_buckets(start:Optional[int]=None,end:Optional[int]=None,channel_id:Optional[str]=None,bucket:str='day',tz:Optional[int]=None,shape:Optional[str]=None,user:dict=Depends(auth_user)):
+    return time_buckets('duplicates',user,start,end,channel_id,bucket,tz,shape)
+
+@app.get('/api/export/customers')
+def export_customers(channel_id:Optional[str]=None,start:Optional[int]=None,end:Optional[int]=None,gzip:int=0,user:dict=Depends(auth_user)):
+    wh=[]
+    params=[]
+    if user['role']=='admin':
+        wh.append('c.owner_admin_id=?')
+        params.append(user['id'])
+    if user['role']=='operator':
+        wh.append('c.owner_operator_id=?')
+        params.append(user['id'])
+    if channel_id:
+        wh.append('c.channel_id=?')
+        params.append(channel_id)
+    if start is not None:
+        wh.append('c.created_at>=?')
+        params.append(start)
+    if end is not None:
+        wh.append('c.created_at<?')
+        params.append(end)
+    sql='SELECT c.phone_encrypted,ch.name,u.display_name,a.display_name,c.created_at,(SELECT COUNT(*) FROM duplicates d WHERE d.customer_id=c.id) FROM customers c LEFT JOIN users u ON c.owner_operator_id=u.id LEFT JOIN users a ON c.owner_admin_id=a.id LEFT JOIN channels ch ON c.channel_id=ch.id'
+    if wh:
+        sql+=' WHERE '+(' AND '.join(wh))
+    decrypt=user['role'] in ['super_admin','admin']
+    def convert(rows):
+        phones=phone_decrypt_many([r[0] for r in rows]) if decrypt else ['']*len(rows)
+        return [(p,r[1] or '',r[2] or '',r[3] or '',ms_iso(r[4]),r[5]) for p,r in zip(phones,rows)]
+    c=connect(check_same_thread=False)
+    cur=c.execute(sql,params)
+    return export_response(csv_stream(c,cur,['手机号','渠道','运营','管理员','录入时间','被重复次数'],convert,bool(gzip)),'customers',bool(gzip),c)
+
+@app.get('/api/export/duplicates')
+def export_duplicates(channel_id:Optional[str]=None,start:Optional[int]=None,end:Optional[int]=None,gzip:int=0,user:dict=Depends(auth_user)):
+    wh=[]
+    params=[]
+    if user['role']=='admin':
+        wh.append('dop.parent_id=?')
+        params.append(user['id'])
+    if user['role']=='operator':
+        wh.append('d.duplicate_operator_id=?')
+        params.append(user['id'])
+    if channel_id:
+        wh.append('d.duplicate_channel_id=?')
+        params.append(channel_id)
+    if start is not None:
+        wh.append('d.duplicate_at>=?')
+        params.append(start)
+    if end is not None:
+        wh.append('d.duplicate_at<?')
+        params.append(end)
+    sql='SELECT c.phone_encrypted,och.name,fop.display_name,c.created_at,dch.name,dop.display_name,d.duplicate_at FROM duplicates d LEFT JOIN customers c ON c.id=d.customer_id LEFT JOIN channels och ON och.id=c.channel_id LEFT JOIN users fop ON fop.id=d.first_owner_id LEFT JOIN channels dch ON dch.id=d.duplicate_channel_id LEFT JOIN users dop ON dop.id=d.duplicate_operator_id'
+    if wh:
+        sql+=' WHERE '+(' AND '.join(wh))
+    decrypt=user['role'] in ['super_admin','admin']
+    def convert(rows):
+        phones=phone_decrypt_many([r[0] for r in rows]) if decrypt else ['']*len(rows)
+        return [(p,r[1] or '',r[2] or '',ms_iso(r[3]),r[4] or '',r[5] or '',ms_iso(r[6])) for p,r in zip(phones,rows)]
+    c=connect(check_same_thread=False)
+    cur=c.execute(sql,params)
+    return export_response(csv_stream(c,cur,['手机号','原渠道','原运营','原录入时间','重复渠道','重复运营','重复时间'],convert,bool(gzip)),'duplicates',bool(gzip),c)
+
+# importing the module does no I/O: migrations belong to `python app.py migrate`,
+# and until they have run every request gets a 503 instead of a half-built schema
+schema={'current':False}
 
-init_db()
+@app.middleware('http')
+async def schema_gate(req:Request,call_next):
+    if not schema['current']:
+        if schema_version()<SCHEMA_VERSION:
+            print(f'schema version {schema_version()}/{SCHEMA_VERSION}: run `python app.py migrate`')
+            return JSONResponse({'detail':'schema'},status_code=503)
+        schema['current']=True
+    return await call_next(req)
 
 if __name__=='__main__':
+    if sys.argv[1:2]==['migrate']:
+        for name,secs in migrate(rerun='--all' in sys.argv[2:]):
+            print(f'{name}: {secs}s')
+        print(f'schema version {schema_version()}/{SCHEMA_VERSION}')
+        sys.exit(0)
+    ensure_schema()
     import uvicorn
     uvicorn.run(app,host='0.0.0.0',port=PORT)
@@ -0,0 +1,7 @@
+import hashlib
+
+# the password hash on its own, so that pool workers started with spawn
+# import this module and not app.py with its settings and database setup
+
+def hash_password(password,salt):
+    return hashlib.pbkdf2_hmac('sha256',password.encode(),salt.encode(),100000).hex()
@@ -0,0 +1,20 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='module')
+def pyapp(tmp_path_factory):
+    # db_path is read at import; importing leaves the database alone
+    os.environ['APP_DB'] = str(tmp_path_factory.mktemp('pyserver') / 'app.db')
+    try:
+        mod = importlib.import_module('app')
+    finally:
+        del os.environ['APP_DB']
+    mod.migrate()
+    yield mod
+    sys.modules.pop('app', None)
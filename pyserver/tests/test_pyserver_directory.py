@@ -0,0 +1,22 @@
+def rename(pyapp, uid, name):
+    c = pyapp.conn()
+    c.execute('UPDATE users SET display_name=? WHERE id=?', (name, uid))
+    c.commit()
+    c.close()
+
+
+def test_invalidate_in_another_worker_reloads(pyapp):
+    # two Directory instances stand in for two worker processes; they share
+    # only the database and its generation file
+    mine, other = pyapp.Directory(ttl=3600), pyapp.Directory(ttl=3600)
+    c = pyapp.conn()
+    uid = c.execute('SELECT id FROM users LIMIT 1').fetchone()['id']
+    c.close()
+    before = mine.user(uid)['display_name']
+    rename(pyapp, uid, before + '-renamed')
+    assert mine.user(uid)['display_name'] == before
+    other.invalidate()
+    assert mine.user(uid)['display_name'] == before + '-renamed'
+    assert mine.loads == 2
+    assert mine.user(uid)['display_name'] == before + '-renamed'
+    assert mine.loads == 2
@@ -0,0 +1,30 @@
+import asyncio
+import importlib
+import os
+import sys
+
+from starlette.requests import Request
+
+
+def call_gate(mod):
+    req = Request({'type': 'http', 'method': 'GET', 'path': '/api/channels', 'headers': [], 'query_string': b''})
+
+    async def call_next(req):
+        return 'handled'
+    return asyncio.run(mod.schema_gate(req, call_next))
+
+
+def test_import_does_not_migrate_and_requests_wait_for_it(tmp_path, monkeypatch):
+    path = tmp_path / 'app.db'
+    monkeypatch.setenv('APP_DB', str(path))
+    monkeypatch.delitem(sys.modules, 'app', raising=False)
+    mod = importlib.import_module('app')
+    try:
+        assert mod.schema_version() == 0
+        r = call_gate(mod)
+        assert r.status_code == 503 and r.body == b'{"detail":"schema"}'
+        assert [name for name, secs in mod.migrate()] == [name for name, fn in mod.MIGRATIONS]
+        assert call_gate(mod) == 'handled' and mod.schema['current']
+        assert mod.migrate() == []
+    finally:
+        sys.modules.pop('app', None)
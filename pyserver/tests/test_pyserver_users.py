@@ -0,0 +1,64 @@
+import pytest
+from fastapi import HTTPException
+
+
+def row(pyapp, username):
+    c = pyapp.conn()
+    try:
+        return dict(c.execute('SELECT * FROM users WHERE username=?', (username,)).fetchone())
+    finally:
+        c.close()
+
+
+@pytest.fixture(scope='module')
+def super_user(pyapp):
+    return row(pyapp, 'super')
+
+
+def bulk(pyapp, user, body):
+    return pyapp.create_users_bulk(body, user)
+
+
+def test_bulk_statuses(pyapp, super_user):
+    admin_id = row(pyapp, 'adminA')['id']
+    body = bulk(pyapp, super_user, {'owner_admin_id': admin_id, 'users': [
+        {'username': 'bulk1', 'display_name': 'B1', 'password': 'pw1'},
+        {'username': 'bulk2', 'display_name': 'B2', 'password': 'pw2'},
+        {'username': 'bulk1', 'display_name': 'again', 'password': 'pw'},
+        {'username': 'opA', 'display_name': 'taken', 'password': 'pw'},
+        {'username': 'bulk3', 'display_name': 'B3', 'password': 'pw', 'owner_admin_id': 'nobody'},
+        {'username': 'bulk4', 'display_name': 'B4', 'password': 'pw', 'owner_admin_id': ['x']},
+        {'username': 'bulk5', 'display_name': '', 'password': 'pw'},
+    ]})
+    assert [(x['status'], x.get('error')) for x in body['results']] == [
+        ('created', None), ('created', None), ('error', 'duplicate'), ('error', 'exists'),
+        ('error', 'owner'), ('error', 'invalid'), ('error', 'invalid')]
+    assert (body['created'], body['failed']) == (2, 5)
+    # the pooled hashes are the ones login checks
+    created = row(pyapp, 'bulk2')
+    assert created['parent_id'] == admin_id
+    assert created['password_hash'] == pyapp.hash_password('pw2', created['salt'])
+
+
+def test_admin_creates_operators_for_itself(pyapp):
+    admin = row(pyapp, 'adminA')
+    body = bulk(pyapp, admin, {'owner_admin_id': 'someone-else', 'users': [
+        {'username': 'bulk6', 'display_name': 'B6', 'password': 'pw'},
+        {'username': 'bulk7', 'display_name': 'B7', 'password': 'pw', 'role': 'admin'},
+    ]})
+    assert [(x['status'], x.get('error')) for x in body['results']] == [('created', None), ('error', 'forbidden')]
+    assert row(pyapp, 'bulk6')['parent_id'] == admin['id']
+
+
+@pytest.mark.parametrize('owner', [['x'], {'id': 'x'}, 1])
+def test_bulk_rejects_a_non_string_owner(pyapp, super_user, owner):
+    with pytest.raises(HTTPException) as e:
+        bulk(pyapp, super_user, {'owner_admin_id': owner, 'users': [{'username': 'bulk9', 'display_name': 'B9', 'password': 'pw'}]})
+    assert e.value.status_code == 400
+
+
+def test_pool_workers_import_only_the_hashing_module(pyapp):
+    # under spawn each pool worker imports the module of the callable it runs
+    assert pyapp.hash_password.__module__ == 'hashing'
+    hashes = pyapp.hash_passwords(['a', 'b', 'c'], ['s1', 's2', 's3'])
+    assert hashes == [pyapp.hash_password(p, s) for p, s in zip('abc', ['s1', 's2', 's3'])]